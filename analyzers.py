@@ -0,0 +1,457 @@
+"""Enhancement and mobile usability checks, run on the same parse of a page as the indexing signals
+
+HeadExtractor hands every enabled analyzer the tags and text it asked
+for while it parses a page, so a check costs no extra download or parse.
+Each analyzer reports a small JSON-serializable dict (None if it has
+nothing to say) under its name in PageSignals.reports, with the problems
+it found listed under "issues". Checks that would need a layout engine
+(text size, tap targets, content width) are estimated from inline
+styles, the page's own <style> blocks and size attributes, so they flag
+likely problems rather than measure them.
+"""
+import json
+import re
+from urllib.parse import urljoin
+
+# Analyzers that need the body stop reading a document here
+MAX_DOCUMENT_BYTES = 1024 * 1024
+
+# Reports analyzers belong to, as in Search Console
+REPORTS = ("enhancements", "mobile")
+
+# Registered analyzer classes by name, in registration order
+ANALYZERS = {}
+
+
+def register(cls):
+    """Class decorator adding an Analyzer subclass to ANALYZERS"""
+    ANALYZERS[cls.name] = cls
+    return cls
+
+
+def resolve_analyzers(names):
+    """Expand analyzer and report names ("enhancements", "mobile", "all") into a tuple of analyzer names"""
+    resolved = []
+    for name in names:
+        if name == "all":
+            matches = list(ANALYZERS)
+        elif name in REPORTS:
+            matches = [analyzer for analyzer, cls in ANALYZERS.items() if cls.report == name]
+        elif name in ANALYZERS:
+            matches = [name]
+        else:
+            raise ValueError(f"Unknown analyzer: {name} (choose from {', '.join(REPORTS + tuple(ANALYZERS))}, all)")
+        resolved += [match for match in matches if match not in resolved]
+    return tuple(resolved)
+
+
+def needs_body(names):
+    return any(ANALYZERS[name].needs_body for name in names)
+
+
+class Analyzer:
+    """Base class of the checks; a new instance looks at each page
+
+    Subclasses set ``name``, ``report``, the ``tags`` whose start and end
+    events they want (None for every tag) and ``needs_body`` (False if
+    the head is enough). handle_data() only gets text while
+    ``capturing`` is true. ``cost`` adds up the seconds spent in the
+    analyzer, for AnalyzerCosts.
+    """
+
+    name = None
+    report = None
+    tags = None
+    needs_body = True
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.capturing = False
+        self.cost = 0.0
+
+    def start_tag(self, tag, attrs):
+        pass
+
+    def end_tag(self, tag):
+        pass
+
+    def handle_data(self, data):
+        pass
+
+    def result(self):
+        return None
+
+
+# CSS lengths in the units analyzers convert to pixels (em, rem and % of a 16px base)
+CSS_LENGTH_RE = r"(\d+(?:\.\d+)?)\s*(px|pt|em|rem|%)?"
+FONT_SIZE_RE = re.compile(r"font-size\s*:\s*" + CSS_LENGTH_RE, re.I)
+WIDTH_RE = re.compile(r"(?<![-\w])(?:min-)?width\s*:\s*(\d+(?:\.\d+)?)\s*px", re.I)
+SIZE_RE = re.compile(r"(?<![-\w])(?:width|height)\s*:\s*(\d+(?:\.\d+)?)\s*px", re.I)
+PX_PER_UNIT = {None: 1.0, "px": 1.0, "pt": 4 / 3, "em": 16.0, "rem": 16.0, "%": 0.16}
+
+# Google's recommended minimums and a typical phone's viewport width, in CSS pixels
+MIN_FONT_PX = 12
+MIN_TAP_TARGET_PX = 48
+MOBILE_WIDTH_PX = 480
+# Links in a row with nothing between them before they count as crowded
+CROWDED_LINKS = 3
+
+
+def css_pixels(value, unit):
+    return float(value) * PX_PER_UNIT[unit.lower() if unit else None]
+
+
+# Rich result types: (report name, required properties, properties of which one is required)
+RICH_RESULTS = {
+    "BreadcrumbList": ("Breadcrumbs", ("itemListElement",), ()),
+    "FAQPage": ("FAQ", ("mainEntity",), ()),
+    "Product": ("Product snippets", ("name",), ("offers", "review", "aggregateRating")),
+    "Article": ("Article", ("headline",), ()),
+    "NewsArticle": ("Article", ("headline",), ()),
+    "BlogPosting": ("Article", ("headline",), ()),
+    "Recipe": ("Recipes", ("name", "image"), ()),
+    "Event": ("Events", ("name", "startDate", "location"), ()),
+    "JobPosting": ("Job postings", ("title", "description", "datePosted", "hiringOrganization"), ()),
+    "VideoObject": ("Videos", ("name", "thumbnailUrl", "uploadDate"), ()),
+    "LocalBusiness": ("Local business", ("name", "address"), ()),
+    "Review": ("Review snippets", ("itemReviewed", "reviewRating", "author"), ()),
+}
+# How deep JSON-LD is searched for typed items
+MAX_JSON_DEPTH = 8
+
+
+def schema_type(value):
+    """The bare type name: Product for "Product", "schema:Product" and "https://schema.org/Product" alike"""
+    return re.split(r"[/:#]", value.strip())[-1]
+
+
+@register
+class StructuredDataAnalyzer(Analyzer):
+    """Schema.org markup: JSON-LD items checked for the properties their rich results need,
+    microdata and RDFa types listed"""
+
+    name = "structured_data"
+    report = "enhancements"
+
+    def __init__(self, base_url):
+        super().__init__(base_url)
+        self.parts = []
+        self.types = set()
+        self.rich = {}
+        self.invalid_json = 0
+
+    def start_tag(self, tag, attrs):
+        if tag == "script":
+            if attrs.get("type", "").lower().split(";")[0].strip() == "application/ld+json":
+                self.capturing = True
+                self.parts = []
+        itemtype = attrs.get("itemtype") or attrs.get("typeof")
+        if itemtype and ("itemscope" in attrs or "typeof" in attrs):
+            for value in itemtype.split():
+                self.types.add(schema_type(value))
+
+    def end_tag(self, tag):
+        if tag == "script" and self.capturing:
+            self.capturing = False
+            try:
+                data = json.loads("".join(self.parts))
+            except ValueError:
+                self.invalid_json += 1
+                return
+            self.walk(data, 0)
+
+    def handle_data(self, data):
+        self.parts.append(data)
+
+    def walk(self, node, depth):
+        if depth > MAX_JSON_DEPTH:
+            return
+        if isinstance(node, list):
+            for item in node:
+                self.walk(item, depth + 1)
+            return
+        if not isinstance(node, dict):
+            return
+        types = node.get("@type")
+        for value in types if isinstance(types, list) else [types]:
+            if isinstance(value, str):
+                self.check(schema_type(value), node)
+        for key, value in node.items():
+            if isinstance(value, (dict, list)):
+                self.walk(value, depth + 1)
+
+    def check(self, kind, node):
+        self.types.add(kind)
+        if kind not in RICH_RESULTS:
+            return
+        label, required, one_of = RICH_RESULTS[kind]
+        missing = [prop for prop in required if node.get(prop) in (None, "", [])]
+        if one_of and not any(node.get(prop) for prop in one_of):
+            missing.append("|".join(one_of))
+        if kind == "BreadcrumbList" and not missing:
+            items = node["itemListElement"]
+            for item in items if isinstance(items, list) else [items]:
+                if not isinstance(item, dict) or "position" not in item:
+                    missing.append("itemListElement.position")
+                    break
+        counts = self.rich.setdefault(label, {"valid": 0, "invalid": 0, "missing": []})
+        if missing:
+            counts["invalid"] += 1
+            counts["missing"] += [prop for prop in missing if prop not in counts["missing"]]
+        else:
+            counts["valid"] += 1
+
+    def result(self):
+        if not self.types and not self.invalid_json:
+            return None
+        issues = [f"{label}: missing {', '.join(counts['missing'])}"
+                  for label, counts in sorted(self.rich.items()) if counts["invalid"]]
+        if self.invalid_json:
+            issues.append(f"{self.invalid_json} JSON-LD block(s) that are not valid JSON")
+        return {"types": sorted(self.types), "rich_results": self.rich, "issues": issues}
+
+
+@register
+class AmpAnalyzer(Analyzer):
+    """AMP pages (<html amp>) and the AMP versions regular pages link to"""
+
+    name = "amp"
+    report = "enhancements"
+    tags = {"html", "link", "script", "style"}
+    needs_body = False
+
+    def __init__(self, base_url):
+        super().__init__(base_url)
+        self.is_amp = False
+        self.amphtml = None
+        self.runtime = False
+        self.boilerplate = False
+
+    def start_tag(self, tag, attrs):
+        if tag == "html":
+            self.is_amp = "amp" in attrs or "⚡" in attrs
+        elif tag == "link" and "amphtml" in attrs.get("rel", "").lower().split():
+            href = attrs.get("href", "").strip()
+            self.amphtml = urljoin(self.base_url, href) if href else None
+        elif tag == "script" and attrs.get("src", "").startswith("https://cdn.ampproject.org/v0"):
+            self.runtime = True
+        elif tag == "style" and "amp-boilerplate" in attrs:
+            self.boilerplate = True
+
+    def result(self):
+        if not self.is_amp and not self.amphtml:
+            return None
+        issues = []
+        if self.is_amp and not self.runtime:
+            issues.append("AMP page without the AMP runtime script")
+        if self.is_amp and not self.boilerplate:
+            issues.append("AMP page without the amp-boilerplate style")
+        return {"is_amp": self.is_amp, "amphtml": self.amphtml, "issues": issues}
+
+
+@register
+class ViewportAnalyzer(Analyzer):
+    """The viewport meta tag that makes a page fit phone screens"""
+
+    name = "viewport"
+    report = "mobile"
+    tags = {"meta"}
+    needs_body = False
+
+    def __init__(self, base_url):
+        super().__init__(base_url)
+        self.content = None
+
+    def start_tag(self, tag, attrs):
+        if self.content is None and attrs.get("name", "").lower() == "viewport":
+            self.content = attrs.get("content", "")
+
+    def result(self):
+        if self.content is None:
+            return {"content": None, "issues": ["Viewport not set"]}
+        settings = {}
+        for part in re.split(r"[,;]", self.content):
+            key, _, value = part.partition("=")
+            settings[key.strip().lower()] = value.strip().lower()
+        issues = []
+        width = settings.get("width")
+        if width != "device-width":
+            issues.append("Viewport not set to device-width")
+            if width and width.replace(".", "", 1).isdigit() and float(width) > MOBILE_WIDTH_PX:
+                issues.append("Content wider than screen")
+        if settings.get("user-scalable") in ("no", "0"):
+            issues.append("Zooming disabled")
+        return {"content": self.content, "issues": issues}
+
+
+@register
+class FontSizeAnalyzer(Analyzer):
+    """Font sizes below 12px in inline styles, <style> blocks and <font size>"""
+
+    name = "font_size"
+    report = "mobile"
+
+    def __init__(self, base_url):
+        super().__init__(base_url)
+        self.small = 0
+        self.smallest = None
+
+    def note(self, pixels):
+        if pixels < MIN_FONT_PX:
+            self.small += 1
+            if self.smallest is None or pixels < self.smallest:
+                self.smallest = pixels
+
+    def sizes(self, css):
+        for value, unit in FONT_SIZE_RE.findall(css):
+            self.note(css_pixels(value, unit))
+
+    def start_tag(self, tag, attrs):
+        style = attrs.get("style")
+        if style:
+            self.sizes(style)
+        if tag == "style":
+            self.capturing = True
+        elif tag == "font" and attrs.get("size", "").strip() == "1":
+            self.note(10)
+
+    def end_tag(self, tag):
+        if tag == "style":
+            self.capturing = False
+
+    def handle_data(self, data):
+        self.sizes(data)
+
+    def result(self):
+        issues = ["Text too small to read"] if self.small else []
+        return {"small": self.small, "smallest_px": self.smallest, "issues": issues}
+
+
+# Tags that can be tapped, and tags that keep links apart when between them
+TAP_TARGETS = {"a", "button", "input", "select", "textarea"}
+INLINE_TAGS = {"span", "b", "i", "em", "strong", "small", "img", "svg", "abbr", "sup", "sub"}
+
+
+@register
+class TapTargetAnalyzer(Analyzer):
+    """Tap targets given an inline size under 48px, and runs of links with nothing between them"""
+
+    name = "tap_targets"
+    report = "mobile"
+
+    def __init__(self, base_url):
+        super().__init__(base_url)
+        self.targets = 0
+        self.small = 0
+        self.crowded = 0
+        # Whether a link just ended with nothing but inline tags and whitespace since
+        self.after_link = False
+
+    def start_tag(self, tag, attrs):
+        if tag in TAP_TARGETS:
+            if tag == "input" and attrs.get("type", "").lower() == "hidden":
+                return
+            if tag == "a" and "href" not in attrs:
+                return
+            self.targets += 1
+            style = attrs.get("style")
+            if style and any(float(size) < MIN_TAP_TARGET_PX for size in SIZE_RE.findall(style)):
+                self.small += 1
+            if tag == "a" and self.after_link:
+                self.crowded += 1
+            self.after_link = False
+        elif tag not in INLINE_TAGS:
+            self.after_link = False
+            self.capturing = False
+
+    def end_tag(self, tag):
+        if tag == "a":
+            self.after_link = True
+            self.capturing = True
+
+    def handle_data(self, data):
+        # A separator character or two (" | ", "·") does not keep links apart
+        if len(data.strip()) > 2:
+            self.after_link = False
+            self.capturing = False
+
+    def result(self):
+        issues = []
+        if self.small or self.crowded >= CROWDED_LINKS:
+            issues.append("Clickable elements too close together")
+        return {"targets": self.targets, "small": self.small, "crowded": self.crowded, "issues": issues}
+
+
+@register
+class ContentWidthAnalyzer(Analyzer):
+    """Elements given a fixed width wider than a phone screen"""
+
+    name = "content_width"
+    report = "mobile"
+
+    def __init__(self, base_url):
+        super().__init__(base_url)
+        self.wide = 0
+        self.widest = None
+
+    def start_tag(self, tag, attrs):
+        widths = []
+        style = attrs.get("style")
+        if style and "max-width" not in style.lower():
+            widths += [float(width) for width in WIDTH_RE.findall(style)]
+        # Tables do not shrink below their width attribute (images usually get max-width from CSS)
+        if tag == "table" and attrs.get("width", "").isdigit():
+            widths.append(float(attrs["width"]))
+        for width in widths:
+            if width > MOBILE_WIDTH_PX:
+                self.wide += 1
+                self.widest = max(self.widest or 0, width)
+
+    def result(self):
+        issues = ["Content wider than screen"] if self.wide else []
+        return {"wide": self.wide, "widest_px": self.widest, "issues": issues}
+
+
+def report_summary(reports, report):
+    """(detected features, issues) of one report, e.g. (["Breadcrumbs", "AMP"], ["FAQ: missing mainEntity"])
+
+    None if none of the report's analyzers ran.
+    """
+    detected = []
+    issues = []
+    ran = False
+    for name, result in (reports or {}).items():
+        cls = ANALYZERS.get(name)
+        if cls is None or cls.report != report:
+            continue
+        ran = True
+        if not result:
+            continue
+        if name == "structured_data":
+            detected += sorted(result["rich_results"])
+        elif name == "amp":
+            detected.append("AMP" if result["is_amp"] else "AMP version")
+        issues += result["issues"]
+    return (detected, issues) if ran else None
+
+
+class AnalyzerCosts:
+    """Pages analyzed and seconds spent per analyzer, over a whole run
+
+    "body_parse" is the parsing of the document past its head, which
+    only happens for analyzers that need the body.
+    """
+
+    def __init__(self):
+        self.costs = {}
+
+    def observe(self, costs):
+        for name, seconds in costs.items():
+            pages, total = self.costs.get(name, (0, 0.0))
+            self.costs[name] = (pages + 1, total + seconds)
+
+    def rows(self):
+        return [
+            {"analyzer": name, "pages": pages, "seconds": total, "mean": total / pages}
+            for name, (pages, total) in self.costs.items()
+        ]
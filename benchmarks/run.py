@@ -0,0 +1,269 @@
+"""Benchmark the inspection engine against local synthetic sites
+
+Each scenario starts benchmarks/stub_server.py with its own latency and
+page size, inspects a fixed, reproducible list of URLs and reports
+URLs/s, p50/p95/p99 inspection latency, peak RSS and bytes received.
+Every run is appended to a JSON Lines results file and compared with
+the previous run of the same scenario and settings:
+
+    python benchmarks/run.py                      # all scenarios
+    python benchmarks/run.py -s mixed -s latency  # some of them
+    python benchmarks/run.py --urls 20000 --concurrency 500 --label "bigger pool"
+
+Scenarios run in a fresh process each, so peak RSS is per scenario.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+from itertools import cycle
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from engine import InspectionEngine  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_RESULTS = os.path.join(HERE, "results.jsonl")
+
+# Page kinds and the verdict the engine should reach for each
+EXPECTED = {
+    "ok": "indexable",
+    "noindex": "not_indexed_noindex",
+    "canonical": "not_indexed_canonical",
+    "redirect1": "not_indexed_redirect",
+    "redirect3": "not_indexed_redirect",
+    "404": "not_indexed_404",
+    "500": "not_indexed_5xx",
+    "private": "not_indexed_robots",
+    "throttle": "indexable",
+}
+
+HEALTHY = {"ok": 100}
+MIXED = {"ok": 58, "noindex": 10, "canonical": 10, "redirect1": 6, "redirect3": 4, "404": 5, "500": 2,
+         "private": 5}
+
+# A long robots.txt of wildcard rules, as large sites have; /private/ stays the only blocked page kind
+LONG_ROBOTS = "User-agent: *\nDisallow: /private/\n" + "".join(
+    f"Disallow: /archive{n}/*.pdf$\nDisallow: /*?session{n}=\nAllow: /ok/*/print{n}\n" for n in range(100)
+)
+
+# name: (description, stub server options, page mix, URL count)
+SCENARIOS = {
+    "fast": ("no latency, 20 KB pages", {}, HEALTHY, 5000),
+    "latency": ("10 sites, 50 ms latency, 20 KB pages", {"latency": 50, "sites": 10}, HEALTHY, 5000),
+    "mixed": ("20 ms latency, redirects, noindex, canonicals, 404/5xx, robots.txt blocks",
+              {"latency": 20}, MIXED, 5000),
+    "large": ("10 ms latency, 1 MB pages", {"latency": 10, "page-size": 1000000}, HEALTHY, 1000),
+    "sites": ("20 sites, 20 ms latency, mixed pages", {"latency": 20, "sites": 20}, MIXED, 5000),
+    "throttled": ("2% of pages answer 429 once", {"latency": 10},
+                  dict(HEALTHY, ok=98, throttle=2), 2000),
+    "markup": ("20 ms latency, tag-dense 50 KB pages with structured data",
+               {"latency": 20, "page-size": 50000, "markup": "rich"}, HEALTHY, 2000),
+    "robots": ("20 ms latency, mixed pages, 300 wildcard robots.txt rules",
+               {"latency": 20, "robots": LONG_ROBOTS}, MIXED, 5000),
+}
+
+
+def build_urls(mix, count, addresses):
+    """A deterministic URL list spreading the page kinds evenly over the sites"""
+    kinds = [kind for kind, weight in mix.items() for _ in range(weight)]
+    sites = cycle(addresses)
+    return [f"http://{next(sites)}/{kinds[n % len(kinds)]}/{n}" for n in range(count)]
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class TimedEngine(InspectionEngine):
+    """An engine that records how long every inspection took"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.latencies = []
+
+    async def inspect_async(self, url):
+        start = time.perf_counter()
+        try:
+            return await super().inspect_async(url)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+
+def start_stub(options):
+    """Start the stub server and return (process, "address:port" of every site)"""
+    command = [sys.executable, os.path.join(HERE, "stub_server.py")]
+    for name, value in options.items():
+        command += [f"--{name}", str(value)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline().split()
+    if not line or line[0] != "ready":
+        process.kill()
+        raise RuntimeError("stub server did not start")
+    return process, line[1:]
+
+
+def run_scenario(name, args):
+    """Run one scenario in this process and return its metrics"""
+    _, server_options, mix, count = SCENARIOS[name]
+    count = args.urls or count
+    process, addresses = start_stub(server_options)
+    try:
+        urls = build_urls(mix, count, addresses)
+        expected = {url: EXPECTED[url.split("/")[3]] for url in urls}
+        engine = TimedEngine(
+            concurrency=args.concurrency,
+            per_host=args.per_host,
+            head_first=not args.no_head,
+            parse_workers=args.parse_workers,
+            timings=args.timings,
+            analyzers=args.analyze
+        )
+        wrong = 0
+        start = time.perf_counter()
+        try:
+            for record in engine.inspect_many(urls):
+                if record.verdict_name != expected[record.url]:
+                    wrong += 1
+            elapsed = time.perf_counter() - start
+            bytes_received = engine.fetcher.bytes_received
+        finally:
+            engine.close()
+    finally:
+        process.terminate()
+        process.wait()
+
+    latencies = sorted(engine.latencies)
+    return {
+        "urls": count,
+        "seconds": round(elapsed, 3),
+        "urls_per_s": round(count / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "peak_rss_mb": peak_rss_mb(),
+        "mb_received": round(bytes_received / 1e6, 2),
+        "wrong_verdicts": wrong,
+    }
+
+
+def settings(args):
+    """The options that make two runs of a scenario comparable"""
+    run_settings = {
+        "urls": args.urls,
+        "concurrency": args.concurrency,
+        "per_host": args.per_host,
+        "head_first": not args.no_head,
+        "parse_workers": args.parse_workers,
+        "timings": args.timings,
+    }
+    # Only set when used, so earlier runs without analyzers still compare
+    if args.analyze:
+        run_settings["analyze"] = args.analyze
+    return run_settings
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def previous_run(path, scenario, run_settings):
+    """The latest stored run of a scenario with the same settings, or None"""
+    previous = None
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as stream:
+            for line in stream:
+                entry = json.loads(line)
+                if entry["scenario"] == scenario and entry["settings"] == run_settings:
+                    previous = entry
+    return previous
+
+
+def change(new, old, lower_is_better=False):
+    if not old:
+        return ""
+    ratio = (new - old) / old * 100
+    better = ratio < 0 if lower_is_better else ratio > 0
+    return f" ({ratio:+.0f}%{'' if abs(ratio) < 5 else ' better' if better else ' WORSE'})"
+
+
+def report(name, metrics, previous):
+    old = previous["metrics"] if previous else {}
+    print(f"{name}: {SCENARIOS[name][0]}")
+    print(f"  {metrics['urls']} URLs in {metrics['seconds']} s, "
+          f"{metrics['urls_per_s']} URLs/s{change(metrics['urls_per_s'], old.get('urls_per_s'))}")
+    print(f"  latency p50 {metrics['p50_ms']} ms, p95 {metrics['p95_ms']} ms, "
+          f"p99 {metrics['p99_ms']} ms{change(metrics['p95_ms'], old.get('p95_ms'), True)}")
+    print(f"  peak RSS {metrics['peak_rss_mb']} MB{change(metrics['peak_rss_mb'], old.get('peak_rss_mb'), True)}, "
+          f"{metrics['mb_received']} MB received{change(metrics['mb_received'], old.get('mb_received'), True)}")
+    if metrics["wrong_verdicts"]:
+        print(f"  {metrics['wrong_verdicts']} URLs got an unexpected verdict")
+    if previous:
+        print(f"  compared with {previous['time']} ({previous.get('revision') or 'unknown revision'})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the inspection engine against local stub sites")
+    parser.add_argument("-s", "--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run (repeatable; default: all)")
+    parser.add_argument("--urls", type=int, help="override the number of URLs per scenario")
+    parser.add_argument("-c", "--concurrency", type=int, default=200)
+    parser.add_argument("--per-host", type=int, default=8)
+    parser.add_argument("--no-head", action="store_true")
+    parser.add_argument("-w", "--parse-workers", type=int, default=0)
+    parser.add_argument("--timings", action="store_true", help="run with per-phase timing enabled")
+    parser.add_argument("--analyze", action="append", default=[], metavar="NAME",
+                        help="run analyzers too: enhancements, mobile, all or an analyzer name (repeatable)")
+    parser.add_argument("--results", default=DEFAULT_RESULTS, help="JSON Lines file runs are appended to")
+    parser.add_argument("--label", help="note stored with the results")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_scenario(args.child, args)))
+        return 0
+
+    run_settings = settings(args)
+    passthrough = list(argv if argv is not None else sys.argv[1:])
+    for name in args.scenario or list(SCENARIOS):
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", name] + passthrough,
+                               capture_output=True, text=True)
+        if child.returncode != 0:
+            print(f"{name}: failed\n{child.stderr}", file=sys.stderr)
+            continue
+        metrics = json.loads(child.stdout.strip().splitlines()[-1])
+        previous = previous_run(args.results, name, run_settings)
+        report(name, metrics, previous)
+
+        entry = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "label": args.label,
+            "scenario": name,
+            "settings": run_settings,
+            "metrics": metrics,
+        }
+        with open(args.results, "a", encoding="utf-8") as stream:
+            stream.write(json.dumps(entry) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""Measure cold start of the command line tool and the GUI module against targets
+
+The CLI is launched thousands of times from shell pipelines, so its start
+up cost matters as much as its throughput. Each case is run ``--runs``
+times in a fresh interpreter; the median time beyond a bare ``python -c
+pass`` start is compared with the case's target:
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 50 --importtime   # also show the slowest imports
+
+Exits with status 1 when a case is over its target.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+CLI = os.path.join(ROOT, "cli.py")
+GUI = os.path.join(ROOT, "gsc index checker.py")
+
+# name: (description, target in ms over a bare interpreter start)
+CASES = {
+    "help": ("cli.py --help", 80),
+    "inspect": ("cli.py inspecting one URL from stdin", 250),
+    "gui": ("importing the GUI module (no window)", 250),
+}
+
+
+def run(command, stdin=None):
+    start = time.perf_counter()
+    subprocess.run(command, input=stdin, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=ROOT,
+                   text=True, check=True)
+    return time.perf_counter() - start
+
+
+def median_ms(command, runs, stdin=None):
+    # One untimed run so every case starts with warm OS caches and compiled bytecode
+    run(command, stdin)
+    return statistics.median(run(command, stdin) for _ in range(runs)) * 1000
+
+
+def start_stub():
+    """Start a latency-free stub site and return (process, "address:port")"""
+    process = subprocess.Popen([sys.executable, os.path.join(HERE, "stub_server.py")], stdout=subprocess.PIPE,
+                               text=True)
+    line = process.stdout.readline().split()
+    if not line or line[0] != "ready":
+        process.kill()
+        raise RuntimeError("stub server did not start")
+    return process, line[1]
+
+
+def slowest_imports(command, count=15):
+    """The modules with the highest cumulative import time for a command, as (microseconds, name)"""
+    child = subprocess.run([sys.executable, "-X", "importtime"] + command, capture_output=True, text=True, cwd=ROOT)
+    rows = []
+    for line in child.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                rows.append((int(cumulative), name.rstrip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold start of the CLI and the GUI module")
+    parser.add_argument("--runs", type=int, default=20, help="launches per case (default: 20)")
+    parser.add_argument("-s", "--case", action="append", choices=sorted(CASES),
+                        help="case to measure (repeatable; default: all)")
+    parser.add_argument("--importtime", action="store_true", help="also list the slowest imports of each case")
+    args = parser.parse_args(argv)
+
+    bare = median_ms([sys.executable, "-c", "pass"], args.runs)
+    print(f"bare interpreter start: {bare:.1f} ms")
+    process, address = start_stub()
+    commands = {
+        "help": ([CLI, "--help"], None),
+        "inspect": ([CLI, "-f", "csv"], f"http://{address}/ok/1\n"),
+        "gui": (["-c", f"import runpy; runpy.run_path({GUI!r}, run_name='startup')"], None),
+    }
+    over = 0
+    try:
+        for name in args.case or list(CASES):
+            description, target = CASES[name]
+            command, stdin = commands[name]
+            extra = median_ms([sys.executable] + command, args.runs, stdin) - bare
+            verdict = "ok" if extra <= target else "OVER TARGET"
+            over += extra > target
+            print(f"{name}: {description}: +{extra:.1f} ms (target +{target} ms) {verdict}")
+            if args.importtime:
+                for micros, module in slowest_imports(command):
+                    print(f"    {micros / 1000:7.1f} ms {module}")
+    finally:
+        process.terminate()
+        process.wait()
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
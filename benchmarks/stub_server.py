@@ -0,0 +1,212 @@
+"""Synthetic web sites for benchmarking the inspection engine
+
+Every URL says what it should be: the first path segment picks the kind
+of page (/ok/1, /noindex/2, /redirect3/4, /404/5, ...), so the server is
+stateless and the benchmark knows the expected verdict of every URL.
+Latency and page size are set per server and varied per URL by a
+deterministic hash, so runs are reproducible. Pages are one long
+paragraph, or with ``--markup rich`` tag-dense like real templates:
+navigation, inline styles, JSON-LD and microdata. robots.txt disallows
+/private/ unless other rules are given with ``--robots`` or
+``--robots-file``.
+
+Run it on its own to poke at it:
+
+    python benchmarks/stub_server.py --sites 2 --latency 20
+    python benchmarks/stub_server.py --robots "User-agent: *
+    Disallow: /404/"
+"""
+import argparse
+import asyncio
+import ipaddress
+import json
+import zlib
+
+ROBOTS_TXT = "User-agent: *\nDisallow: /private/\n"
+
+MARKUP = ("plain", "rich")
+
+RICH_HEAD = (
+    '<meta name="viewport" content="width=device-width, initial-scale=1">'
+    '<script type="application/ld+json">{"@context": "https://schema.org", "@type": "BreadcrumbList", '
+    '"itemListElement": [{"@type": "ListItem", "position": 1, "name": "Home", "item": "https://example.com/"}, '
+    '{"@type": "ListItem", "position": 2, "name": "Shoes", "item": "https://example.com/shoes"}]}</script>'
+    '<script type="application/ld+json">{"@context": "https://schema.org", "@type": "Product", "name": "Shoe", '
+    '"image": "https://example.com/shoe.jpg", "offers": {"@type": "Offer", "price": "49.90", '
+    '"priceCurrency": "EUR"}}</script>'
+)
+RICH_NAV = "".join(
+    f'<li class="nav-item"><a href="/ok/{n}" style="padding: 12px 16px; font-size: 15px">Category {n}</a></li>'
+    for n in range(30)
+)
+RICH_BLOCK = (
+    '<div class="card" itemscope itemtype="https://schema.org/Offer">'
+    '<h3 class="card-title" style="font-size: 18px">Product <span itemprop="name">name</span></h3>'
+    '<p class="card-text">Some <b>bold</b> and <i>italic</i> text with a <a href="/ok/1">link</a> in it, '
+    'as product listings and articles have.</p><span itemprop="price" content="9.99">9.99</span>'
+    '<button type="button" style="width: 120px; height: 48px">Add to cart</button></div>'
+)
+
+STATUS_TEXT = {200: "OK", 301: "Moved Permanently", 404: "Not Found", 429: "Too Many Requests",
+               500: "Internal Server Error"}
+
+
+def _spread(path, amount):
+    """A deterministic factor in [1 - amount, 1 + amount] for a path"""
+    return 1 + amount * ((zlib.crc32(path.encode()) % 2001) / 1000 - 1)
+
+
+class StubSite:
+    """Serve synthetic pages as one or more local sites
+
+    ``latency`` (seconds, varied by ``jitter`` as a fraction) delays every
+    response; pages are ``page_size`` bytes, varied by ``size_spread``,
+    of ``markup`` (see MARKUP). robots.txt serves ``robots_txt``.
+    Counters of requests and bytes sent are served as JSON at /__stats.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.5, page_size=20000, size_spread=0.5, retry_after=1, markup="plain",
+                 robots_txt=ROBOTS_TXT):
+        self.latency = latency
+        self.jitter = jitter
+        self.page_size = page_size
+        self.size_spread = size_spread
+        self.retry_after = retry_after
+        self.markup = markup
+        self.robots_txt = robots_txt.encode()
+        self.servers = []
+        self.addresses = []
+        self.throttled = set()
+        self.stats = {"requests": 0, "bytes_sent": 0, "connections": 0, "methods": {}}
+
+    async def start(self, sites=1, host="127.0.0.1"):
+        """Start the sites and return their "address:port" list
+
+        Site n listens on ``host`` + n (127.0.0.1, 127.0.0.2, ...), so every
+        site is its own host to the engine, with its own politeness and
+        per-host connection budget. Linux routes all of 127.0.0.0/8 to the
+        loopback interface; elsewhere the extra addresses may need adding.
+        """
+        first = ipaddress.ip_address(host)
+        for n in range(sites):
+            server = await asyncio.start_server(self.handle, str(first + n), 0, backlog=4096)
+            self.servers.append(server)
+            address, port = server.sockets[0].getsockname()[:2]
+            self.addresses.append(f"{address}:{port}")
+        return self.addresses
+
+    def close(self):
+        for server in self.servers:
+            server.close()
+
+    async def handle(self, reader, writer):
+        self.stats["connections"] += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target = request_line.decode("latin-1").split()[:2]
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                status, headers, body = await self.respond(target)
+                head = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, 'Unknown')}"]
+                head += [f"{name}: {value}" for name, value in headers.items()]
+                head.append(f"Content-Length: {len(body)}")
+                data = ("\r\n".join(head) + "\r\n\r\n").encode()
+                if method != "HEAD":
+                    data += body
+                writer.write(data)
+                await writer.drain()
+                self.stats["requests"] += 1
+                self.stats["bytes_sent"] += len(data)
+                self.stats["methods"][method] = self.stats["methods"].get(method, 0) + 1
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, target):
+        """Return (status, headers, body) for a request target"""
+        path = target.split("?", 1)[0]
+        if path == "/__stats":
+            return 200, {"Content-Type": "application/json"}, json.dumps(self.stats).encode()
+        if path == "/robots.txt":
+            return 200, {"Content-Type": "text/plain"}, self.robots_txt
+
+        if self.latency:
+            await asyncio.sleep(self.latency * _spread(path, self.jitter))
+
+        parts = path.strip("/").split("/")
+        kind = parts[0]
+        if kind.startswith("redirect") and kind[8:].isdigit():
+            # /redirectN/... -> /redirect(N-1)/... -> ... -> /ok/...
+            hops = int(kind[8:])
+            rest = "/".join(parts[1:])
+            location = f"/redirect{hops - 1}/{rest}" if hops > 1 else f"/ok/{rest}"
+            return 301, {"Location": location}, b""
+        if kind == "404":
+            return 404, {"Content-Type": "text/html"}, b"<html><body>Not found</body></html>"
+        if kind == "500":
+            return 500, {"Content-Type": "text/html"}, b"<html><body>Server error</body></html>"
+        if kind == "throttle" and path not in self.throttled:
+            self.throttled.add(path)
+            return 429, {"Retry-After": str(self.retry_after)}, b""
+        return 200, {"Content-Type": "text/html; charset=utf-8"}, self.page(path, kind)
+
+    def page(self, path, kind):
+        head = [f"<title>Synthetic page {path}</title>", '<meta charset="utf-8">']
+        if kind == "noindex":
+            head.append('<meta name="robots" content="noindex, follow">')
+        if kind == "canonical":
+            head.append(f'<link rel="canonical" href="/ok{path[len("/canonical"):]}">')
+        else:
+            head.append(f'<link rel="canonical" href="{path}">')
+        size = int(self.page_size * _spread(path, self.size_spread))
+        if self.markup == "rich":
+            start = f"<!DOCTYPE html><html><head>{''.join(head)}{RICH_HEAD}</head><body><ul>{RICH_NAV}</ul>".encode()
+            end = b"</body></html>"
+            block = RICH_BLOCK.encode()
+            return start + block * max(0, (size - len(start) - len(end)) // len(block)) + end
+        start = f"<!DOCTYPE html><html><head>{''.join(head)}</head><body><p>".encode()
+        end = b"</p></body></html>"
+        return start + b"x" * max(0, size - len(start) - len(end)) + end
+
+
+async def _serve(args, robots_txt):
+    site = StubSite(latency=args.latency / 1000, jitter=args.jitter, page_size=args.page_size,
+                    size_spread=args.size_spread, retry_after=args.retry_after, markup=args.markup,
+                    robots_txt=robots_txt)
+    addresses = await site.start(args.sites, args.host)
+    # The benchmark reads this line to learn where the sites are
+    print("ready " + " ".join(addresses), flush=True)
+    await asyncio.gather(*(server.serve_forever() for server in site.servers))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve synthetic sites for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1", help="address of the first site (default: 127.0.0.1)")
+    parser.add_argument("--sites", type=int, default=1,
+                        help="number of sites, each on the next address (127.0.0.1, 127.0.0.2, ...)")
+    parser.add_argument("--latency", type=float, default=0.0, help="mean response delay in ms")
+    parser.add_argument("--jitter", type=float, default=0.5, help="latency spread as a fraction of the mean")
+    parser.add_argument("--page-size", type=int, default=20000, help="mean page size in bytes")
+    parser.add_argument("--size-spread", type=float, default=0.5, help="page size spread as a fraction")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After sent with 429 answers")
+    parser.add_argument("--markup", choices=MARKUP, default="plain", help="page markup (default: plain)")
+    robots = parser.add_mutually_exclusive_group()
+    robots.add_argument("--robots", metavar="TEXT", help="robots.txt rules (default: disallow /private/)")
+    robots.add_argument("--robots-file", metavar="PATH", help="serve this file as robots.txt")
+    args = parser.parse_args(argv)
+    robots_txt = ROBOTS_TXT if args.robots is None else args.robots
+    if args.robots_file:
+        with open(args.robots_file, encoding="utf-8") as stream:
+            robots_txt = stream.read()
+    try:
+        asyncio.run(_serve(args, robots_txt))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""Command line entry point: inspect URL lists and export the results"""
+import argparse
+import sys
+
+from analyzers import REPORTS, resolve_analyzers
+from exporters import FORMATS, open_exporter
+from user_agents import USER_AGENTS, resolve_user_agent
+
+
+def read_urls(paths):
+    """Yield URLs from the given files ("-" for stdin), skipping blanks and comments"""
+    for path in paths:
+        stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+        try:
+            for line in stream:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    yield line
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+
+def print_host_stats(stats, limit=50):
+    """Print the hosts that were waited on longest as a table on stderr"""
+    print(f"{'host':<40} {'requests':>8} {'throttled':>9} {'wait avg':>9} {'wait max':>9} {'rate':>7} {'delay':>6}",
+          file=sys.stderr)
+    for row in stats[:limit]:
+        rate = "-" if row["rate"] is None else f"{row['rate']:g}"
+        delay = "-" if row["crawl_delay"] is None else f"{row['crawl_delay']:g}"
+        print(f"{row['host'][:40]:<40} {row['requests']:>8} {row['throttled']:>9} {row['wait_avg']:>8.3f}s "
+              f"{row['wait_max']:>8.3f}s {rate:>7} {delay:>6}", file=sys.stderr)
+
+
+def print_timing_summary(stats):
+    """Print per-phase latency percentiles as a table on stderr"""
+    print(f"{'phase':<8} {'count':>8} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9}", file=sys.stderr)
+    for row in stats.summary():
+        print(f"{row['phase']:<8} {row['count']:>8} " + " ".join(
+            f"{row[column] * 1000:>7.1f}ms" for column in ("mean", "p50", "p95", "p99")
+        ), file=sys.stderr)
+
+
+def print_render_stats(stats):
+    """Print static and rendered throughput and the renderer's counters on stderr"""
+    for row in stats["throughput"]:
+        print(f"{row['kind']}: {row['urls']} URLs, {row['per_second']:.1f} URLs/s, "
+              f"{row['mean'] * 1000:.0f} ms per URL", file=sys.stderr)
+    renderer = stats["renderer"]
+    if renderer:
+        print(f"renderer: {renderer['renders']} renders, {renderer['timeouts']} timed out, "
+              f"{renderer['failures']} failed, {renderer['blocked_requests']} requests blocked, "
+              f"{renderer['mean'] * 1000:.0f} ms per render", file=sys.stderr)
+
+
+def print_dedup_stats(stats):
+    """Print how many duplicate URLs were answered from another alias, and how, on stderr"""
+    text = (f"{stats['urls']} URLs read, {stats['inspected']} inspected, "
+            f"{stats['fanned_out']} duplicates answered from another alias")
+    if stats["summarized"]:
+        text += f", {stats['summarized']} from the verdict and status kept after their result left the fan-out window"
+    if stats["unanswered"]:
+        text += f", {stats['unanswered']} reported as duplicates without a result (Bloom filter)"
+    print(text, file=sys.stderr)
+
+
+def print_analysis_stats(rows):
+    """Print pages analyzed and time spent per analyzer on stderr"""
+    print(f"{'analyzer':<16} {'pages':>8} {'total':>9} {'per page':>9}", file=sys.stderr)
+    for row in sorted(rows, key=lambda row: row["seconds"], reverse=True):
+        print(f"{row['analyzer']:<16} {row['pages']:>8} {row['seconds']:>8.2f}s {row['mean'] * 1000:>7.2f}ms",
+              file=sys.stderr)
+
+
+def print_queue_stats(queue, loader):
+    """Print the state of a work queue and what this process did with it on stderr"""
+    stats = queue.stats()
+    counts = queue.counts
+    text = (f"queue: {stats['done']} URLs done, {stats['pending'] + stats['leased']} left; this process inspected "
+            f"{counts['inspected']}, answered {counts['shared']} duplicates from them")
+    if loader is not None:
+        text += f" and queued {loader.added} URLs"
+    if counts["reclaimed"]:
+        text += f"; {counts['reclaimed']} URLs reclaimed from stopped workers"
+    if counts["given_up"]:
+        text += f", {counts['given_up']} given up on"
+    print(text, file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect URLs in bulk and export the results")
+    parser.add_argument("inputs", nargs="*", default=["-"],
+                        help="files with one URL per line (default: read stdin)")
+    parser.add_argument("-s", "--sitemap", action="append", default=[], metavar="URL",
+                        help="inspect the URLs listed in a sitemap or sitemap index (repeatable)")
+    parser.add_argument("-o", "--output", default="-",
+                        help="output file (default: stdout)")
+    parser.add_argument("-f", "--format", choices=FORMATS, default="jsonl",
+                        help="output format (default: jsonl; parquet needs pyarrow)")
+    parser.add_argument("-c", "--concurrency", type=int, default=200,
+                        help="maximum number of inspections in flight (default: 200)")
+    parser.add_argument("--per-host", type=int, default=8,
+                        help="maximum concurrent requests to one host (default: 8)")
+    parser.add_argument("--timeout", type=float, default=15.0,
+                        help="network timeout in seconds (default: 15)")
+    parser.add_argument("--cache", metavar="PATH",
+                        help="SQLite file to keep results in between runs (default: no cache)")
+    parser.add_argument("--max-age", type=float, default=24 * 3600,
+                        help="seconds a cached result is used without revalidation (default: 86400)")
+    parser.add_argument("--cache-size", type=int, default=1000000,
+                        help="maximum number of cached URLs (default: 1000000)")
+    parser.add_argument("--no-head", action="store_true",
+                        help="always use GET instead of trying HEAD first")
+    parser.add_argument("--rate", type=float, metavar="N",
+                        help="maximum requests per second to one host (default: no limit)")
+    parser.add_argument("--ignore-crawl-delay", action="store_true",
+                        help="do not slow down for robots.txt Crawl-delay (Googlebot ignores it)")
+    parser.add_argument("-w", "--parse-workers", type=int, default=0, metavar="N",
+                        help="parse pages in N worker processes (default: 0, parse in the main process)")
+    parser.add_argument("--host-stats", action="store_true",
+                        help="print per-host request and wait time statistics to stderr at the end")
+    parser.add_argument("--timings", action="store_true",
+                        help="time every inspection phase: adds a timings column and prints percentiles at the end")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve phase timing histograms for Prometheus at http://127.0.0.1:PORT/metrics "
+                             "(implies --timings)")
+    parser.add_argument("--stats-interval", type=float, metavar="SECONDS",
+                        help="print a phase timing summary to stderr every SECONDS (implies --timings)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only inspect new, changed or due URLs and output just the status changes "
+                             "(needs --cache, which keeps the state between runs)")
+    parser.add_argument("--budget", type=int, metavar="N",
+                        help="with --incremental, inspect at most N URLs, highest priority first")
+    parser.add_argument("--revisit", type=float, default=1.0, metavar="DAYS",
+                        help="with --incremental, recheck a URL this long after it changed; the interval doubles "
+                             "every time it is found unchanged (default: 1)")
+    parser.add_argument("--max-revisit", type=float, default=30.0, metavar="DAYS",
+                        help="with --incremental, recheck every URL at least this often (default: 30)")
+    parser.add_argument("--render", action="store_true",
+                        help="render pages whose HTML suggests JavaScript sets their signals in headless Chromium "
+                             "(needs playwright)")
+    parser.add_argument("--render-contexts", type=int, default=4, metavar="N",
+                        help="browser contexts rendering at once (default: 4)")
+    parser.add_argument("--render-timeout", type=float, default=10.0, metavar="SECONDS",
+                        help="time limit per render (default: 10)")
+    parser.add_argument("--dedup", choices=("exact", "loose", "off"), default="exact",
+                        help="inspect each page once, copying its result to every alias: exact merges different "
+                             "spellings of a URL, loose also ignores tracking parameters, query order and trailing "
+                             "slashes (default: exact)")
+    parser.add_argument("--bloom", type=int, metavar="N",
+                        help="track seen URLs in a Bloom filter sized for N URLs instead of exactly (for huge "
+                             "inputs; aliases read after their result left the fan-out window get no result, "
+                             "and about one URL in a million is wrongly taken for a duplicate)")
+    parser.add_argument("--fanout-window", type=int, default=100000, metavar="N",
+                        help="results kept for aliases read later (default: 100000); aliases read after "
+                             "their result was dropped get its verdict and status only")
+    parser.add_argument("-A", "--user-agent", default="googlebot", metavar="NAME",
+                        help="user agent sent with requests: " + ", ".join(USER_AGENTS) + ", browser (one of the "
+                             "browsers, always the same one for the same inputs) or any literal string "
+                             "(default: googlebot)")
+    parser.add_argument("--analyze", action="append", default=[], metavar="NAME",
+                        help="also check pages for the " + " and ".join(REPORTS) + " reports: a report name, an "
+                             "analyzer name or all (repeatable or comma separated)")
+    parser.add_argument("--analyzer-stats", action="store_true",
+                        help="print the time spent per analyzer to stderr at the end")
+    parser.add_argument("--queue", metavar="PATH",
+                        help="keep the run's URLs and results in a SQLite work queue; run the same command again "
+                             "to resume after a crash or interruption. The output is written once every URL is done")
+    parser.add_argument("--workers", type=int, default=1, metavar="N",
+                        help="with --queue, inspect in N processes sharing the queue (default: 1)")
+    parser.add_argument("--lease", type=float, default=60.0, metavar="SECONDS",
+                        help="with --queue, how long URLs taken by a worker that stopped answering stay taken "
+                             "(default: 60; workers of this machine that died are noticed at once)")
+    parser.add_argument("--checkpoint", type=float, default=5.0, metavar="SECONDS",
+                        help="with --queue, how often finished results are stored (default: 5)")
+    args = parser.parse_args(argv)
+
+    if args.bloom is not None and args.bloom <= 0:
+        parser.error("--bloom needs a positive number of URLs")
+    if args.incremental and not args.cache:
+        parser.error("--incremental needs --cache to keep its state in")
+    if args.queue and args.incremental:
+        parser.error("--queue cannot be combined with --incremental")
+    if args.workers != 1 and not args.queue:
+        parser.error("--workers needs --queue to share the work through")
+    if args.workers < 1 or args.lease <= 0 or args.checkpoint <= 0:
+        parser.error("--workers, --lease and --checkpoint must be positive")
+    if args.checkpoint * 2 > args.lease:
+        parser.error("--lease must be at least twice --checkpoint, which renews the leases")
+    try:
+        analyzers = resolve_analyzers(name.strip() for value in args.analyze for name in value.split(",") if name.strip())
+    except ValueError as e:
+        parser.error(str(e))
+
+    # Imported once the arguments are fine, so --help and usage errors return without loading asyncio
+    from engine import InspectionEngine
+    from renderer import require_playwright
+    from timing import MetricsServer, StatsDumper
+
+    if args.render:
+        try:
+            require_playwright()
+        except ImportError as e:
+            parser.error(str(e))
+    timings = args.timings or args.metrics_port is not None or args.stats_interval is not None
+    try:
+        if args.incremental:
+            from incremental import DAY, DIFF_COLUMNS, IncrementalAudit
+            exporter = open_exporter(args.format, args.output, columns=DIFF_COLUMNS)
+        else:
+            exporter = open_exporter(args.format, args.output)
+    except (ImportError, ValueError) as e:
+        parser.error(str(e))
+
+    engine_options = dict(
+        concurrency=args.concurrency,
+        per_host=args.per_host,
+        timeout=args.timeout,
+        user_agent=resolve_user_agent(args.user_agent, seed=" ".join(args.sitemap or args.inputs)),
+        cache_path=args.cache,
+        # Incremental runs decide themselves which URLs are due
+        cache_max_age=0 if args.incremental else args.max_age,
+        cache_max_entries=args.cache_size,
+        head_first=not args.no_head,
+        rate_limit=args.rate,
+        honor_crawl_delay=not args.ignore_crawl_delay,
+        parse_workers=args.parse_workers,
+        timings=timings,
+        render=args.render,
+        render_contexts=args.render_contexts,
+        render_timeout=args.render_timeout,
+        dedup=None if args.dedup == "off" else args.dedup,
+        dedup_bloom=args.bloom,
+        fanout_window=args.fanout_window,
+        analyzers=analyzers
+    )
+    queue = loader = None
+    if args.queue:
+        from work_queue import WorkQueue
+        # The queue merges duplicates itself, across processes, and workers only read ahead a little
+        # so they share out the last URLs of a run
+        engine_options.update(dedup=None, lookahead=2 * args.concurrency)
+        try:
+            queue = WorkQueue(args.queue, lease_seconds=args.lease, checkpoint_interval=args.checkpoint)
+            loading = queue.claim_loading(args.sitemap or args.inputs)
+        except ValueError as e:
+            if queue is not None:
+                queue.close()
+            parser.error(str(e))
+    engine = InspectionEngine(**engine_options)
+    reporters = []
+    try:
+        if args.metrics_port is not None:
+            reporters.append(MetricsServer(engine.timing_stats, args.metrics_port))
+        if args.stats_interval:
+            reporters.append(StatsDumper(engine.timing_stats, args.stats_interval))
+    except OSError as e:
+        parser.error(f"Cannot serve metrics: {e}")
+    try:
+        if args.incremental:
+            try:
+                audit = IncrementalAudit(engine, min_interval=args.revisit * DAY,
+                                         max_interval=args.max_revisit * DAY, budget=args.budget)
+            except ValueError as e:
+                parser.error(str(e))
+            entries = engine.iterate(engine.sitemap_entries(args.sitemap)) if args.sitemap else read_urls(args.inputs)
+            for change in audit.run(audit.plan(entries)):
+                exporter.write(change)
+            print(audit.summary(), file=sys.stderr)
+        elif queue is not None:
+            from work_queue import Loader, drain, start_workers
+            if loading:
+                urls = engine.iterate(engine.sitemap_urls(args.sitemap)) if args.sitemap else read_urls(args.inputs)
+                loader = Loader(queue, urls, None if args.dedup == "off" else args.dedup)
+            workers = start_workers(args.workers - 1, args.queue, engine_options, args.lease, args.checkpoint)
+            drain(queue, engine, loader)
+            failed = loader is not None and loader.error is not None
+            for worker in workers:
+                if failed:
+                    # They would wait for the rest of the input
+                    worker.terminate()
+                worker.join()
+            print_queue_stats(queue, loader)
+            if failed:
+                print(f"Could not read the input: {loader.error}", file=sys.stderr)
+                return 1
+            for record in queue.results():
+                exporter.write(record)
+        else:
+            urls = engine.sitemap_urls(args.sitemap) if args.sitemap else read_urls(args.inputs)
+            for record in engine.inspect_many(urls):
+                exporter.write(record)
+        dedup = engine.dedup_stats()
+        if dedup and dedup["duplicates"]:
+            print_dedup_stats(dedup)
+        for url, error in engine.sitemap_errors:
+            print(f"Could not read sitemap {url}: {error}", file=sys.stderr)
+        if args.host_stats:
+            print_host_stats(engine.host_stats())
+        if timings:
+            print_timing_summary(engine.timing_stats)
+        if args.render:
+            print_render_stats(engine.render_stats())
+        if args.analyzer_stats:
+            print_analysis_stats(engine.analysis_stats())
+    finally:
+        for reporter in reporters:
+            reporter.close()
+        engine.close()
+        if queue is not None:
+            queue.close()
+        exporter.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,682 @@
+"""Headless URL inspection engine used by the GUI and the command line tool"""
+import asyncio
+import queue
+import threading
+import time
+from itertools import islice
+from urllib.parse import urljoin, urlparse
+
+from analyzers import AnalyzerCosts, needs_body, resolve_analyzers
+from extractor import extract_signals, is_html, signals_from_html
+from fetcher import AsyncFetcher, FetchError, DEFAULT_USER_AGENT
+from politeness import HostQueue, PolitenessScheduler, THROTTLE_STATUSES, host_key
+from records import (
+    InspectionRecord, Verdict, RobotsState, NoindexState, CanonicalState, CacheState, RenderState, crawl_clock,
+    failed_record
+)
+from renderer import Renderer, RenderError, RenderTimeout
+from robots import RobotsCache, ROBOTS_OK, ROBOTS_MISSING
+from timing import Throughput, Trace, TimingStats, current_trace
+from urlnorm import Deduplicator, normalize_url
+
+# Googlebot follows at most 10 redirect hops
+MAX_REDIRECTS = 10
+
+# HEAD answers meaning the server does not support HEAD, so GET is used instead
+HEAD_UNSUPPORTED = {405, 501}
+
+# Marks the end of the result queue
+_DONE = object()
+
+
+def robots_state(allowed, entry):
+    """Record state for the robots.txt outcome"""
+    if entry.state == ROBOTS_MISSING:
+        return RobotsState.MISSING
+    if entry.state != ROBOTS_OK:
+        return RobotsState.UNREACHABLE
+    return RobotsState.ALLOWED if allowed else RobotsState.BLOCKED
+
+
+def same_url(a, b):
+    """Compare two absolute URLs ignoring scheme/host case and fragments"""
+    def key(url):
+        parts = urlparse(url)
+        return parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", parts.query
+    return key(a) == key(b)
+
+
+def classify(url, response, signals=None, redirect_chain=None, **fields):
+    """Turn a fetched response (and the signals read from it) into an InspectionRecord
+
+    For a URL that redirected, ``redirect_chain`` lists the (url, status)
+    hops that were followed and ``response`` is the final one.
+    """
+    status = response.status
+    fields.update(http_status=status, crawl_time=crawl_clock())
+    if redirect_chain:
+        fields.update(
+            http_status=redirect_chain[0][1],
+            redirect_chain=redirect_chain,
+            final_url=response.url,
+            final_status=status
+        )
+        return InspectionRecord(url, Verdict.REDIRECT, **fields)
+    if 200 <= status < 300:
+        if signals is None:
+            return InspectionRecord(url, Verdict.INDEXABLE, noindex_state=NoindexState.NOT_CHECKED, **fields)
+
+        fields.update(title=signals.title, canonical_url=signals.canonical, hreflang=signals.hreflang,
+                      reports=signals.reports)
+        alternate = signals.canonical is not None and not same_url(signals.canonical, url)
+        if signals.canonical is None:
+            fields["canonical_state"] = CanonicalState.NONE
+        elif not alternate:
+            fields["canonical_state"] = CanonicalState.SELF
+        elif signals.canonical_source == "Link header":
+            fields["canonical_state"] = CanonicalState.OTHER_LINK_HEADER
+        else:
+            fields["canonical_state"] = CanonicalState.OTHER_LINK_TAG
+
+        if signals.noindex:
+            noindex = NoindexState.HEADER if signals.noindex_source == "X-Robots-Tag header" else NoindexState.META
+            return InspectionRecord(url, Verdict.NOINDEX, noindex_state=noindex, **fields)
+        verdict = Verdict.CANONICAL_ALTERNATE if alternate else Verdict.INDEXABLE
+        return InspectionRecord(url, verdict, noindex_state=NoindexState.NO, **fields)
+    if 300 <= status < 400:
+        # A redirect without a Location header leads nowhere
+        return InspectionRecord(url, Verdict.REDIRECT_ERROR,
+                                redirect_error="has a redirect without a Location header", **fields)
+    if status in (404, 410):
+        return InspectionRecord(url, Verdict.NOT_FOUND, **fields)
+    if status >= 500:
+        return InspectionRecord(url, Verdict.SERVER_ERROR, **fields)
+    return InspectionRecord(url, Verdict.CLIENT_ERROR, **fields)
+
+
+def _take(iterator, count):
+    return list(islice(iterator, count))
+
+
+async def _cancel_all(tasks):
+    """Cancel tasks and wait for them to finish
+
+    asyncio.wait_for can swallow a cancellation that races with its inner
+    future completing, so cancellation is repeated until every task is done.
+    """
+    pending = set(tasks)
+    while pending:
+        for task in pending:
+            task.cancel()
+        _, pending = await asyncio.wait(pending, timeout=0.1)
+
+
+class _LoopThread:
+    """An event loop running forever in a daemon thread"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+class InspectionEngine:
+    """Inspect URLs without any GUI, one at a time or in bulk
+
+    All network I/O runs on one asyncio event loop. ``concurrency`` caps the
+    number of inspections in flight and ``per_host`` the number of requests
+    sent to the same host at once; connections are pooled and kept alive.
+    Requests to a host are further paced by a PolitenessScheduler: at most
+    ``rate_limit`` per second (unlimited when None), no faster than the
+    robots.txt Crawl-delay unless ``honor_crawl_delay`` is False, and
+    slower after 429/503 answers, which are retried ``throttle_retries``
+    times. Bulk runs hand URLs to workers round-robin across hosts.
+
+    With ``parse_workers`` > 0, page heads are parsed in that many worker
+    processes (see ParserPool) while this loop keeps doing the network I/O.
+
+    With ``timings`` enabled every record carries the seconds it spent per
+    phase (see timing.PHASES), and ``timing_stats`` aggregates them into
+    histograms. Disabled, the instrumentation costs next to nothing.
+
+    With ``render`` enabled, pages whose static head suggests JavaScript
+    sets their signals (see PageSignals.js_hint) are also rendered in a
+    headless browser (see Renderer, which needs playwright), and the
+    signals of the rendered DOM decide the verdict. ``throughput`` then
+    reports the static and the rendered URLs of bulk runs separately.
+
+    ``analyzers`` names enhancement and mobile usability checks (or the
+    "enhancements" and "mobile" reports, or "all"; see analyzers.py) that
+    run on the same parse of every page as the indexing checks; their
+    results are in each record's ``reports`` and ``analyzer_costs`` adds
+    up the time each of them took.
+
+    Bulk runs inspect every page once: with ``dedup`` set to "exact",
+    URLs that only differ in spelling (see normalize_url) are merged, and
+    "loose" also merges URLs differing in tracking parameters, query order
+    or a trailing slash. Every alias still gets a record, copied from the
+    inspected URL's (see Deduplicator for ``dedup_bloom`` and
+    ``fanout_window``); None inspects every URL read.
+
+    The ``*_async`` methods and ``inspect_stream`` must always be awaited
+    from the same event loop. The blocking methods (``inspect``, ``submit``,
+    ``inspect_many``) run them on a private loop in a background thread.
+    """
+
+    def __init__(self, concurrency=200, per_host=8, timeout=15.0, user_agent=DEFAULT_USER_AGENT,
+                 robots_agent="Googlebot", robots_ttl=24 * 3600, cache_path=None, cache_max_age=24 * 3600,
+                 cache_max_entries=1000000, head_first=True, max_redirects=MAX_REDIRECTS, rate_limit=None,
+                 honor_crawl_delay=True, throttle_retries=2, max_backoff=300.0, lookahead=10000, parse_workers=0,
+                 timings=False, render=False, render_contexts=4, render_timeout=10.0, dedup="exact",
+                 dedup_bloom=None, fanout_window=100000, analyzers=()):
+        if dedup not in (None, "exact", "loose"):
+            raise ValueError(f"Unknown deduplication mode: {dedup}")
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.robots_agent = robots_agent
+        self.robots_ttl = robots_ttl
+        self.cache_path = cache_path
+        self.cache_max_age = cache_max_age
+        self.cache_max_entries = cache_max_entries
+        self.head_first = head_first
+        self.max_redirects = max_redirects
+        self.rate_limit = rate_limit
+        self.honor_crawl_delay = honor_crawl_delay
+        self.throttle_retries = throttle_retries
+        self.max_backoff = max_backoff
+        self.lookahead = lookahead
+        self.parse_workers = parse_workers
+        self.timing_stats = TimingStats() if timings else None
+        self.render = render
+        self.render_contexts = render_contexts
+        self.render_timeout = render_timeout
+        self.analyzers = resolve_analyzers(analyzers)
+        self.analyzer_costs = AnalyzerCosts()
+        self.dedup = dedup
+        self.dedup_bloom = dedup_bloom
+        self.fanout_window = fanout_window
+        self.deduplicator = None
+        self.renderer = None
+        self.throughput = None
+        self.politeness = None
+        self.fetcher = None
+        self.robots = None
+        self.cache = None
+        self.parser_pool = None
+        self.sitemap_errors = []
+        self._loop_thread = None
+
+    def _get_fetcher(self):
+        # Created lazily so it binds to the loop that actually uses it
+        if self.fetcher is None:
+            self.fetcher = AsyncFetcher(
+                max_connections=self.concurrency,
+                per_host=self.per_host,
+                timeout=self.timeout,
+                user_agent=self.user_agent,
+                politeness=self._get_politeness()
+            )
+        return self.fetcher
+
+    def _get_parser_pool(self):
+        if self.parser_pool is None and self.parse_workers:
+            # multiprocessing is only imported by runs that use it
+            from parse_pool import ParserPool
+            self.parser_pool = ParserPool(self.parse_workers, whole_documents=needs_body(self.analyzers))
+        return self.parser_pool
+
+    def _get_renderer(self):
+        if self.renderer is None:
+            self.renderer = Renderer(contexts=self.render_contexts, timeout=self.render_timeout,
+                                     user_agent=self.user_agent)
+        return self.renderer
+
+    def _get_politeness(self):
+        if self.politeness is None:
+            self.politeness = PolitenessScheduler(rate=self.rate_limit, max_backoff=self.max_backoff)
+        return self.politeness
+
+    def _get_robots(self):
+        if self.robots is None:
+            self.robots = RobotsCache(self._get_fetcher(), agent=self.robots_agent, ttl=self.robots_ttl)
+        return self.robots
+
+    def _get_cache(self):
+        # SQLite connections belong to the thread that opened them
+        if self.cache is None and self.cache_path is not None:
+            from result_cache import ResultCache
+            self.cache = ResultCache(self.cache_path, max_age=self.cache_max_age, max_entries=self.cache_max_entries)
+        return self.cache
+
+    def _get_loop_thread(self):
+        if self._loop_thread is None:
+            self._loop_thread = _LoopThread()
+        return self._loop_thread
+
+    async def inspect_async(self, url):
+        """Inspect a single URL and return its InspectionRecord"""
+        if self.timing_stats is None:
+            return await self._inspect(url)
+
+        trace = Trace()
+        token = current_trace.set(trace)
+        start = time.perf_counter()
+        try:
+            record = await self._inspect(url)
+        except Exception as e:
+            trace.since("total", start)
+            self.timing_stats.observe(trace.phases, "failed")
+            # Picked up by _inspect_safely for the failed record
+            e.timings = trace.phases
+            raise
+        finally:
+            current_trace.reset(token)
+        trace.since("total", start)
+        self.timing_stats.observe(trace.phases, record.verdict_name)
+        return record.with_timings(trace.phases)
+
+    async def _inspect(self, url):
+        url = normalize_url(url)
+
+        cache = self._get_cache()
+        cached = cache.get(url) if cache is not None else None
+        if cached is not None and self.analyzers and cached.result.needs_analysis(self.analyzers):
+            # Stored by a run without (some of) these analyzers: inspect the page afresh
+            cached = None
+        if cached is not None and cached.fresh:
+            return cached.result.replace(cache_state=CacheState.FRESH)
+
+        allowed, entry = await self._check_robots(url)
+        robots = robots_state(allowed, entry)
+        if not allowed:
+            verdict = Verdict.BLOCKED_ROBOTS if entry.state == ROBOTS_OK else Verdict.ROBOTS_UNREACHABLE
+            result = InspectionRecord(url, verdict, robots_state=robots)
+            if cache is not None:
+                cache.put(url, result)
+            return result
+
+        # Stale results are revalidated; a 304 means the page is unchanged
+        headers = cached.conditional_headers() if cached is not None else None
+        response, signals = await self._fetch_page(url, headers)
+        if response.status == 304 and cached is not None:
+            cache.touch(url)
+            return cached.result.replace(cache_state=CacheState.REVALIDATED, crawl_time=crawl_clock(),
+                                         robots_state=robots)
+        validators = response.headers.get("etag"), response.headers.get("last-modified")
+
+        # Follow redirects hop by hop, checking robots.txt for every target
+        chain = []
+        seen = {url}
+        result = None
+        while 300 <= response.status < 400 and "location" in response.headers:
+            chain.append((response.url, response.status))
+            target = urljoin(response.url, response.headers["location"])
+            if target in seen:
+                result = InspectionRecord(url, Verdict.REDIRECT_ERROR, http_status=chain[0][1],
+                                          redirect_chain=chain, redirect_error=f"loops back to {target}",
+                                          robots_state=robots)
+                break
+            if len(chain) > self.max_redirects:
+                result = InspectionRecord(url, Verdict.REDIRECT_ERROR, http_status=chain[0][1],
+                                          redirect_chain=chain,
+                                          redirect_error=f"is longer than {self.max_redirects} hops",
+                                          robots_state=robots)
+                break
+            seen.add(target)
+            allowed, entry = await self._check_robots(target)
+            if not allowed:
+                result = InspectionRecord(url, Verdict.REDIRECT_ERROR, http_status=chain[0][1],
+                                          redirect_chain=chain,
+                                          redirect_error=f"leads to {target}, which robots.txt does not allow",
+                                          robots_state=robots)
+                break
+            # Only the page itself needs HTML signals, not redirect targets
+            response, _ = await self._fetch_page(target, need_signals=False)
+
+        if result is None:
+            render_state = RenderState.NOT_RENDERED
+            # A noindex in the static HTML stands; Google does not render such pages
+            if self.render and signals is not None and signals.js_hint and not signals.noindex and not chain:
+                signals, render_state = await self._render(response, signals)
+            result = classify(url, response, signals, chain, robots_state=robots, render_state=render_state)
+        if cache is not None:
+            cache.put(url, result, *validators)
+        return result
+
+    async def _render(self, response, signals):
+        """Render a page and return (signals of the rendered DOM, RenderState)
+
+        If rendering fails or times out, the static signals are returned.
+        """
+        trace = current_trace.get()
+        start = time.perf_counter()
+        try:
+            html = await self._get_renderer().render(response.url)
+        except RenderTimeout:
+            return signals, RenderState.TIMED_OUT
+        except RenderError:
+            return signals, RenderState.FAILED
+        finally:
+            if trace is not None:
+                trace.since("render", start)
+        signals = signals_from_html(html, response.headers, response.url, self.robots_agent, self.analyzers)
+        if signals.costs:
+            self.analyzer_costs.observe(signals.costs)
+        return signals, RenderState.RENDERED
+
+    async def _check_robots(self, url):
+        """Check robots.txt for a URL, passing its Crawl-delay on to the scheduler"""
+        trace = current_trace.get()
+        if trace is None:
+            allowed, entry = await self._get_robots().check(url)
+        else:
+            # The robots.txt request's own phases all count as robots time
+            token = current_trace.set(None)
+            start = time.perf_counter()
+            try:
+                allowed, entry = await self._get_robots().check(url)
+            finally:
+                current_trace.reset(token)
+                trace.since("robots", start)
+        if self.honor_crawl_delay:
+            self._get_politeness().set_crawl_delay(host_key(url), entry.rules.crawl_delay)
+        return allowed, entry
+
+    async def _fetch_page(self, url, headers=None, need_signals=True):
+        """Request a page and return (response, signals)
+
+        A 429 or 503 is retried up to ``throttle_retries`` times; the
+        scheduler holds the retry back for the host's backoff.
+        """
+        for _ in range(self.throttle_retries):
+            response, signals = await self._fetch_page_once(url, headers, need_signals)
+            if response.status not in THROTTLE_STATUSES:
+                return response, signals
+        return await self._fetch_page_once(url, headers, need_signals)
+
+    async def _fetch_page_once(self, url, headers=None, need_signals=True):
+        """Request a page once and return (response, signals)
+
+        HEAD is tried first, so redirects, errors and non-HTML files cost no
+        body at all; GET follows only for an HTML page whose head we need,
+        or when the server does not support HEAD. Conditional requests
+        (``headers``) go straight to GET, where a 304 is just as cheap.
+        """
+        fetcher = self._get_fetcher()
+        if self.head_first and not headers:
+            async with fetcher.request("HEAD", url) as response:
+                if response.status not in HEAD_UNSUPPORTED:
+                    ok = 200 <= response.status < 300
+                    if not (ok and need_signals and is_html(response.headers)):
+                        signals = None
+                        if ok and need_signals:
+                            signals = await self._extract(response)
+                        return response, signals
+
+        async with fetcher.request("GET", url, headers) as response:
+            signals = None
+            if need_signals and 200 <= response.status < 300:
+                signals = await self._extract(response)
+            else:
+                # Short error/redirect bodies are drained to keep the connection
+                await response.discard_rest()
+        return response, signals
+
+    async def _extract(self, response):
+        signals = await extract_signals(response, self.robots_agent, self._get_parser_pool(), self.analyzers)
+        if signals.costs:
+            self.analyzer_costs.observe(signals.costs)
+        return signals
+
+    async def sitemap_urls(self, sitemap_urls, concurrency=8):
+        """Yield the page URLs listed in sitemaps and sitemap indexes as they download
+
+        Pass the result straight to inspect_stream/inspect_many so that
+        inspections start with the first URLs. Sitemaps use their own
+        connections, so a sitemap waiting for the inspection queue never
+        holds a per-host slot an inspection needs. Sitemaps that failed
+        are listed in ``sitemap_errors`` afterwards.
+        """
+        async for loc, _, _ in self.sitemap_entries(sitemap_urls, concurrency):
+            yield loc
+
+    async def sitemap_entries(self, sitemap_urls, concurrency=8):
+        """Like sitemap_urls, but yield (loc, lastmod, priority) for every page"""
+        fetcher = AsyncFetcher(
+            max_connections=concurrency,
+            per_host=concurrency,
+            timeout=self.timeout,
+            user_agent=self.user_agent,
+            politeness=self._get_politeness()
+        )
+        # Imported here, like ResultCache and ParserPool, to keep start up fast for runs without sitemaps
+        from sitemaps import SitemapReader
+        reader = SitemapReader(fetcher, concurrency=concurrency)
+        try:
+            async for entry in reader.entries(sitemap_urls):
+                yield entry
+        finally:
+            self.sitemap_errors.extend(reader.errors)
+            fetcher.close()
+
+    async def _inspect_safely(self, url):
+        """Inspect a URL, turning failures into failed records"""
+        try:
+            return await self.inspect_async(url)
+        except Exception as e:
+            # Anything else (a locked cache, a broken parse pool, a bug) still gets the URL its row
+            message = str(e) if isinstance(e, (FetchError, ValueError)) else f"{type(e).__name__}: {e}"
+            record = failed_record(url, message)
+            timings = getattr(e, "timings", None)
+            return record.with_timings(timings) if timings else record
+
+    async def _feed(self, urls, todo, results, dedup):
+        """Move URLs from a regular or async iterable into the work queue"""
+        if hasattr(urls, "__aiter__"):
+            async for url in urls:
+                await self._dispatch(url, todo, results, dedup)
+            return
+
+        # Plain iterables may block (files, pipes), so read them off the loop
+        loop = asyncio.get_running_loop()
+        iterator = iter(urls)
+        while True:
+            batch = await loop.run_in_executor(None, _take, iterator, 64)
+            if not batch:
+                break
+            for url in batch:
+                await self._dispatch(url, todo, results, dedup)
+
+    async def _dispatch(self, url, todo, results, dedup):
+        if dedup is None:
+            await todo.put(url)
+            return
+        url, record = dedup.add(url)
+        if url is not None:
+            await todo.put(url)
+        elif record is not None:
+            await results.put(record)
+
+    async def _worker(self, todo, results, dedup):
+        while True:
+            url = await todo.get()
+            if url is None:
+                return
+            throughput = self._get_throughput()
+            start = throughput.begin() if throughput is not None else None
+            try:
+                result = await self._inspect_safely(url)
+            finally:
+                todo.done(url)
+            if throughput is not None:
+                throughput.end("static" if result.render_state == RenderState.NOT_RENDERED else "rendered", start)
+            if dedup is None:
+                await results.put(result)
+            else:
+                for record in dedup.finish(url, result):
+                    await results.put(record)
+
+    def _get_throughput(self):
+        if self.throughput is None and self.render:
+            self.throughput = Throughput()
+        return self.throughput
+
+    async def inspect_stream(self, urls):
+        """Inspect a regular or async iterable of URLs, yielding results as they finish
+
+        Up to ``lookahead`` URLs are read ahead of the workers so they can be
+        interleaved across hosts; beyond that the input is only read as fast
+        as workers free up, so arbitrarily long inputs take constant memory
+        (plus the deduplication seen-set, which keeps the verdict and status of
+        every page unless it is a Bloom filter, and the fan-out window of full
+        results).
+        """
+        dedup = None
+        if self.dedup is not None:
+            dedup = self.deduplicator = Deduplicator(loose=self.dedup == "loose", bloom_capacity=self.dedup_bloom,
+                                                     window=self.fanout_window)
+        todo = HostQueue(self._get_politeness(), per_host=self.per_host, maxsize=self.lookahead)
+        results = asyncio.Queue(maxsize=self.concurrency)
+        workers = [asyncio.ensure_future(self._worker(todo, results, dedup)) for _ in range(self.concurrency)]
+
+        async def feed_then_finish():
+            feed_error = None
+            try:
+                await self._feed(urls, todo, results, dedup)
+            except Exception as e:
+                feed_error = e
+            todo.close()
+            # A worker that died must not keep the stream from ending
+            outcomes = await asyncio.gather(*workers, return_exceptions=True)
+            await results.put(_DONE)
+            if feed_error is not None:
+                raise feed_error
+            for outcome in outcomes:
+                if isinstance(outcome, Exception):
+                    raise outcome
+
+        feeder = asyncio.ensure_future(feed_then_finish())
+        try:
+            while True:
+                result = await results.get()
+                if result is _DONE:
+                    break
+                yield result
+            # Surface errors raised while reading the input
+            await feeder
+        finally:
+            await _cancel_all([feeder] + workers)
+
+    def submit(self, url):
+        """Start inspecting a URL in the background and return a concurrent.futures.Future"""
+        return self._get_loop_thread().submit(self.inspect_async(url))
+
+    def submit_many(self, urls, on_result):
+        """Start a bulk inspection in the background, calling on_result(result) for each URL
+
+        ``urls`` may be a regular or async iterable (e.g. sitemap_urls()).
+        on_result runs on the engine's loop thread, so it must only hand the
+        result over (e.g. to a queue). Returns a concurrent.futures.Future
+        that completes when the run is over; cancel it to stop the run.
+        """
+        async def run():
+            async for result in self.inspect_stream(urls):
+                on_result(result)
+
+        return self._get_loop_thread().submit(run())
+
+    def inspect(self, url):
+        """Inspect a single URL, blocking until its InspectionRecord is ready"""
+        return self.submit(url).result()
+
+    def inspect_many(self, urls):
+        """Blocking version of inspect_stream"""
+        return self.iterate(self.inspect_stream(urls))
+
+    def iterate(self, items):
+        """Iterate an async iterable of the engine (e.g. sitemap_entries()) from blocking code"""
+        loop_thread = self._get_loop_thread()
+        loop = loop_thread.loop
+        ready = queue.Queue()
+        credits = None
+
+        async def pump():
+            nonlocal credits
+            # Keep at most `concurrency` items waiting for the caller
+            credits = asyncio.Semaphore(self.concurrency)
+            try:
+                async for item in items:
+                    await credits.acquire()
+                    ready.put(item)
+            finally:
+                ready.put(_DONE)
+
+        future = loop_thread.submit(pump())
+        try:
+            while True:
+                item = ready.get()
+                if item is _DONE:
+                    break
+                loop.call_soon_threadsafe(credits.release)
+                yield item
+            future.result()
+        finally:
+            future.cancel()
+
+    def render_stats(self):
+        """Throughput of static and rendered URLs, and the renderer's counters"""
+        return {
+            "throughput": self.throughput.stats() if self.throughput is not None else [],
+            "renderer": self.renderer.stats() if self.renderer is not None else None,
+        }
+
+    def analysis_stats(self):
+        """Pages analyzed and seconds spent per analyzer (see AnalyzerCosts)"""
+        return self.analyzer_costs.rows()
+
+    def dedup_stats(self):
+        """Counts of URLs read, inspected, answered from another alias and inspected again by the last bulk run"""
+        return self.deduplicator.stats() if self.deduplicator is not None else None
+
+    def host_stats(self):
+        """Per-host queue depth, wait times and pacing (see PolitenessScheduler.stats)"""
+        return self.politeness.stats() if self.politeness is not None else []
+
+    async def _shutdown(self):
+        await _cancel_all(task for task in asyncio.all_tasks() if task is not asyncio.current_task())
+        if self.renderer is not None:
+            await self.renderer.close()
+        self._close_resources()
+
+    def _close_resources(self):
+        if self.fetcher is not None:
+            self.fetcher.close()
+        if self.cache is not None:
+            self.cache.close()
+        if self.parser_pool is not None:
+            self.parser_pool.close()
+
+    def close(self):
+        """Cancel running inspections, close pooled connections and stop the background loop"""
+        if self._loop_thread is not None:
+            self._loop_thread.submit(self._shutdown()).result()
+            self._loop_thread.stop()
+            self._loop_thread = None
+        else:
+            self._close_resources()
+        self.fetcher = None
+        self.robots = None
+        self.cache = None
+        self.politeness = None
+        self.parser_pool = None
+        self.renderer = None
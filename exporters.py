@@ -0,0 +1,148 @@
+"""Streaming CSV, JSONL and Parquet export of inspection records"""
+import csv
+import json
+import sys
+import time
+
+from records import EXPORT_COLUMNS
+
+FORMATS = ("jsonl", "csv", "parquet")
+
+# Columns holding one of a handful of values, dictionary-encoded in Parquet
+CATEGORY_COLUMNS = {"verdict", "robots", "noindex", "canonical", "cache", "render", "change", "verdict_before"}
+INT_COLUMNS = {"http_status", "final_status", "redirect_hops", "http_status_before"}
+
+
+class Exporter:
+    """Write records in batches of ``batch_size`` rows
+
+    A batch is also written once ``flush_interval`` seconds have passed
+    since the last one, so a slow run still shows up in the output as it
+    goes. Only the current batch is ever held in memory. Anything with an
+    export_row() matching ``columns`` can be written.
+    """
+
+    def __init__(self, stream, owns_stream=False, batch_size=1000, flush_interval=1.0, columns=EXPORT_COLUMNS):
+        self.stream = stream
+        self.columns = columns
+        self.owns_stream = owns_stream
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows = []
+        self.rows_written = 0
+        self.last_flush = time.monotonic()
+
+    def write(self, record):
+        self.rows.append(record.export_row())
+        if len(self.rows) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.write_batch(self.rows)
+            self.rows_written += len(self.rows)
+            self.rows = []
+            self.stream.flush()
+        self.last_flush = time.monotonic()
+
+    def write_batch(self, rows):
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+        if self.owns_stream:
+            self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class JsonLinesExporter(Exporter):
+    """One JSON object per record"""
+
+    def write_batch(self, rows):
+        self.stream.write("".join(
+            json.dumps(dict(zip(self.columns, row)), ensure_ascii=False) + "\n" for row in rows
+        ))
+
+
+class CsvExporter(Exporter):
+    """CSV with a header line; missing values are left empty"""
+
+    def __init__(self, stream, **kwargs):
+        super().__init__(stream, **kwargs)
+        self.writer = csv.writer(stream)
+        self.writer.writerow(self.columns)
+
+    def write_batch(self, rows):
+        self.writer.writerows(rows)
+
+
+class ParquetExporter(Exporter):
+    """A Parquet file with one row group per batch (needs pyarrow)"""
+
+    def __init__(self, path, batch_size=50000, **kwargs):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Parquet export needs pyarrow (pip install pyarrow)")
+        self.pa = pyarrow
+        fields = []
+        for name in kwargs.get("columns", EXPORT_COLUMNS):
+            if name in CATEGORY_COLUMNS:
+                kind = pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+            elif name in INT_COLUMNS:
+                kind = pyarrow.int32()
+            elif name == "crawl_time":
+                kind = pyarrow.float64()
+            else:
+                kind = pyarrow.string()
+            fields.append(pyarrow.field(name, kind))
+        self.schema = pyarrow.schema(fields)
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression="zstd")
+        # Flushing on a timer would only produce tiny row groups
+        kwargs.setdefault("flush_interval", float("inf"))
+        super().__init__(self.writer, batch_size=batch_size, **kwargs)
+
+    def write_batch(self, rows):
+        pa = self.pa
+        arrays = []
+        for index, field in enumerate(self.schema):
+            values = [row[index] for row in rows]
+            if pa.types.is_dictionary(field.type):
+                arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+            else:
+                arrays.append(pa.array(values, type=field.type))
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def flush(self):
+        # Row groups are written as they fill; the file is finished by close()
+        if self.rows:
+            self.write_batch(self.rows)
+            self.rows_written += len(self.rows)
+            self.rows = []
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def open_exporter(fmt, path="-", **kwargs):
+    """Create the exporter for a format, writing to a file or "-" for stdout"""
+    if fmt == "parquet":
+        if path == "-":
+            raise ValueError("Parquet output needs a file name")
+        return ParquetExporter(path, **kwargs)
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    exporter_class = CsvExporter if fmt == "csv" else JsonLinesExporter
+    if path == "-":
+        return exporter_class(sys.stdout, **kwargs)
+    stream = open(path, "w", encoding="utf-8", newline="")
+    return exporter_class(stream, owns_stream=True, **kwargs)
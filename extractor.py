@@ -0,0 +1,445 @@
+"""Streaming extraction of indexing signals from response headers and the HTML head"""
+import codecs
+import re
+import time
+from html import unescape
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+from analyzers import ANALYZERS, MAX_DOCUMENT_BYTES, needs_body
+from timing import current_trace
+
+# Stop looking for </head> after this much HTML
+MAX_HEAD_BYTES = 512 * 1024
+# Longest title kept
+MAX_TITLE_LENGTH = 512
+
+# Elements allowed in <head>; any other element implicitly starts the body
+HEAD_ELEMENTS = {"html", "head", "title", "meta", "link", "base", "style", "script", "noscript", "template"}
+
+# X-Robots-Tag directives that take a value after a colon (so "x: y" isn't a user agent)
+VALUE_DIRECTIVES = {"unavailable_after", "max-snippet", "max-image-preview", "max-video-preview"}
+
+LINK_HEADER_RE = re.compile(r'<([^>]*)>\s*((?:;[^,<]*)*)')
+CHARSET_RE = re.compile(r'charset\s*=\s*["\']?([\w.:-]+)', re.I)
+# Where the head ends at the latest, found without parsing
+HEAD_END_RE = re.compile(rb'</head[\s>]|<body[\s>]', re.I)
+# A complete start tag, to find the first body element after the head
+START_TAG_RE = re.compile(rb"""<([a-zA-Z][^\t\n\r\f />]*)[^>"']*(?:(?:"[^"]*"|'[^']*')[^>"']*)*>""")
+# Start tags read_head() looks past for the first body element
+BODY_START_SKIPPED = {tag.encode() for tag in HEAD_ELEMENTS | {"body"}}
+# The same in decoded text, up to the end of the tag, to hand the body over to the scanner
+HEAD_END_TEXT_RE = re.compile(r"""</head\s*>|<body\b[^>"']*(?:(?:"[^"]*"|'[^']*')[^>"']*)*>""", re.I)
+# Tags and attributes as HeadExtractor.scan() tokenizes them (quoted values may hold ">")
+BODY_TAG_RE = re.compile(r"""<(/?)([a-zA-Z][^\t\n\r\f />]*)([^>"']*(?:(?:"[^"]*"|'[^']*')[^>"']*)*)>""")
+# A tag cut off by the end of a chunk
+PARTIAL_TAG_RE = re.compile(r"""</?[a-zA-Z][^>"']*(?:(?:"[^"]*"|'[^']*')[^>"']*)*(?:"[^"]*|'[^']*)?\Z""")
+ATTR_RE = re.compile(r"""([^\s/>"'=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+)))?""")
+# Elements whose content is text up to their end tag
+RAW_TEXT_END_RES = {tag: re.compile(rf"</{tag}\s*>", re.I) for tag in ("script", "style")}
+# Inline scripts that look like they add or change indexing tags
+JS_SIGNAL_RE = re.compile(r'noindex|canonical|["\']robots["\']', re.I)
+# ids and attributes of the element single-page apps mount themselves into
+APP_ROOT_IDS = {"root", "app", "__next", "__nuxt", "___gatsby", "svelte"}
+APP_ROOT_ATTRS = {"ng-app", "ng-version", "data-reactroot"}
+
+
+class PageSignals:
+    """Indexing signals found in a page's headers and <head>"""
+
+    def __init__(self):
+        self.noindex_source = None
+        self.canonical = None
+        self.canonical_source = None
+        self.hreflang = []
+        self.title = None
+        # Why the page's signals may only be complete after JavaScript ran (None if no reason to think so)
+        self.js_hint = None
+        # Results and seconds spent per analyzer, when analyzers ran (see analyzers.py)
+        self.reports = None
+        self.costs = None
+
+    @property
+    def noindex(self):
+        return self.noindex_source is not None
+
+
+def _is_noindex(directives):
+    return any(d.strip().lower() in ("noindex", "none") for d in directives.split(","))
+
+
+def read_header_signals(signals, headers, base_url, agent):
+    """Fill in signals from the X-Robots-Tag and Link headers"""
+    agent = agent.lower()
+    # One line per X-Robots-Tag header (see fetcher.LINE_HEADERS). Directives can be scoped to a crawler,
+    # "otherbot: nofollow, noindex", up to the next crawler name or the end of the header
+    for header in headers.get("x-robots-tag", "").split("\n"):
+        applies = True
+        for value in header.split(","):
+            name, sep, rest = value.partition(":")
+            name = name.strip().lower()
+            if sep and name not in VALUE_DIRECTIVES:
+                applies = agent.startswith(name)
+                value = rest
+            if applies and _is_noindex(value):
+                signals.noindex_source = "X-Robots-Tag header"
+
+    for target, params in LINK_HEADER_RE.findall(headers.get("link", "")):
+        rel = re.search(r'rel\s*=\s*"?([^";]*)"?', params, re.I)
+        if rel and "canonical" in rel.group(1).lower().split():
+            signals.canonical = urljoin(base_url, target.strip())
+            signals.canonical_source = "Link header"
+
+
+class HeadExtractor(HTMLParser):
+    """Incremental HTML parser that collects head signals and stops at the body
+
+    Feed it the body in chunks with feed_bytes(); once it returns True the
+    rest of the document is not needed. Only the unparsed tail of the
+    current chunk is buffered, so memory stays flat regardless of page size.
+
+    The named ``analyzers`` look at the same parse; if any of them needs
+    the body, parsing goes on to the end of the document (or
+    MAX_DOCUMENT_BYTES). Call finish() at the end to collect their
+    reports into the signals. The head is always parsed by HTMLParser,
+    so analyzers never change the indexing signals; the body is left to
+    scan(), a tokenizer several times faster that is good enough for
+    what analyzers look at.
+    """
+
+    def __init__(self, signals, base_url, agent, charset="utf-8", analyzers=()):
+        super().__init__(convert_charrefs=True)
+        self.signals = signals
+        self.base_url = base_url
+        self.meta_names = {"robots", agent.lower()}
+        try:
+            self.decoder = codecs.getincrementaldecoder(charset)(errors="replace")
+        except LookupError:
+            self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.done = False
+        self.bytes_fed = 0
+        self.in_title = False
+        self.title_parts = []
+        self.head_closed = False
+        self.scripts = 0
+        self.in_script = False
+        self.in_noscript = False
+        self.head_done = False
+        self.analyzers = self.all_analyzers = [ANALYZERS[name](base_url) for name in analyzers]
+        self.reports_pending = bool(analyzers)
+        self.needs_body = needs_body(analyzers)
+        # Analyzers getting the events of each tag name, worked out on first sight of it
+        self.listeners = {}
+        self.head_end = 0.0
+        self.body_seconds = 0.0
+        # scan() state: whether it took over from HTMLParser, text held back and the raw text element it is in
+        self.scanning = False
+        self.pending = ""
+        self.raw_tag = None
+
+    def feed_bytes(self, data):
+        """Parse the next chunk of the body; return True when the rest of it is not needed"""
+        self.bytes_fed += len(data)
+        text = self.decoder.decode(data)
+        start = time.perf_counter()
+        if self.needs_body and not self.scanning:
+            match = None if self.head_closed else HEAD_END_TEXT_RE.search(text)
+            if match:
+                self.feed(text[:match.end()])
+                text = text[match.end():]
+            # Unless </head> was only text in a script
+            if self.head_closed or self.head_done:
+                self.scanning = True
+                self.pending, self.rawdata = self.rawdata, ""
+                self.raw_tag = self.cdata_elem
+        if self.scanning:
+            self.scan(text)
+        else:
+            self.feed(text)
+        if self.head_done:
+            self.body_seconds += time.perf_counter() - max(start, self.head_end)
+        # After </head> parsing goes on to the first body element (see start_element), however the chunks fall
+        if not self.head_done and self.bytes_fed >= MAX_HEAD_BYTES:
+            self.end_head()
+        if self.needs_body and self.bytes_fed >= MAX_DOCUMENT_BYTES:
+            self.done = True
+        return self.done
+
+    def _listeners(self, tag):
+        listeners = self.listeners.get(tag)
+        if listeners is None:
+            listeners = self.listeners[tag] = [
+                analyzer for analyzer in self.analyzers if analyzer.tags is None or tag in analyzer.tags
+            ]
+        return listeners
+
+    def scan(self, text):
+        """Tokenize body HTML for the analyzers, holding an incomplete tag back for the next chunk"""
+        text = self.pending + text
+        size = len(text)
+        pos = 0
+        while pos < size and not self.done:
+            if self.raw_tag is not None:
+                end = RAW_TEXT_END_RES[self.raw_tag].search(text, pos)
+                if end is None:
+                    break
+                if end.start() > pos:
+                    self.handle_data(text[pos:end.start()])
+                tag, self.raw_tag = self.raw_tag, None
+                self.handle_endtag(tag)
+                pos = end.end()
+                continue
+            lt = text.find("<", pos)
+            if lt == -1:
+                lt = size
+            if lt > pos:
+                data = text[pos:lt]
+                self.handle_data(unescape(data) if "&" in data else data)
+                pos = lt
+                continue
+            if text.startswith("<!--", pos):
+                end = text.find("-->", pos + 4)
+                if end == -1:
+                    break
+                pos = end + 3
+                continue
+            match = BODY_TAG_RE.match(text, pos)
+            if match is None:
+                end = text.find(">", pos)
+                if end == -1 or PARTIAL_TAG_RE.match(text, pos):
+                    break
+                if text[pos + 1:pos + 2] in ("!", "?"):
+                    # Doctype, CDATA section or processing instruction
+                    pos = end + 1
+                else:
+                    # A "<" that starts no tag is text
+                    self.handle_data("<")
+                    pos += 1
+                continue
+            closing, tag, rest = match.groups()
+            tag = tag.lower()
+            pos = match.end()
+            if closing:
+                self.handle_endtag(tag)
+                continue
+            attrs = {}
+            if rest.strip(" \t\n\r\f/"):
+                for name, double, single, bare in ATTR_RE.findall(rest):
+                    value = double or single or bare
+                    attrs.setdefault(name.lower(), unescape(value) if "&" in value else value)
+            self.start_element(tag, attrs)
+            if tag in RAW_TEXT_END_RES and not rest.endswith("/"):
+                self.raw_tag = tag
+        self.pending = text[pos:]
+
+    def handle_starttag(self, tag, attrs):
+        if not self.done:
+            self.start_element(tag, {name: value or "" for name, value in attrs})
+
+    def start_element(self, tag, attrs):
+        if self.analyzers:
+            # One clock reading per analyzer: each one's cost runs up to the next reading
+            start = time.perf_counter()
+            for analyzer in self._listeners(tag):
+                analyzer.start_tag(tag, attrs)
+                end = time.perf_counter()
+                analyzer.cost += end - start
+                start = end
+        if self.head_done:
+            return
+        if self.in_noscript and not self.head_closed:
+            # Fallback content in a head <noscript> (tracking pixels and the like) does not end the head
+            if tag not in HEAD_ELEMENTS:
+                return
+        elif tag not in HEAD_ELEMENTS:
+            if self.signals.js_hint is None and (
+                    attrs.get("id") in APP_ROOT_IDS or APP_ROOT_ATTRS.intersection(attrs)):
+                self.signals.js_hint = "the body starts with a JavaScript app container"
+            if tag == "body":
+                # Look on to the first element inside the body
+                self.head_closed = True
+            else:
+                self.end_head()
+            return
+        if self.head_closed:
+            return
+        if tag == "script":
+            self.scripts += 1
+            self.in_script = not attrs.get("src")
+        elif tag == "noscript":
+            self.in_noscript = True
+        elif tag == "meta":
+            if attrs.get("name", "").lower() in self.meta_names and _is_noindex(attrs.get("content", "")):
+                self.signals.noindex_source = "meta robots tag"
+        elif tag == "link":
+            rel = attrs.get("rel", "").lower().split()
+            href = attrs.get("href", "").strip()
+            if not href:
+                return
+            if "canonical" in rel and self.signals.canonical_source != "Link header":
+                self.signals.canonical = urljoin(self.base_url, href)
+                self.signals.canonical_source = "link rel=canonical"
+            elif "alternate" in rel and attrs.get("hreflang"):
+                self.signals.hreflang.append((attrs["hreflang"], urljoin(self.base_url, href)))
+        elif tag == "title" and self.signals.title is None:
+            self.in_title = True
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if self.analyzers and not self.done:
+            start = time.perf_counter()
+            for analyzer in self._listeners(tag):
+                analyzer.end_tag(tag)
+                end = time.perf_counter()
+                analyzer.cost += end - start
+                start = end
+        if tag == "title":
+            self.end_title()
+        elif tag == "script":
+            self.in_script = False
+        elif tag == "noscript":
+            self.in_noscript = False
+        elif tag == "head":
+            self.head_closed = True
+
+    def handle_data(self, data):
+        for analyzer in self.analyzers if not self.done else ():
+            if analyzer.capturing:
+                start = time.perf_counter()
+                analyzer.handle_data(data)
+                analyzer.cost += time.perf_counter() - start
+        if self.in_title and sum(map(len, self.title_parts)) < MAX_TITLE_LENGTH:
+            self.title_parts.append(data)
+        elif self.in_script and not self.done and self.signals.js_hint is None and JS_SIGNAL_RE.search(data):
+            self.signals.js_hint = "an inline script changes robots or canonical tags"
+
+    def end_title(self):
+        if self.in_title:
+            self.in_title = False
+            self.signals.title = " ".join("".join(self.title_parts).split())[:MAX_TITLE_LENGTH]
+
+    def end_head(self):
+        """Note the end of the head; parsing only goes on for analyzers that need the body"""
+        self.end_title()
+        if self.scripts and not self.signals.title and self.signals.js_hint is None:
+            self.signals.js_hint = "the page has scripts but no title in its HTML"
+        self.head_done = True
+        self.head_end = time.perf_counter()
+        self.head_cost = sum(analyzer.cost for analyzer in self.all_analyzers)
+        if self.needs_body:
+            # Head-only analyzers have seen all they need
+            self.analyzers = [analyzer for analyzer in self.analyzers if analyzer.needs_body]
+            self.listeners = {}
+        else:
+            self.done = True
+
+    def finish(self):
+        """Call at the end of the document (or when stopping early) to complete the signals"""
+        if not self.head_done:
+            self.end_head()
+        self.done = True
+        if self.reports_pending:
+            self.reports_pending = False
+            # Time parsing the body, less what the analyzers spent of it
+            body_parse = self.body_seconds - sum(analyzer.cost for analyzer in self.all_analyzers) + self.head_cost
+            reports = {}
+            costs = {}
+            for analyzer in self.all_analyzers:
+                start = time.perf_counter()
+                result = analyzer.result()
+                costs[analyzer.name] = analyzer.cost + time.perf_counter() - start
+                reports[analyzer.name] = result
+            if self.needs_body:
+                costs["body_parse"] = max(0.0, body_parse)
+            self.signals.reports = reports
+            self.signals.costs = costs
+
+
+def is_html(headers):
+    content_type = headers.get("content-type", "text/html").lower()
+    return "html" in content_type
+
+
+def signals_from_html(html, headers, base_url, agent, analyzers=()):
+    """Read indexing signals (and analyzer reports) from a whole HTML document, e.g. the DOM after rendering"""
+    signals = PageSignals()
+    read_header_signals(signals, headers, base_url, agent)
+    parser = HeadExtractor(signals, base_url, agent, analyzers=analyzers)
+    parser.feed_bytes(html.encode("utf-8"))
+    parser.finish()
+    return signals
+
+
+async def read_head(chunks, whole=False):
+    """Collect body chunks up to the first body element (or MAX_HEAD_BYTES)
+
+    With ``whole``, collect the whole document instead, up to MAX_DOCUMENT_BYTES.
+    """
+    head = bytearray()
+    # Where to look for the first body element, once the end of the head is found
+    scan_from = None
+    async for chunk in chunks:
+        if whole:
+            head += chunk
+            if len(head) >= MAX_DOCUMENT_BYTES:
+                break
+            continue
+        # Look back a little in case the closing tag straddles two chunks
+        start = max(0, len(head) - 8)
+        head += chunk
+        if len(head) >= MAX_HEAD_BYTES:
+            break
+        if scan_from is None:
+            match = HEAD_END_RE.search(head, start)
+            if match is None:
+                continue
+            scan_from = match.start()
+        # Up to the whole first body element, which tells whether the page is an app container
+        for match in START_TAG_RE.finditer(head, scan_from):
+            if match.group(1).lower() not in BODY_START_SKIPPED:
+                return head
+            scan_from = match.end()
+    return head
+
+
+async def extract_signals(response, agent, parser_pool=None, analyzers=()):
+    """Read indexing signals from a response, consuming only as much body as needed
+
+    With a ParserPool the head is downloaded here and parsed in a worker
+    process; otherwise it is parsed chunk by chunk as it arrives. The
+    named ``analyzers`` run on the same parse (see HeadExtractor).
+    """
+    trace = current_trace.get()
+    if trace is not None:
+        start = time.perf_counter()
+        body_before = trace.phases.get("body", 0.0)
+    signals = PageSignals()
+    read_header_signals(signals, response.headers, response.url, agent)
+    if not is_html(response.headers):
+        return signals
+
+    match = CHARSET_RE.search(response.headers.get("content-type", ""))
+    charset = match.group(1) if match else "utf-8"
+    chunks = response.iter_chunks()
+    try:
+        if parser_pool is not None:
+            head = await read_head(chunks, whole=needs_body(analyzers))
+        else:
+            parser = HeadExtractor(signals, response.url, agent, charset, analyzers)
+            async for chunk in chunks:
+                if parser.feed_bytes(chunk):
+                    break
+            parser.finish()
+    finally:
+        await chunks.aclose()
+    if parser_pool is not None:
+        signals = await parser_pool.parse(head, signals, response.url, agent, charset, analyzers)
+    if trace is not None:
+        # Waiting for chunks was already counted as body time
+        trace.since("parse", start + trace.phases.get("body", 0.0) - body_before)
+
+    # Read a short remainder so the connection can be reused
+    await response.discard_rest()
+    return signals
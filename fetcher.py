@@ -0,0 +1,414 @@
+"""Asyncio HTTP/1.1 client with pooled keep-alive connections and concurrency caps"""
+import asyncio
+import contextlib
+import socket
+import ssl
+import time
+import zlib
+from urllib.parse import urlsplit
+
+from politeness import host_key
+from timing import current_trace
+from user_agents import USER_AGENTS
+
+DEFAULT_USER_AGENT = USER_AGENTS["googlebot"]
+
+# Statuses that never carry a body
+NO_BODY_STATUSES = {204, 304}
+# Repeated headers joined by line breaks instead of commas, because each one is scoped on its own
+LINE_HEADERS = {"x-robots-tag"}
+
+
+class FetchError(Exception):
+    """Raised when a URL cannot be fetched (DNS, connect, timeout, bad response)"""
+
+
+class Connection:
+    """One TCP (or TLS) connection to a host"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.reused = False
+
+    def is_usable(self):
+        return not self.writer.is_closing() and not self.reader.at_eof()
+
+    def close(self):
+        self.writer.close()
+
+
+class ConnectionPool:
+    """Idle keep-alive connections, kept per (scheme, host, port)"""
+
+    def __init__(self, max_idle_per_host=8, connect_timeout=10.0):
+        self.max_idle_per_host = max_idle_per_host
+        self.connect_timeout = connect_timeout
+        self.idle = {}
+        # Loading the CA certificates takes tens of milliseconds, so only do it for https
+        self.ssl_context = None
+        self.connections_opened = 0
+
+    async def acquire(self, key):
+        """Return an idle connection for the host, or open a new one"""
+        idle = self.idle.get(key)
+        while idle:
+            conn = idle.pop()
+            if conn.is_usable():
+                conn.reused = True
+                return conn
+            conn.close()
+
+        scheme, host, port = key
+        try:
+            reader, writer = await asyncio.wait_for(self._open(scheme, host, port), self.connect_timeout)
+        except asyncio.TimeoutError:
+            raise FetchError(f"Connection to {host}:{port} timed out")
+        except (OSError, ssl.SSLError) as e:
+            raise FetchError(f"Cannot connect to {host}:{port}: {e}")
+        self.connections_opened += 1
+        return Connection(reader, writer)
+
+    async def _open(self, scheme, host, port):
+        """Resolve, connect and (for https) handshake as separate steps, so each can be timed"""
+        trace = current_trace.get()
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        addresses = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        if trace is not None:
+            trace.since("dns", start)
+            start = time.perf_counter()
+
+        error = OSError(f"No addresses found for {host}")
+        for family, kind, proto, _, address in addresses:
+            sock = socket.socket(family, kind, proto)
+            sock.setblocking(False)
+            try:
+                await loop.sock_connect(sock, address)
+                break
+            except OSError as e:
+                sock.close()
+                error = e
+            except BaseException:
+                sock.close()
+                raise
+        else:
+            raise error
+        if trace is not None:
+            trace.since("connect", start)
+            start = time.perf_counter()
+
+        if scheme == "https" and self.ssl_context is None:
+            self.ssl_context = ssl.create_default_context()
+        try:
+            streams = await asyncio.open_connection(
+                sock=sock,
+                ssl=self.ssl_context if scheme == "https" else None,
+                server_hostname=host if scheme == "https" else None,
+                limit=2 ** 20
+            )
+        except BaseException:
+            sock.close()
+            raise
+        if trace is not None and scheme == "https":
+            trace.since("tls", start)
+        return streams
+
+    def release(self, key, conn):
+        """Put a connection back for reuse, closing it if the pool is full"""
+        idle = self.idle.setdefault(key, [])
+        if len(idle) < self.max_idle_per_host and conn.is_usable():
+            idle.append(conn)
+        else:
+            conn.close()
+
+    def close(self):
+        for idle in self.idle.values():
+            for conn in idle:
+                conn.close()
+        self.idle.clear()
+
+
+class Response:
+    """Status and headers of a response whose body is read on demand"""
+
+    def __init__(self, url, method, status, reason, headers, conn, read_timeout):
+        self.url = url
+        self.method = method
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.conn = conn
+        self.read_timeout = read_timeout
+        self.body_complete = False
+        self.keep_alive = headers.get("connection", "").lower() != "close"
+        self.bytes_received = 0
+
+        if method == "HEAD" or status in NO_BODY_STATUSES or 100 <= status < 200:
+            self.body_complete = True
+            self.length = 0
+        else:
+            self.length = None
+            if "content-length" in headers:
+                try:
+                    self.length = int(headers["content-length"])
+                except ValueError:
+                    self.keep_alive = False
+            self.chunked = "chunked" in headers.get("transfer-encoding", "").lower()
+            if self.length is None and not self.chunked:
+                # Body ends when the server closes the connection
+                self.keep_alive = False
+
+        encoding = headers.get("content-encoding", "").lower()
+        if encoding == "gzip":
+            self.decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == "deflate":
+            self.decoder = zlib.decompressobj()
+        else:
+            self.decoder = None
+
+    async def _read(self, coro):
+        trace = current_trace.get()
+        start = time.perf_counter() if trace is not None else None
+        try:
+            return await asyncio.wait_for(coro, self.read_timeout)
+        except asyncio.TimeoutError:
+            raise FetchError(f"Timed out reading {self.url}")
+        except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+            raise FetchError(f"Connection error reading {self.url}: {e}")
+        finally:
+            if trace is not None:
+                trace.since("body", start)
+
+    async def _raw_chunks(self, size):
+        reader = self.conn.reader
+        if self.body_complete:
+            return
+        if self.length is not None:
+            remaining = self.length
+            while remaining > 0:
+                data = await self._read(reader.read(min(size, remaining)))
+                if not data:
+                    raise FetchError(f"Connection closed early while reading {self.url}")
+                remaining -= len(data)
+                self.bytes_received += len(data)
+                yield data
+        elif self.chunked:
+            while True:
+                line = await self._read(reader.readline())
+                self.bytes_received += len(line)
+                try:
+                    chunk_size = int(line.split(b";", 1)[0].strip(), 16)
+                except ValueError:
+                    raise FetchError(f"Malformed chunked body from {self.url}")
+                if chunk_size == 0:
+                    # Skip trailers up to the blank line
+                    while True:
+                        line = await self._read(reader.readline())
+                        if line in (b"\r\n", b"\n", b""):
+                            break
+                    break
+                data = await self._read(reader.readexactly(chunk_size + 2))
+                self.bytes_received += len(data)
+                yield data[:-2]
+        else:
+            while True:
+                data = await self._read(reader.read(size))
+                if not data:
+                    break
+                self.bytes_received += len(data)
+                yield data
+        self.body_complete = True
+
+    async def iter_chunks(self, size=65536):
+        """Yield the (decoded) body in chunks as it arrives"""
+        async for data in self._raw_chunks(size):
+            if self.decoder is not None:
+                try:
+                    data = self.decoder.decompress(data)
+                except zlib.error as e:
+                    raise FetchError(f"Cannot decode body of {self.url}: {e}")
+            if data:
+                yield data
+        if self.decoder is not None:
+            tail = self.decoder.flush()
+            if tail:
+                yield tail
+
+    async def read(self):
+        """Read and return the whole (decoded) body"""
+        chunks = []
+        async for data in self.iter_chunks():
+            chunks.append(data)
+        return b"".join(chunks)
+
+    async def discard_rest(self, limit=65536):
+        """Read and drop the rest of a Content-Length body if it is short
+
+        Returns whether the body is now complete, i.e. whether the
+        connection can go back to the pool instead of being closed.
+        """
+        if self.body_complete:
+            return True
+        if self.length is None:
+            return False
+        remaining = self.length - self.bytes_received
+        if remaining > limit:
+            return False
+        if remaining > 0:
+            await self._read(self.conn.reader.readexactly(remaining))
+            self.bytes_received += remaining
+        self.body_complete = True
+        return True
+
+    @property
+    def reusable(self):
+        return self.body_complete and self.keep_alive
+
+
+class AsyncFetcher:
+    """Fetch URLs over a shared connection pool
+
+    At most ``max_connections`` requests are in flight overall and at most
+    ``per_host`` against any single host; connections are kept alive and
+    reused between requests to the same host. With a ``politeness``
+    scheduler every request waits for its host's turn, and every response
+    status is reported back to it.
+    """
+
+    def __init__(self, max_connections=200, per_host=8, timeout=15.0, user_agent=DEFAULT_USER_AGENT,
+                 politeness=None):
+        self.max_connections = max_connections
+        self.per_host = per_host
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.politeness = politeness
+        self.pool = ConnectionPool(max_idle_per_host=per_host, connect_timeout=timeout)
+        self.global_slots = asyncio.Semaphore(max_connections)
+        self.host_slots = {}
+        self.requests_sent = 0
+        self.bytes_received = 0
+
+    def _host_slot(self, key):
+        slot = self.host_slots.get(key)
+        if slot is None:
+            slot = self.host_slots[key] = asyncio.Semaphore(self.per_host)
+        return slot
+
+    @staticmethod
+    def _split(url):
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ("http", "https"):
+            raise FetchError(f"Unsupported URL scheme: {parts.scheme}")
+        if not parts.hostname:
+            raise FetchError(f"URL has no host: {url}")
+        port = parts.port or (443 if scheme == "https" else 80)
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+        return (scheme, parts.hostname, port), parts.netloc, target
+
+    def _build_request(self, method, host_header, target, headers):
+        lines = [
+            f"{method} {target} HTTP/1.1",
+            f"Host: {host_header}",
+            f"User-Agent: {self.user_agent}",
+            "Accept: */*",
+            "Accept-Encoding: gzip, deflate",
+            "Connection: keep-alive",
+        ]
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _read_head(self, conn):
+        status_line = await asyncio.wait_for(conn.reader.readline(), self.timeout)
+        self.bytes_received += len(status_line)
+        if not status_line:
+            raise ConnectionResetError("Connection closed before response")
+        try:
+            _, status, reason = (status_line.decode("latin-1").rstrip("\r\n").split(" ", 2) + [""])[:3]
+            status = int(status)
+        except ValueError:
+            raise FetchError(f"Malformed status line: {status_line[:100]!r}")
+
+        headers = {}
+        while True:
+            line = await asyncio.wait_for(conn.reader.readline(), self.timeout)
+            self.bytes_received += len(line)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name = name.strip().lower()
+            value = value.strip()
+            if name in headers:
+                value = headers[name] + ("\n" if name in LINE_HEADERS else ", ") + value
+            headers[name] = value
+        return status, reason, headers
+
+    async def _send(self, key, request_bytes):
+        """Send a request, retrying once on a fresh connection if a reused one went stale"""
+        trace = current_trace.get()
+        while True:
+            conn = await self.pool.acquire(key)
+            start = time.perf_counter() if trace is not None else None
+            try:
+                conn.writer.write(request_bytes)
+                await conn.writer.drain()
+                status, reason, headers = await self._read_head(conn)
+                if trace is not None:
+                    trace.since("ttfb", start)
+                return conn, status, reason, headers
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                conn.close()
+                if not conn.reused:
+                    raise FetchError(f"Connection error: {e}")
+            except asyncio.TimeoutError:
+                conn.close()
+                raise FetchError("Timed out waiting for response")
+            except BaseException:
+                conn.close()
+                raise
+
+    @contextlib.asynccontextmanager
+    async def request(self, method, url, headers=None):
+        """Send a request and yield its Response; the body is read on demand
+
+        The connection goes back to the pool if the body was read completely,
+        otherwise it is closed when the block exits.
+        """
+        key, host_header, target = self._split(url)
+        request_bytes = self._build_request(method, host_header, target, headers)
+
+        trace = current_trace.get()
+        start = time.perf_counter() if trace is not None else None
+        # Paced by the same host key the engine queues URLs under
+        pace_key = host_key(url) if self.politeness is not None else None
+        if pace_key is not None:
+            await self.politeness.acquire(pace_key)
+        async with self._host_slot(key), self.global_slots:
+            if trace is not None:
+                trace.since("wait", start)
+            conn, status, reason, response_headers = await self._send(key, request_bytes)
+            self.requests_sent += 1
+            if pace_key is not None:
+                self.politeness.observe(pace_key, status, response_headers)
+            response = Response(url, method, status, reason, response_headers, conn, self.timeout)
+            try:
+                yield response
+            finally:
+                self.bytes_received += response.bytes_received
+                if response.reusable:
+                    self.pool.release(key, conn)
+                else:
+                    conn.close()
+
+    async def fetch(self, url, method="GET", headers=None):
+        """Fetch a URL and return its Response with the whole body in ``body``"""
+        async with self.request(method, url, headers) as response:
+            response.body = await response.read()
+        return response
+
+    def close(self):
+        self.pool.close()
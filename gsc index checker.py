@@ -1,12 +1,12 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
-import requests
-from bs4 import BeautifulSoup
-import threading
-from urllib.parse import urlparse, quote
-import time
-from fake_useragent import UserAgent
-import webbrowser
+from tkinter import ttk, messagebox, filedialog
+from urllib.parse import quote
+import os
+from engine import InspectionEngine
+from results_view import ResultsTable
+from timing import PHASES
+from urlnorm import normalize_url
+from renderer import require_playwright
 
 class GSCInspector:
     def __init__(self, root):
@@ -15,8 +15,17 @@ class GSCInspector:
         self.root.geometry("1100x800")
         self.root.minsize(1000, 700)
         
-        # User agent generator
-        self.ua = UserAgent()
+        # Headless inspection engine (shared with the command line tool)
+        # Results are cached so re-inspecting a URL within the hour is instant
+        # Phase timings feed the Timing tab, analyzer reports the Enhancements and Mobile Usability tabs
+        self.engine = InspectionEngine(
+            cache_path=os.path.join(os.path.expanduser("~"), ".gsc_inspector", "results.db"),
+            cache_max_age=3600,
+            timings=True,
+            analyzers=("all",)
+        )
+        # Close the engine with the window, so cached results are written and its threads stop
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         # Configure styles
         self.style = ttk.Style()
@@ -29,7 +38,6 @@ class GSCInspector:
         self.style.configure("Info.TLabel", foreground="blue")
         
         self.create_widgets()
-        self.running = False
         
     def create_widgets(self):
         # Main frame
@@ -66,7 +74,19 @@ class GSCInspector:
         inspect_button.pack(side=tk.LEFT, padx=(0, 5))
         
         clear_button = ttk.Button(url_frame, text="Clear", command=self.clear_all)
-        clear_button.pack(side=tk.LEFT)
+        clear_button.pack(side=tk.LEFT, padx=(0, 5))
+        
+        bulk_file_button = ttk.Button(url_frame, text="Bulk from file...", command=self.start_bulk_from_file)
+        bulk_file_button.pack(side=tk.LEFT, padx=(0, 5))
+        
+        bulk_sitemap_button = ttk.Button(url_frame, text="Inspect sitemap", command=self.start_bulk_from_sitemap)
+        bulk_sitemap_button.pack(side=tk.LEFT)
+        
+        # Pages whose HTML hints at JavaScript-set signals are rendered in headless Chromium
+        self.render_var = tk.BooleanVar(value=False)
+        render_check = ttk.Checkbutton(url_frame, text="Render JavaScript", variable=self.render_var,
+                                       command=self.toggle_rendering)
+        render_check.pack(side=tk.LEFT, padx=(5, 0))
         
         # Results notebook (tabbed interface)
         self.results_notebook = ttk.Notebook(main_frame)
@@ -77,15 +97,29 @@ class GSCInspector:
         self.results_notebook.add(self.coverage_frame, text="Coverage")
         self.create_coverage_tab()
         
-        # Enhancements tab
+        # Bulk results tab
+        self.bulk_frame = ttk.Frame(self.results_notebook)
+        self.results_notebook.add(self.bulk_frame, text="Bulk results")
+        self.create_bulk_tab()
+        
+        # Timing tab
+        self.timing_frame = ttk.Frame(self.results_notebook)
+        self.results_notebook.add(self.timing_frame, text="Timing")
+        self.create_timing_tab()
+        
+        # Enhancements and Mobile Usability tabs, built when first opened
+        self.shown_reports = None
+        self.enhancements_tree = None
+        self.mobile_tree = None
         self.enhancements_frame = ttk.Frame(self.results_notebook)
         self.results_notebook.add(self.enhancements_frame, text="Enhancements")
-        self.create_enhancements_tab()
-        
-        # Mobile Usability tab
         self.mobile_frame = ttk.Frame(self.results_notebook)
         self.results_notebook.add(self.mobile_frame, text="Mobile Usability")
-        self.create_mobile_tab()
+        self.deferred_tabs = {
+            str(self.enhancements_frame): self.create_enhancements_tab,
+            str(self.mobile_frame): self.create_mobile_tab,
+        }
+        self.results_notebook.bind("<<NotebookTabChanged>>", self.build_deferred_tab)
         
         # Status bar
         self.status_var = tk.StringVar()
@@ -213,27 +247,164 @@ class GSCInspector:
         )
         gsc_button.pack(pady=5)
     
+    def create_bulk_tab(self):
+        """Create the bulk results tab with a virtualized results table"""
+        self.bulk_run = None
+        
+        controls_frame = ttk.Frame(self.bulk_frame, padding=(0, 10, 0, 5))
+        controls_frame.pack(fill=tk.X)
+        
+        ttk.Label(
+            controls_frame,
+            text="Double-click a row to open it in the Coverage tab",
+            style="Info.TLabel"
+        ).pack(side=tk.LEFT)
+        
+        stop_button = ttk.Button(controls_frame, text="Stop", command=self.stop_bulk)
+        stop_button.pack(side=tk.RIGHT)
+        
+        self.results_table = ResultsTable(self.bulk_frame, on_open=self.open_bulk_result)
+        self.results_table.pack(fill=tk.BOTH, expand=True)
+    
+    def create_timing_tab(self):
+        """Create the timing tab: per-phase times of the shown URL and of the whole session"""
+        ttk.Label(
+            self.timing_frame,
+            text="Time spent per phase (ms) for the URL shown in the Coverage tab, "
+                 "and percentiles over all inspections so far",
+            style="Info.TLabel"
+        ).pack(anchor=tk.W, pady=(10, 5))
+        
+        columns = ("phase", "this_url", "count", "p50", "p95", "p99")
+        headings = ("Phase", "This URL", "Inspections", "p50", "p95", "p99")
+        self.timing_tree = ttk.Treeview(self.timing_frame, columns=columns, show="headings", height=len(PHASES))
+        for column, heading in zip(columns, headings):
+            self.timing_tree.heading(column, text=heading)
+            self.timing_tree.column(column, width=120, anchor=tk.W if column == "phase" else tk.E)
+        self.timing_tree.pack(fill=tk.X)
+        for phase in PHASES:
+            self.timing_tree.insert("", tk.END, iid=phase, values=(phase, "-", 0, "-", "-", "-"))
+        
+        self.shown_timings = None
+    
+    def update_timing(self, timings=None):
+        """Refresh the timing tab, optionally showing a new URL's own timings"""
+        if timings is not None:
+            self.shown_timings = timings
+        summary = {row["phase"]: row for row in self.engine.timing_stats.summary()}
+        for phase in PHASES:
+            own = (self.shown_timings or {}).get(phase)
+            row = summary.get(phase)
+            self.timing_tree.item(phase, values=(
+                phase,
+                "-" if own is None else f"{own * 1000:.1f}",
+                row["count"] if row else 0,
+                *(f"{row[column] * 1000:.1f}" if row else "-" for column in ("p50", "p95", "p99"))
+            ))
+    
+    def build_deferred_tab(self, event=None):
+        """Build the selected tab's widgets if this is the first time it is opened"""
+        create = self.deferred_tabs.pop(self.results_notebook.select(), None)
+        if create is not None:
+            create()
+    
+    def create_report_tree(self, frame, headings):
+        """A table of report rows with a summary line above it; returns (summary variable, tree)"""
+        summary_var = tk.StringVar()
+        ttk.Label(frame, textvariable=summary_var, font=('Arial', 11, 'bold')).pack(anchor=tk.W, pady=(10, 5))
+        columns = tuple(f"c{n}" for n in range(len(headings)))
+        tree = ttk.Treeview(frame, columns=columns, show="headings", height=12)
+        for column, (heading, width) in zip(columns, headings):
+            tree.heading(column, text=heading)
+            tree.column(column, width=width, anchor=tk.W)
+        tree.pack(fill=tk.BOTH, expand=True)
+        return summary_var, tree
+    
     def create_enhancements_tab(self):
-        """Create empty enhancements tab"""
-        label = ttk.Label(
-            self.enhancements_frame, 
-            text="This tool currently focuses on indexing status.\n\n"
-                 "Future versions may include enhancements analysis like:\n"
-                 "- Schema markup detection\n- Breadcrumbs check\n- AMP validation",
-            justify=tk.CENTER
+        """Create the enhancements tab: rich results, structured data and AMP of the shown URL"""
+        self.enhancements_var, self.enhancements_tree = self.create_report_tree(
+            self.enhancements_frame, (("Enhancement", 180), ("Valid", 70), ("Invalid", 70), ("Details", 560))
         )
-        label.pack(pady=50)
+        self.fill_enhancements_tab()
     
     def create_mobile_tab(self):
-        """Create empty mobile usability tab"""
-        label = ttk.Label(
-            self.mobile_frame, 
-            text="This tool currently focuses on indexing status.\n\n"
-                 "Future versions may include mobile usability checks like:\n"
-                 "- Viewport configuration\n- Tap target sizing\n- Font sizing",
-            justify=tk.CENTER
+        """Create the mobile usability tab: the mobile checks of the shown URL"""
+        self.mobile_var, self.mobile_tree = self.create_report_tree(
+            self.mobile_frame, (("Check", 180), ("Result", 140), ("Details", 560))
+        )
+        self.fill_mobile_tab()
+    
+    def update_reports(self, reports):
+        """Show a URL's analyzer reports (None if it was not analyzed) in the tabs built so far"""
+        self.shown_reports = reports
+        if self.enhancements_tree is not None:
+            self.fill_enhancements_tab()
+        if self.mobile_tree is not None:
+            self.fill_mobile_tab()
+    
+    def fill_enhancements_tab(self):
+        tree = self.enhancements_tree
+        tree.delete(*tree.get_children())
+        reports = self.shown_reports
+        if reports is None:
+            self.enhancements_var.set("No enhancements data: inspect an HTML page first")
+            return
+        data = reports.get("structured_data") or {"types": [], "rich_results": {}, "issues": []}
+        for label, counts in sorted(data["rich_results"].items()):
+            details = f"Missing: {', '.join(counts['missing'])}" if counts["missing"] else "All required properties present"
+            tree.insert("", tk.END, values=(label, counts["valid"], counts["invalid"], details))
+        for issue in data["issues"]:
+            if "JSON-LD" in issue:
+                tree.insert("", tk.END, values=("Structured data", "", "", issue))
+        amp = reports.get("amp")
+        if amp:
+            details = "; ".join(amp["issues"]) or ("This page is an AMP page" if amp["is_amp"] else f"AMP version: {amp['amphtml']}")
+            tree.insert("", tk.END, values=("AMP", "", "1" if amp["issues"] else "", details))
+        if data["types"]:
+            tree.insert("", tk.END, values=("Schema.org types", "", "", ", ".join(data["types"])))
+        invalid = sum(counts["invalid"] for counts in data["rich_results"].values())
+        if not tree.get_children():
+            self.enhancements_var.set("No enhancements detected on this page")
+        elif invalid or data["issues"] or (amp and amp["issues"]):
+            self.enhancements_var.set("Some enhancements have issues")
+        else:
+            self.enhancements_var.set("All detected enhancements are valid")
+    
+    def fill_mobile_tab(self):
+        tree = self.mobile_tree
+        tree.delete(*tree.get_children())
+        reports = self.shown_reports
+        if reports is None:
+            self.mobile_var.set("No mobile usability data: inspect an HTML page first")
+            return
+        checks = (
+            ("viewport", "Viewport", lambda r: f"content=\"{r['content']}\"" if r["content"] else "No viewport meta tag"),
+            ("font_size", "Font size", lambda r: f"{r['small']} font sizes under 12px, smallest {r['smallest_px']:g}px"
+                if r["small"] else "No font sizes under 12px"),
+            ("tap_targets", "Tap targets", lambda r: f"{r['targets']} tap targets, {r['small']} smaller than 48px, "
+                                                     f"{r['crowded']} links right next to another"),
+            ("content_width", "Content width", lambda r: f"{r['wide']} elements wider than a phone screen, "
+                                                         f"widest {r['widest_px']:g}px" if r["wide"] else "Fits a phone screen"),
         )
-        label.pack(pady=50)
+        issues = 0
+        for name, label, describe in checks:
+            result = reports.get(name)
+            if result is None:
+                continue
+            issues += len(result["issues"])
+            tree.insert("", tk.END, values=(label, "; ".join(result["issues"]) or "OK", describe(result)))
+        self.mobile_var.set("Page is not mobile friendly" if issues else "Page is mobile friendly")
+    
+    def toggle_rendering(self):
+        """Switch JavaScript rendering on or off for the next inspections"""
+        if self.render_var.get():
+            try:
+                require_playwright()
+            except ImportError as e:
+                self.render_var.set(False)
+                messagebox.showwarning("Rendering unavailable", str(e))
+                return
+        self.engine.render = self.render_var.get()
     
     def start_inspection(self):
         """Start URL inspection"""
@@ -242,10 +413,6 @@ class GSCInspector:
             messagebox.showwarning("Warning", "Please enter a URL to inspect")
             return
         
-        if self.running:
-            return
-            
-        self.running = True
         self.status_var.set(f"Checking: {url}")
         
         # Reset UI
@@ -262,130 +429,108 @@ class GSCInspector:
         self.troubleshoot_text.insert("1.0", f"Running inspection for: {url}\n\nPlease wait...")
         self.troubleshoot_text.config(state=tk.DISABLED)
         
-        # Start inspection in separate thread
-        threading.Thread(target=self.inspect_url, args=(url,), daemon=True).start()
+        # Run the inspection on the engine's event loop
+        future = self.engine.submit(url)
+        future.add_done_callback(lambda f: self.root.after(0, self.inspection_done, f))
     
-    def inspect_url(self, url):
-        """Main inspection logic"""
+    def inspection_done(self, future):
+        """Show the outcome of a finished inspection (runs on the Tk thread)"""
         try:
-            # Normalize URL
-            if not url.startswith(('http://', 'https://')):
-                url = 'https://' + url
-            
-            parsed = urlparse(url)
-            if not parsed.netloc:
-                raise ValueError("Invalid URL format - missing domain")
-            
-            # Simulate checking different aspects
-            time.sleep(1)  # Simulate delay
-            
-            # Check indexing status (simulated)
-            is_indexed = self.check_google_index(url)
-            
-            # Update UI with results
-            self.root.after(0, self.update_results, url, is_indexed)
-            
+            results = future.result().to_dict()
+            self.update_results(results["url"], results)
+            self.update_timing(results.get("timings", {}))
+            if results.get("cache") == "fresh":
+                self.status_var.set(f"Inspection complete (cached result, crawled {results['crawl_date']})")
+            elif results.get("cache") == "revalidated":
+                self.status_var.set("Inspection complete (page unchanged since last inspection)")
+            else:
+                self.status_var.set("Inspection complete")
         except Exception as e:
-            self.root.after(0, self.show_error, str(e))
-        finally:
-            self.running = False
-            self.root.after(0, lambda: self.status_var.set("Inspection complete"))
+            self.show_error(str(e))
+            self.status_var.set("Inspection complete")
+    
+    def start_bulk_from_file(self):
+        """Inspect every URL listed in a text file"""
+        path = filedialog.askopenfilename(
+            title="Select a file with one URL per line",
+            filetypes=[("Text files", "*.txt"), ("All files", "*.*")]
+        )
+        if not path:
+            return
+        
+        def read_urls():
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        yield line
+        
+        self.start_bulk(read_urls(), f"Bulk inspecting URLs from {os.path.basename(path)}")
     
-    def check_google_index(self, url):
-        """Check if URL is indexed (simulated)"""
-        # In a real implementation, this would actually check Google
-        # Here we simulate different possible outcomes
-        
-        # Randomly determine status for demo purposes
-        import random
-        status = random.choice([
-            "indexed", 
-            "not_indexed_robots", 
-            "not_indexed_noindex", 
-            "not_indexed_404",
-            "not_indexed_other"
-        ])
-        
-        if status == "indexed":
-            return {
-                "indexing_status": "URL is on Google",
-                "status_style": "Success.TLabel",
-                "crawl_date": self.get_random_date(),
-                "rendered": "Successfully rendered",
-                "robots": "Allowed by robots.txt",
-                "canonical": "Self-referential canonical",
-                "indexing_allowed": "Yes",
-                "noindex": "No",
-                "troubleshooting": "No issues detected. This URL is properly indexed by Google."
-            }
-        elif status == "not_indexed_robots":
-            return {
-                "indexing_status": "URL is not on Google: Blocked by robots.txt",
-                "status_style": "Error.TLabel",
-                "crawl_date": "Not crawled",
-                "rendered": "Not rendered",
-                "robots": "Blocked by robots.txt",
-                "canonical": "Not available",
-                "indexing_allowed": "No",
-                "noindex": "Not applicable",
-                "troubleshooting": "Troubleshooting:\n\n"
-                                  "• This URL is blocked by robots.txt\n"
-                                  "• Googlebot cannot crawl this page\n"
-                                  "• Solution: Update your robots.txt file to allow access"
-            }
-        elif status == "not_indexed_noindex":
-            return {
-                "indexing_status": "URL is not on Google: Noindex tag detected",
-                "status_style": "Warning.TLabel",
-                "crawl_date": self.get_random_date(),
-                "rendered": "Rendered but not indexed",
-                "robots": "Allowed by robots.txt",
-                "canonical": "Self-referential canonical",
-                "indexing_allowed": "No",
-                "noindex": "Yes",
-                "troubleshooting": "Troubleshooting:\n\n"
-                                  "• This page has a 'noindex' directive\n"
-                                  "• Google found the page but was told not to index it\n"
-                                  "• Solution: Remove noindex meta tag if you want it indexed"
-            }
-        elif status == "not_indexed_404":
-            return {
-                "indexing_status": "URL is not on Google: Page not found (404)",
-                "status_style": "Error.TLabel",
-                "crawl_date": self.get_random_date(),
-                "rendered": "Error during rendering",
-                "robots": "Allowed by robots.txt",
-                "canonical": "Not available",
-                "indexing_allowed": "No",
-                "noindex": "Not applicable",
-                "troubleshooting": "Troubleshooting:\n\n"
-                                  "• This URL returns a 404 (Not Found) error\n"
-                                  "• The page may have been moved or deleted\n"
-                                  "• Solution: Fix the URL or implement a proper redirect"
-            }
+    def start_bulk_from_sitemap(self):
+        """Inspect every URL listed in the sitemap (or sitemap index) entered above"""
+        url = self.url_var.get().strip()
+        if not url:
+            messagebox.showwarning("Warning", "Please enter a sitemap URL to inspect")
+            return
+        
+        try:
+            url = normalize_url(url)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        
+        self.start_bulk(self.engine.sitemap_urls([url]), f"Bulk inspecting sitemap: {url}")
+    
+    def start_bulk(self, urls, message):
+        """Stream a bulk inspection into the results table"""
+        self.stop_bulk()
+        self.results_table.clear()
+        self.results_notebook.select(self.bulk_frame)
+        self.status_var.set(message)
+        
+        self.bulk_run = self.engine.submit_many(urls, self.results_table.add)
+        self.bulk_run.add_done_callback(lambda f: self.root.after(0, self.bulk_done, f))
+        self.refresh_bulk_timing(self.bulk_run)
+    
+    def refresh_bulk_timing(self, run):
+        """Keep the session percentiles in the timing tab current while a bulk run goes on"""
+        self.update_timing()
+        if not run.done():
+            self.root.after(1000, self.refresh_bulk_timing, run)
+    
+    def stop_bulk(self):
+        """Stop the running bulk inspection, if any"""
+        if self.bulk_run is not None and not self.bulk_run.done():
+            self.bulk_run.cancel()
+    
+    def on_close(self):
+        """Stop inspecting, close the engine and the window"""
+        self.stop_bulk()
+        self.engine.close()
+        self.root.destroy()
+    
+    def bulk_done(self, future):
+        """Report how a bulk inspection ended (runs on the Tk thread)"""
+        if future is not self.bulk_run:
+            return
+        if future.cancelled():
+            self.status_var.set("Bulk inspection stopped")
+        elif future.exception() is not None:
+            self.status_var.set(f"Bulk inspection failed: {future.exception()}")
         else:
-            return {
-                "indexing_status": "URL is not on Google: Discovered - currently not indexed",
-                "status_style": "Warning.TLabel",
-                "crawl_date": "Not crawled yet",
-                "rendered": "Not rendered",
-                "robots": "Allowed by robots.txt",
-                "canonical": "Not available",
-                "indexing_allowed": "Yes",
-                "noindex": "No",
-                "troubleshooting": "Troubleshooting:\n\n"
-                                  "• Google has discovered this URL but hasn't crawled it yet\n"
-                                  "• This is common for new or low-priority pages\n"
-                                  "• Solution: Request indexing in GSC or improve internal linking"
-            }
+            self.status_var.set("Bulk inspection complete")
     
-    def get_random_date(self):
-        """Generate a random recent date for simulation"""
-        import random
-        from datetime import datetime, timedelta
-        days_ago = random.randint(1, 30)
-        date = datetime.now() - timedelta(days=days_ago)
-        return date.strftime("%Y-%m-%d %H:%M:%S")
+    def open_bulk_result(self, record):
+        """Show a row of the bulk results table in the Coverage tab"""
+        results = record.to_dict()
+        self.url_var.set(results["url"])
+        self.update_timing(results.get("timings", {}))
+        if "error" in results:
+            self.show_error(results["error"])
+            self.results_notebook.select(self.coverage_frame)
+        else:
+            self.update_results(results["url"], results)
     
     def update_results(self, url, results):
         """Update UI with inspection results"""
@@ -424,11 +569,13 @@ class GSCInspector:
         self.troubleshoot_text.insert(tk.END, results["troubleshooting"])
         
         # Add footer
-        self.troubleshoot_text.insert(tk.END, "\n\nNote: This is a simulated inspection. For accurate results, use Google Search Console.", "footer")
+        self.troubleshoot_text.insert(tk.END, "\n\nNote: This is a live test of the URL. For Google's actual index status, use Google Search Console.", "footer")
         self.troubleshoot_text.tag_configure("footer", font=('Arial', 9), foreground="gray")
         
         self.troubleshoot_text.config(state=tk.DISABLED)
         
+        self.update_reports(results.get("reports"))
+        
         # Switch to coverage tab
         self.results_notebook.select(self.coverage_frame)
     
@@ -446,6 +593,7 @@ class GSCInspector:
         self.troubleshoot_text.delete("1.0", tk.END)
         self.troubleshoot_text.insert("1.0", f"Inspection failed:\n\n{error_msg}\n\nPlease check the URL and try again.")
         self.troubleshoot_text.config(state=tk.DISABLED)
+        self.update_reports(None)
         
         self.style.configure("Status.TLabel", foreground="red")
     
@@ -456,10 +604,14 @@ class GSCInspector:
             messagebox.showwarning("Warning", "No URL to open in GSC")
             return
         
-        if not url.startswith(('http://', 'https://')):
-            url = 'https://' + url
+        try:
+            url = normalize_url(url)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
         
         gsc_url = f"https://search.google.com/search-console/inspect?resource_id={quote(url)}"
+        import webbrowser
         webbrowser.open(gsc_url)
     
     def clear_all(self):
@@ -477,6 +629,7 @@ class GSCInspector:
         self.troubleshoot_text.delete("1.0", tk.END)
         self.troubleshoot_text.insert("1.0", "Inspection results will appear here")
         self.troubleshoot_text.config(state=tk.DISABLED)
+        self.update_reports(None)
         
         self.status_var.set("Ready to inspect URLs")
 
@@ -0,0 +1,222 @@
+"""Incremental re-inspection: recheck only new, changed or due URLs and report what changed"""
+import heapq
+import time
+from datetime import datetime, timezone
+from itertools import islice
+
+from urlnorm import normalize_url
+from records import EXPORT_COLUMNS
+from result_cache import ResultCache
+
+DAY = 24 * 3600
+
+# Priority score boosts, added to how overdue a URL is (1.0 = just due)
+NEW_SCORE = 10.0
+LASTMOD_SCORE = 5.0
+# Per error in a row, counting at most MAX_ERROR_STRIKES of them
+ERROR_SCORE = 2.0
+MAX_ERROR_STRIKES = 3
+# Sitemap <priority> assumed when a URL has none
+DEFAULT_IMPORTANCE = 0.5
+
+# Export columns compared between the previous and the new result
+CHANGE_FIELDS = (
+    "verdict", "http_status", "robots", "noindex", "canonical", "canonical_url", "title",
+    "final_url", "final_status", "redirect_hops", "redirect_error",
+)
+
+# Columns of the status change report
+DIFF_COLUMNS = [
+    "url", "change", "changed_fields", "verdict_before", "verdict", "http_status_before", "http_status",
+    "canonical_url_before", "canonical_url", "title_before", "title", "final_url_before", "final_url",
+    "crawl_time",
+]
+
+
+def parse_lastmod(text):
+    """A sitemap <lastmod> (W3C datetime) as a Unix timestamp, or None"""
+    if not text:
+        return None
+    try:
+        moment = datetime.fromisoformat(text.strip())
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def parse_priority(text):
+    """A sitemap <priority> as a float between 0 and 1, or None"""
+    try:
+        return min(1.0, max(0.0, float(text)))
+    except (TypeError, ValueError):
+        return None
+
+
+class StatusChange:
+    """A URL whose inspection result differs from the previous run's"""
+
+    __slots__ = ("before", "after", "fields")
+
+    def __init__(self, before, after, fields):
+        self.before = before
+        self.after = after
+        self.fields = fields
+
+    @property
+    def url(self):
+        return self.after.url
+
+    @property
+    def change(self):
+        return "new" if self.before is None else "changed"
+
+    def export_row(self):
+        """Values for DIFF_COLUMNS"""
+        after = dict(zip(EXPORT_COLUMNS, self.after.export_row()))
+        before = dict(zip(EXPORT_COLUMNS, self.before.export_row())) if self.before is not None else {}
+        return [
+            self.url,
+            self.change,
+            ",".join(self.fields),
+            before.get("verdict"), after["verdict"],
+            before.get("http_status"), after["http_status"],
+            before.get("canonical_url"), after["canonical_url"],
+            before.get("title"), after["title"],
+            before.get("final_url"), after["final_url"],
+            after["crawl_time"],
+        ]
+
+
+def compare(before, after):
+    """Return the StatusChange between two records of a URL, or None if nothing changed"""
+    if before is None:
+        return StatusChange(None, after, ())
+    old = dict(zip(EXPORT_COLUMNS, before.export_row()))
+    new = dict(zip(EXPORT_COLUMNS, after.export_row()))
+    fields = [name for name in CHANGE_FIELDS if old[name] != new[name]]
+    if before.hreflang != after.hreflang:
+        fields.append("hreflang")
+    return StatusChange(before, after, tuple(fields)) if fields else None
+
+
+class IncrementalAudit:
+    """Re-inspect only the URLs that need it and report status changes
+
+    A URL is due when it was never inspected, when its sitemap lastmod
+    is newer than its last check, when its last check ended in an error
+    verdict, or once its revisit interval has passed. The interval starts
+    at ``min_interval`` seconds after a change and doubles with every
+    check that finds the result unchanged (same content hash, or a 304),
+    up to ``max_interval``. Due URLs are inspected highest priority score
+    first (new, then lastmod changes, past errors and the most overdue,
+    plus sitemap priority), at most ``budget`` of them per run.
+
+    State is kept in the engine's result cache, so the engine needs a
+    cache_path, and a cache_max_age of 0 so that due URLs are revalidated
+    instead of answered from the cache.
+    """
+
+    def __init__(self, engine, min_interval=DAY, max_interval=30 * DAY, budget=None):
+        if engine.cache_path is None:
+            raise ValueError("Incremental runs need a result cache to keep their state in")
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError("Revisit intervals must be positive, the longest one no shorter than the shortest")
+        self.engine = engine
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.budget = budget
+        # Previous record of every planned URL (None for new ones)
+        self.previous = {}
+        self.counts = {"urls": 0, "new": 0, "lastmod": 0, "errors": 0, "overdue": 0, "skipped": 0,
+                       "over_budget": 0, "changed": 0}
+
+    def interval(self, state):
+        """Seconds until a URL checked before is due again"""
+        return min(self.max_interval, self.min_interval * 2 ** min(state.stable, 30))
+
+    def score(self, state, lastmod, importance, now):
+        """Return (priority score, reason) for a due URL, or None if it can wait"""
+        if state is None:
+            return NEW_SCORE + importance, "new"
+        overdue = (now - state.checked_at) / self.interval(state)
+        if lastmod is not None and lastmod > state.checked_at:
+            return LASTMOD_SCORE + overdue + importance, "lastmod"
+        if state.failures:
+            return ERROR_SCORE * min(state.failures, MAX_ERROR_STRIKES) + overdue + importance, "errors"
+        if overdue >= 1:
+            return overdue + importance, "overdue"
+        return None
+
+    def plan(self, entries):
+        """Return the URLs to inspect this run, highest priority first
+
+        ``entries`` yields URLs or (url, lastmod, priority) tuples as
+        sitemap_entries() does; only the due URLs are kept in memory.
+        """
+        cache = ResultCache(self.engine.cache_path)
+        try:
+            due = []
+            entries = iter(entries)
+            now = time.time()
+            while True:
+                batch = []
+                for entry in islice(entries, 500):
+                    url, lastmod, priority = (entry, None, None) if isinstance(entry, str) else entry
+                    try:
+                        url = normalize_url(url)
+                    except ValueError:
+                        # Inspected anyway, so the run reports it as failed
+                        url = url.strip()
+                    importance = parse_priority(priority)
+                    batch.append((url, parse_lastmod(lastmod),
+                                  DEFAULT_IMPORTANCE if importance is None else importance))
+                if not batch:
+                    break
+                states = cache.schedule_states(url for url, _, _ in batch)
+                for url, lastmod, importance in batch:
+                    self.counts["urls"] += 1
+                    if url in self.previous:
+                        continue
+                    scored = self.score(states.get(url), lastmod, importance, now)
+                    if scored is None:
+                        self.counts["skipped"] += 1
+                        continue
+                    score, reason = scored
+                    self.counts[reason] += 1
+                    self.previous[url] = url in states
+                    due.append((-score, len(due), url))
+
+            if self.budget is not None and len(due) > self.budget:
+                kept = heapq.nsmallest(self.budget, due)
+                self.counts["over_budget"] = len(due) - len(kept)
+                for _, _, url in set(due) - set(kept):
+                    del self.previous[url]
+                due = kept
+            else:
+                due.sort()
+
+            for url, known in self.previous.items():
+                cached = cache.get(url) if known else None
+                self.previous[url] = cached.result if cached is not None else None
+        finally:
+            cache.close()
+        return [url for _, _, url in due]
+
+    def run(self, due):
+        """Inspect the planned URLs, yielding a StatusChange for every result that changed"""
+        for record in self.engine.inspect_many(due):
+            change = compare(self.previous.pop(record.url, None), record)
+            if change is not None:
+                self.counts["changed"] += 1
+                yield change
+
+    def summary(self):
+        counts = self.counts
+        due = counts["new"] + counts["lastmod"] + counts["errors"] + counts["overdue"]
+        text = (f"{counts['urls']} URLs, {due} due ({counts['new']} new, {counts['lastmod']} changed in the sitemap, "
+                f"{counts['errors']} with past errors, {counts['overdue']} overdue), {counts['skipped']} skipped")
+        if counts["over_budget"]:
+            text += f", {counts['over_budget']} left for later runs"
+        return text + f"; {counts['changed']} status changes"
@@ -0,0 +1,78 @@
+"""Process pool that parses page heads on other cores"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from analyzers import MAX_DOCUMENT_BYTES
+from extractor import HeadExtractor, MAX_HEAD_BYTES
+
+# Heads that may be waiting for or inside a worker at once, per worker
+SLOTS_PER_WORKER = 4
+
+# Shared memory blocks attached in this worker process, by name
+_attached = {}
+
+
+def _parse_slot(shm_name, offset, length, signals, base_url, agent, charset, analyzers):
+    """Parse a head stored in shared memory (runs in a worker process)"""
+    shm = _attached.get(shm_name)
+    if shm is None:
+        shm = _attached[shm_name] = shared_memory.SharedMemory(name=shm_name)
+    view = shm.buf[offset:offset + length]
+    try:
+        parser = HeadExtractor(signals, base_url, agent, charset, analyzers)
+        parser.feed_bytes(view)
+        parser.finish()
+    finally:
+        view.release()
+    return signals
+
+
+class ParserPool:
+    """Parse page heads in ``workers`` processes
+
+    The event loop only downloads; each head is copied into a slot of one
+    shared memory block and the worker reads it from there, so page bytes
+    are never pickled; only the small PageSignals travel back and forth.
+    When every slot is busy, parse() waits, which holds back downloads
+    instead of letting heads pile up in memory. With ``whole_documents``
+    the slots are big enough for analyzers that read the body.
+    """
+
+    def __init__(self, workers=None, whole_documents=False):
+        self.workers = workers or os.cpu_count() or 1
+        self.slots = self.workers * SLOTS_PER_WORKER
+        self.slot_size = MAX_DOCUMENT_BYTES if whole_documents else MAX_HEAD_BYTES
+        self.shm = shared_memory.SharedMemory(create=True, size=self.slots * self.slot_size)
+        # Spawned workers don't inherit the event loop thread the way forked ones would
+        self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        self.free = None
+        self.heads_parsed = 0
+
+    async def parse(self, data, signals, base_url, agent, charset="utf-8", analyzers=()):
+        """Fill in signals (and analyzer reports) from the bytes of a page head and return them"""
+        if self.free is None:
+            self.free = asyncio.Queue()
+            for slot in range(self.slots):
+                self.free.put_nowait(slot)
+        slot = await self.free.get()
+
+        length = min(len(data), self.slot_size)
+        offset = slot * self.slot_size
+        self.shm.buf[offset:offset + length] = memoryview(data)[:length]
+        future = asyncio.get_running_loop().run_in_executor(
+            self.executor, _parse_slot, self.shm.name, offset, length, signals, base_url, agent, charset,
+            analyzers
+        )
+        # The slot is only reused once the worker is done with it, even if we are cancelled
+        future.add_done_callback(lambda _: self.free.put_nowait(slot))
+        signals = await asyncio.shield(future)
+        self.heads_parsed += 1
+        return signals
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.shm.close()
+        self.shm.unlink()
@@ -0,0 +1,304 @@
+"""Per-host request pacing and round-robin URL scheduling for bulk inspections"""
+import asyncio
+import heapq
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+# Responses that mean "slow down"
+THROTTLE_STATUSES = {429, 503}
+
+# First backoff when a throttling response has no Retry-After, doubled on every repeat
+BASE_BACKOFF = 1.0
+# Rate a throttled host falls back to when it had no limit and no measured rate yet
+FALLBACK_RATE = 1.0
+MIN_RATE = 0.05
+# Rate growth per successful response while recovering from throttling
+RECOVERY = 1.05
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def host_key(url):
+    """The host a URL's requests are paced by ("" if it has none)
+
+    That is the hostname, with the port when it is not the scheme's
+    default: sites on other ports of a machine are paced on their own, as
+    the fetcher pools their connections, while http:// and https:// of
+    one site share a pace.
+    """
+    try:
+        parts = urlsplit(url if "://" in url else "//" + url.strip())
+        host, port = parts.hostname or "", parts.port
+    except ValueError:
+        return ""
+    if not host or port is None or port == DEFAULT_PORTS.get(parts.scheme.lower()):
+        return host
+    return f"[{host}]:{port}" if ":" in host else f"{host}:{port}"
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    # Imported here: email.utils pulls in a lot and HTTP-date Retry-Afters are rare
+    from email.utils import parsedate_to_datetime
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HostState:
+    """Pacing state and counters for one host"""
+
+    __slots__ = (
+        "rate", "crawl_delay", "tat", "paused_until", "strikes", "interval_avg", "last_request",
+        "queued", "active", "requests", "throttled", "wait_total", "wait_max",
+    )
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.crawl_delay = None
+        # Theoretical arrival time of the next request (GCRA token bucket)
+        self.tat = 0.0
+        self.paused_until = 0.0
+        self.strikes = 0
+        self.interval_avg = None
+        self.last_request = None
+        self.queued = 0
+        self.active = 0
+        self.requests = 0
+        self.throttled = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def interval(self):
+        """Seconds between requests at the current rate and Crawl-delay"""
+        interval = 1.0 / self.rate if self.rate != float("inf") else 0.0
+        if self.crawl_delay:
+            interval = max(interval, self.crawl_delay)
+        return interval
+
+
+class PolitenessScheduler:
+    """Pace requests per host with a token bucket and back off when hosts push back
+
+    Hosts are keyed by host_key(), so a hostname on a non-default port is
+    a host of its own. Every host may receive ``rate`` requests per second with bursts of up
+    to ``burst`` (no limit when ``rate`` is None), and never more often than
+    its robots.txt Crawl-delay once that is known. A 429 or 503 pauses the
+    host for its Retry-After (or an exponential backoff, capped at
+    ``max_backoff`` seconds) and halves its rate; successful responses
+    bring the rate back up gradually.
+    """
+
+    def __init__(self, rate=None, burst=1, max_backoff=300.0):
+        self.rate = float(rate) if rate else float("inf")
+        self.burst = max(1, burst)
+        self.max_backoff = max_backoff
+        self.hosts = {}
+
+    def host(self, host):
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = HostState(self.rate)
+        return state
+
+    def set_crawl_delay(self, host, delay):
+        self.host(host).crawl_delay = delay
+
+    def ready_at(self, host):
+        """Monotonic time at which the host may receive its next request"""
+        state = self.hosts.get(host)
+        if state is None:
+            return 0.0
+        interval = state.interval()
+        burst = 1 if state.crawl_delay else self.burst
+        return max(state.paused_until, state.tat - (burst - 1) * interval)
+
+    async def acquire(self, host):
+        """Wait until a request to the host is allowed"""
+        state = self.host(host)
+        start = time.monotonic()
+        while True:
+            now = time.monotonic()
+            slot = max(now, self.ready_at(host))
+            if slot <= now:
+                break
+            await asyncio.sleep(slot - now)
+        interval = state.interval()
+        state.tat = max(state.tat, now) + interval
+
+        waited = now - start
+        state.requests += 1
+        state.wait_total += waited
+        state.wait_max = max(state.wait_max, waited)
+        if state.last_request is not None:
+            gap = now - state.last_request
+            state.interval_avg = gap if state.interval_avg is None else 0.8 * state.interval_avg + 0.2 * gap
+        state.last_request = now
+
+    def observe(self, host, status, headers):
+        """Adapt the host's pace to a response status"""
+        state = self.host(host)
+        if status in THROTTLE_STATUSES:
+            state.throttled += 1
+            state.strikes += 1
+            delay = parse_retry_after(headers.get("retry-after"))
+            if delay is None:
+                delay = BASE_BACKOFF * 2 ** (state.strikes - 1)
+            state.paused_until = max(state.paused_until, time.monotonic() + min(delay, self.max_backoff))
+            # Halve whichever is lower, the allowed rate or the rate actually reached
+            measured = 1.0 / state.interval_avg if state.interval_avg else float("inf")
+            current = min(state.rate, measured)
+            if current == float("inf"):
+                current = FALLBACK_RATE * 2
+            state.rate = max(MIN_RATE, current / 2)
+        elif status < 500:
+            state.strikes = 0
+            if state.rate < self.rate:
+                state.rate = min(self.rate, state.rate * RECOVERY)
+
+    def stats(self):
+        """Per-host queue depth, wait times and pacing, most waited-on hosts first"""
+        now = time.monotonic()
+        rows = []
+        for host, state in self.hosts.items():
+            rows.append({
+                "host": host,
+                "queued": state.queued,
+                "active": state.active,
+                "requests": state.requests,
+                "throttled": state.throttled,
+                "wait_total": round(state.wait_total, 3),
+                "wait_avg": round(state.wait_total / state.requests, 3) if state.requests else 0.0,
+                "wait_max": round(state.wait_max, 3),
+                "rate": None if state.rate == float("inf") else round(state.rate, 3),
+                "crawl_delay": state.crawl_delay,
+                "paused_for": round(max(0.0, state.paused_until - now), 3),
+            })
+        rows.sort(key=lambda row: row["wait_total"], reverse=True)
+        return rows
+
+
+class HostQueue:
+    """URLs waiting for inspection, handed out round-robin across hosts
+
+    get() only returns a URL whose host (see host_key) has fewer than
+    ``per_host`` inspections running and may receive a request right now, so workers
+    move on to other hosts instead of queueing up behind a slow or
+    throttled one. At most ``maxsize`` URLs are held; put() waits beyond
+    that. get() returns None once the queue is closed and empty.
+
+    Every host with URLs waits in one of three places: the round-robin
+    line of hosts ready now, a heap by the time it may receive its next
+    request, or the set of hosts at their ``per_host`` limit. get()
+    therefore only looks at hosts that may be ready, however many hosts
+    are queued. A host's pace can change while it waits (a throttling
+    response pauses it), so it is checked again when its turn comes.
+    """
+
+    def __init__(self, scheduler, per_host=8, maxsize=10000):
+        self.scheduler = scheduler
+        self.per_host = per_host
+        self.maxsize = maxsize
+        self.hosts = {}
+        self.ready = deque()
+        self.waiting = []
+        self.busy = set()
+        self.size = 0
+        self.closed = False
+        self.getters = deque()
+        self.putters = deque()
+
+    @staticmethod
+    def _wake(waiters):
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    @staticmethod
+    async def _wait(waiters, timeout=None):
+        waiter = asyncio.get_running_loop().create_future()
+        waiters.append(waiter)
+        try:
+            await asyncio.wait([waiter], timeout=timeout)
+        finally:
+            if not waiter.done():
+                waiter.cancel()
+                waiters.remove(waiter)
+
+    def _place(self, host, now):
+        """Line a host with URLs up as busy, waiting for its next request slot or ready"""
+        if self.scheduler.host(host).active >= self.per_host:
+            self.busy.add(host)
+            return
+        ready_at = self.scheduler.ready_at(host)
+        if ready_at > now:
+            heapq.heappush(self.waiting, (ready_at, host))
+        else:
+            self.ready.append(host)
+
+    async def put(self, url):
+        while self.size >= self.maxsize:
+            await self._wait(self.putters)
+        host = host_key(url)
+        urls = self.hosts.get(host)
+        if urls is None:
+            urls = self.hosts[host] = deque()
+            self._place(host, time.monotonic())
+        urls.append(url)
+        self.size += 1
+        self.scheduler.host(host).queued += 1
+        self._wake(self.getters)
+
+    async def get(self):
+        while True:
+            now = time.monotonic()
+            while self.waiting and self.waiting[0][0] <= now:
+                self._place(heapq.heappop(self.waiting)[1], now)
+            while self.ready:
+                host = self.ready.popleft()
+                state = self.scheduler.host(host)
+                if state.active >= self.per_host or self.scheduler.ready_at(host) > now:
+                    self._place(host, now)
+                    continue
+                urls = self.hosts[host]
+                url = urls.popleft()
+                self.size -= 1
+                state.queued -= 1
+                state.active += 1
+                if urls:
+                    self._place(host, now)
+                else:
+                    del self.hosts[host]
+                self._wake(self.putters)
+                if self.hosts:
+                    self._wake(self.getters)
+                return url
+            if self.closed and not self.hosts:
+                # Let the next idle worker see that the queue is finished too
+                self._wake(self.getters)
+                return None
+            await self._wait(self.getters, self.waiting[0][0] - now if self.waiting else None)
+
+    def done(self, url):
+        """Mark an inspection handed out by get() as finished"""
+        host = host_key(url)
+        self.scheduler.host(host).active -= 1
+        if host in self.busy:
+            self.busy.discard(host)
+            self._place(host, time.monotonic())
+        self._wake(self.getters)
+
+    def close(self):
+        """No more URLs will be put; waiting getters finish once the queue drains"""
+        self.closed = True
+        while self.getters:
+            self._wake(self.getters)
@@ -0,0 +1,531 @@
+"""Compact inspection result records
+
+A bulk run may keep millions of results around (the bulk results table,
+exports), so a result is stored as a slotted record of small enum codes
+and shared strings. The display texts the GUI shows (status line,
+robots/canonical descriptions, troubleshooting advice) are looked up from
+the codes when asked for instead of being stored per URL.
+"""
+import hashlib
+import json
+import sys
+import time
+from datetime import datetime
+from enum import IntEnum
+
+from analyzers import report_summary
+from timing import format_timings
+
+
+class Verdict(IntEnum):
+    """Outcome of an inspection"""
+    INDEXABLE = 0
+    BLOCKED_ROBOTS = 1
+    ROBOTS_UNREACHABLE = 2
+    NOINDEX = 3
+    CANONICAL_ALTERNATE = 4
+    NOT_FOUND = 5
+    REDIRECT = 6
+    REDIRECT_ERROR = 7
+    CLIENT_ERROR = 8
+    SERVER_ERROR = 9
+    FAILED = 10
+
+
+class RobotsState(IntEnum):
+    NOT_CHECKED = 0
+    ALLOWED = 1
+    BLOCKED = 2
+    MISSING = 3
+    UNREACHABLE = 4
+
+
+class NoindexState(IntEnum):
+    NOT_APPLICABLE = 0
+    NOT_CHECKED = 1
+    NO = 2
+    META = 3
+    HEADER = 4
+
+
+class CanonicalState(IntEnum):
+    NOT_AVAILABLE = 0
+    NONE = 1
+    SELF = 2
+    OTHER_LINK_TAG = 3
+    OTHER_LINK_HEADER = 4
+
+
+class CacheState(IntEnum):
+    LIVE = 0
+    FRESH = 1
+    REVALIDATED = 2
+    # Copied from an earlier URL of the same page whose full result was no longer kept
+    DUPLICATE = 3
+
+
+class RenderState(IntEnum):
+    NOT_RENDERED = 0
+    RENDERED = 1
+    TIMED_OUT = 2
+    FAILED = 3
+
+
+# Name used in exports, status line, label style and troubleshooting advice for each verdict
+VERDICTS = {
+    Verdict.INDEXABLE: (
+        "indexable",
+        "URL is available to Google",
+        "Success.TLabel",
+        "No issues detected. Google can crawl and index this URL."
+    ),
+    Verdict.BLOCKED_ROBOTS: (
+        "not_indexed_robots",
+        "URL is not on Google: Blocked by robots.txt",
+        "Error.TLabel",
+        "Troubleshooting:\n\n"
+        "• This URL is blocked by robots.txt\n"
+        "• Googlebot cannot crawl this page\n"
+        "• Solution: Update your robots.txt file to allow access"
+    ),
+    Verdict.ROBOTS_UNREACHABLE: (
+        "not_indexed_robots_unreachable",
+        "URL is not on Google: robots.txt unreachable",
+        "Error.TLabel",
+        "Troubleshooting:\n\n"
+        "• The site's robots.txt returns a server error or cannot be fetched\n"
+        "• Google does not crawl a site while its robots.txt is unreachable\n"
+        "• Solution: Make robots.txt return 200 (or 404 if you have none)"
+    ),
+    Verdict.NOINDEX: (
+        "not_indexed_noindex",
+        "URL is not on Google: Noindex tag detected",
+        "Warning.TLabel",
+        "Troubleshooting:\n\n"
+        "• This page has a 'noindex' directive\n"
+        "• Google found the page but was told not to index it\n"
+        "• Solution: Remove noindex meta tag if you want it indexed"
+    ),
+    Verdict.CANONICAL_ALTERNATE: (
+        "not_indexed_canonical",
+        "URL is not on Google: Alternate page with proper canonical tag",
+        "Warning.TLabel",
+        "Troubleshooting:\n\n"
+        "• This page declares another URL as its canonical version\n"
+        "• Google indexes the canonical URL instead of this one\n"
+        "• Solution: Point the canonical at this URL if it should be indexed itself"
+    ),
+    Verdict.NOT_FOUND: (
+        "not_indexed_404",
+        "URL is not on Google: Page not found (404)",
+        "Error.TLabel",
+        "Troubleshooting:\n\n"
+        "• This URL returns a {http_status} (Not Found) error\n"
+        "• The page may have been moved or deleted\n"
+        "• Solution: Fix the URL or implement a proper redirect"
+    ),
+    Verdict.REDIRECT: (
+        "not_indexed_redirect",
+        "URL is not on Google: Page with redirect",
+        "Warning.TLabel",
+        "Troubleshooting:\n\n"
+        "• This URL answers with a {http_status} redirect to {final_url} (HTTP {final_status})\n"
+        "• Google indexes the redirect target instead of this URL\n"
+        "• Solution: Link to and submit the final URL directly"
+    ),
+    Verdict.REDIRECT_ERROR: (
+        "not_indexed_redirect_error",
+        "URL is not on Google: Redirect error",
+        "Error.TLabel",
+        "Troubleshooting:\n\n"
+        "• The redirect chain starting at this URL {redirect_error}\n"
+        "• Googlebot gives up on redirect loops and overly long chains\n"
+        "• Solution: Redirect straight to the final URL in a single hop"
+    ),
+    Verdict.CLIENT_ERROR: (
+        "not_indexed_4xx",
+        "URL is not on Google: Blocked due to other 4xx issue",
+        "Error.TLabel",
+        "Troubleshooting:\n\n"
+        "• This URL returns an HTTP {http_status} error\n"
+        "• Googlebot is refused access to the page\n"
+        "• Solution: Make the page publicly accessible without authentication"
+    ),
+    Verdict.SERVER_ERROR: (
+        "not_indexed_5xx",
+        "URL is not on Google: Server error (5xx)",
+        "Error.TLabel",
+        "Troubleshooting:\n\n"
+        "• This URL returns an HTTP {http_status} server error\n"
+        "• Google retries later but drops pages that keep failing\n"
+        "• Solution: Check the server logs and fix the error"
+    ),
+    Verdict.FAILED: (
+        "failed",
+        "Inspection failed",
+        "Error.TLabel",
+        "Inspection failed:\n\n{error}\n\nPlease check the URL and try again."
+    ),
+}
+VERDICT_BY_NAME = {name: verdict for verdict, (name, _, _, _) in VERDICTS.items()}
+
+ROBOTS_TEXT = {
+    RobotsState.NOT_CHECKED: "Not checked",
+    RobotsState.ALLOWED: "Allowed by robots.txt",
+    RobotsState.BLOCKED: "Blocked by robots.txt",
+    RobotsState.MISSING: "No robots.txt found (crawling allowed)",
+    RobotsState.UNREACHABLE: "robots.txt unreachable",
+}
+
+NOINDEX_TEXT = {
+    NoindexState.NOT_APPLICABLE: "Not applicable",
+    NoindexState.NOT_CHECKED: "Not checked",
+    NoindexState.NO: "No",
+    NoindexState.META: "Yes (meta robots tag)",
+    NoindexState.HEADER: "Yes (X-Robots-Tag header)",
+}
+
+CANONICAL_TEXT = {
+    CanonicalState.NOT_AVAILABLE: "Not available",
+    CanonicalState.NONE: "No canonical tag",
+    CanonicalState.SELF: "Self-referential canonical",
+    CanonicalState.OTHER_LINK_TAG: "Canonical points to {} (link rel=canonical)",
+    CanonicalState.OTHER_LINK_HEADER: "Canonical points to {} (Link header)",
+}
+
+RENDER_TEXT = {
+    RenderState.NOT_RENDERED: "Not rendered (static HTML)",
+    RenderState.RENDERED: "Rendered (JavaScript executed)",
+    RenderState.TIMED_OUT: "Rendering timed out (static HTML used)",
+    RenderState.FAILED: "Rendering failed (static HTML used)",
+}
+
+# Verdicts under which indexing is allowed
+INDEXING_ALLOWED = {Verdict.INDEXABLE, Verdict.CANONICAL_ALTERNATE}
+
+# Verdicts of pages whose HTML was parsed, so analyzers had something to look at
+ANALYZABLE = {Verdict.INDEXABLE, Verdict.CANONICAL_ALTERNATE, Verdict.NOINDEX}
+
+# Verdicts that may well be different on the next attempt
+ERROR_VERDICTS = {Verdict.ROBOTS_UNREACHABLE, Verdict.CLIENT_ERROR, Verdict.SERVER_ERROR, Verdict.FAILED}
+
+# Plain columns written by the exporters, in order
+EXPORT_COLUMNS = [
+    "url", "verdict", "http_status", "robots", "noindex", "canonical", "canonical_url",
+    "title", "final_url", "final_status", "redirect_hops", "redirect_error", "crawl_time",
+    "cache", "error", "timings", "render", "enhancements", "mobile",
+]
+
+# Fields most results don't have, kept together in one optional dict
+DETAIL_FIELDS = (
+    "hreflang", "redirect_chain", "final_url", "final_status", "redirect_error", "error", "timings", "render_state",
+    "reports",
+)
+
+# One shared int object per HTTP status instead of one per result
+_STATUS_CODES = {code: code for code in range(100, 600)}
+_last_second = [0]
+
+
+def shared_status(status):
+    return _STATUS_CODES.get(status, status)
+
+
+def crawl_clock():
+    """The current time in whole seconds, as one shared int per second"""
+    now = int(time.time())
+    if now != _last_second[0]:
+        _last_second[0] = now
+    return _last_second[0]
+
+
+class InspectionRecord:
+    """The outcome of inspecting one URL
+
+    Every state is an IntEnum code; the only per-URL strings are the URL
+    itself and what the page said about itself (canonical, title,
+    hreflang, redirect targets). The fields in DETAIL_FIELDS live in
+    ``details``, which stays None for the common case of a page without
+    any of them. Use to_dict() for the full set of display texts.
+    """
+
+    __slots__ = (
+        "url", "verdict", "http_status", "robots_state", "noindex_state", "canonical_state",
+        "canonical_url", "title", "crawl_time", "cache_state", "details",
+    )
+
+    def __init__(self, url, verdict, http_status=None, robots_state=RobotsState.NOT_CHECKED,
+                 noindex_state=NoindexState.NOT_APPLICABLE, canonical_state=CanonicalState.NOT_AVAILABLE,
+                 canonical_url=None, title=None, hreflang=None, redirect_chain=None, final_url=None,
+                 final_status=None, redirect_error=None, crawl_time=None, cache_state=CacheState.LIVE, error=None,
+                 render_state=RenderState.NOT_RENDERED, reports=None):
+        self.url = url
+        self.verdict = verdict
+        self.http_status = shared_status(http_status)
+        self.robots_state = robots_state
+        self.noindex_state = noindex_state
+        self.canonical_state = canonical_state
+        # A self-referential canonical usually is the URL itself; share the string
+        self.canonical_url = url if canonical_url == url else canonical_url
+        self.title = title
+        self.crawl_time = crawl_time
+        self.cache_state = cache_state
+
+        details = {}
+        if hreflang:
+            details["hreflang"] = tuple((sys.intern(lang), href) for lang, href in hreflang)
+        if redirect_chain:
+            details["redirect_chain"] = tuple((hop, shared_status(status)) for hop, status in redirect_chain)
+        if final_url is not None:
+            details["final_url"] = final_url
+            details["final_status"] = shared_status(final_status)
+        if redirect_error is not None:
+            details["redirect_error"] = redirect_error
+        if error is not None:
+            # Failures repeat the same few messages per host
+            details["error"] = sys.intern(error)
+        if render_state != RenderState.NOT_RENDERED:
+            # Rendering is the exception, so it is a detail too
+            details["render_state"] = render_state
+        if reports is not None:
+            # Enhancement and mobile usability results by analyzer (see analyzers.py)
+            details["reports"] = reports
+        self.details = details or None
+
+    def replace(self, **changes):
+        """Return a copy of the record with some fields changed"""
+        record = InspectionRecord.__new__(InspectionRecord)
+        for name in self.__slots__:
+            setattr(record, name, changes.pop(name, getattr(self, name)))
+        if changes:
+            raise TypeError(f"Unknown record fields: {', '.join(changes)}")
+        return record
+
+    def with_timings(self, timings):
+        """Return a copy of the record carrying per-phase timings ({phase: seconds})"""
+        return self.replace(details=dict(self.details or (), timings=timings))
+
+    def _detail(self, name):
+        return self.details.get(name) if self.details else None
+
+    hreflang = property(lambda self: self._detail("hreflang"))
+    redirect_chain = property(lambda self: self._detail("redirect_chain"))
+    final_url = property(lambda self: self._detail("final_url"))
+    final_status = property(lambda self: self._detail("final_status"))
+    redirect_error = property(lambda self: self._detail("redirect_error"))
+    error = property(lambda self: self._detail("error"))
+    timings = property(lambda self: self._detail("timings"))
+    reports = property(lambda self: self._detail("reports"))
+
+    @property
+    def render_state(self):
+        return self._detail("render_state") or RenderState.NOT_RENDERED
+
+    # Display texts, derived from the codes
+
+    @property
+    def verdict_name(self):
+        return VERDICTS[self.verdict][0]
+
+    @property
+    def indexing_status(self):
+        return VERDICTS[self.verdict][1]
+
+    @property
+    def status_style(self):
+        return VERDICTS[self.verdict][2]
+
+    @property
+    def troubleshooting(self):
+        return VERDICTS[self.verdict][3].format(
+            http_status=self.http_status,
+            final_url=self.final_url,
+            final_status=self.final_status,
+            redirect_error=self.redirect_error,
+            error=self.error
+        )
+
+    @property
+    def failed(self):
+        return self.verdict == Verdict.FAILED
+
+    @property
+    def robots(self):
+        return "Error" if self.failed else ROBOTS_TEXT[self.robots_state]
+
+    @property
+    def noindex(self):
+        return "Error" if self.failed else NOINDEX_TEXT[self.noindex_state]
+
+    @property
+    def canonical(self):
+        if self.failed:
+            return "Error"
+        return CANONICAL_TEXT[self.canonical_state].format(self.canonical_url or "another URL")
+
+    @property
+    def indexing_allowed(self):
+        if self.failed:
+            return "Error"
+        return "Yes" if self.verdict in INDEXING_ALLOWED else "No"
+
+    @property
+    def crawl_date(self):
+        if self.failed:
+            return "Error"
+        if self.crawl_time is None:
+            return "Not crawled"
+        return datetime.fromtimestamp(self.crawl_time).strftime("%Y-%m-%d %H:%M:%S")
+
+    @property
+    def rendered(self):
+        return "Error" if self.failed else RENDER_TEXT[self.render_state]
+
+    @property
+    def enhancements(self):
+        """(detected enhancements, issues found), or None if the page was not analyzed"""
+        return report_summary(self.reports, "enhancements")
+
+    @property
+    def mobile_issues(self):
+        """Mobile usability issues found, or None if the page was not analyzed"""
+        summary = report_summary(self.reports, "mobile")
+        return None if summary is None else summary[1]
+
+    def needs_analysis(self, analyzers):
+        """Whether the named analyzers would have had an HTML page to look at that this record has no report of"""
+        if self.verdict not in ANALYZABLE or not 200 <= (self.http_status or 0) < 300:
+            return False
+        return self.reports is None or any(name not in self.reports for name in analyzers)
+
+    @property
+    def cache(self):
+        return None if self.cache_state == CacheState.LIVE else self.cache_state.name.lower()
+
+    def to_dict(self):
+        """All fields and display texts as a plain dict"""
+        result = {
+            "url": self.url,
+            "verdict": self.verdict_name,
+            "http_status": self.http_status,
+            "cache": self.cache,
+            "indexing_status": self.indexing_status,
+            "status_style": self.status_style,
+            "crawl_date": self.crawl_date,
+            "rendered": self.rendered,
+            "robots": self.robots,
+            "canonical": self.canonical,
+            "indexing_allowed": self.indexing_allowed,
+            "noindex": self.noindex,
+            "troubleshooting": self.troubleshooting,
+        }
+        if self.failed:
+            result["error"] = self.error
+        if self.canonical_url is not None:
+            result["canonical_url"] = self.canonical_url
+        if self.title is not None:
+            result["title"] = self.title
+        if self.hreflang:
+            result["hreflang"] = [list(pair) for pair in self.hreflang]
+        if self.redirect_chain:
+            result["redirect_chain"] = [list(hop) for hop in self.redirect_chain]
+        if self.final_url is not None:
+            result["final_url"] = self.final_url
+            result["final_status"] = self.final_status
+        if self.redirect_error is not None:
+            result["redirect_error"] = self.redirect_error
+        if self.timings:
+            result["timings"] = dict(self.timings)
+        if self.reports is not None:
+            result["reports"] = self.reports
+        return result
+
+    def export_row(self):
+        """Values for EXPORT_COLUMNS, with states as short lowercase names"""
+        return [
+            self.url,
+            self.verdict_name,
+            self.http_status,
+            self.robots_state.name.lower(),
+            self.noindex_state.name.lower(),
+            self.canonical_state.name.lower(),
+            self.canonical_url,
+            self.title,
+            self.final_url,
+            self.final_status,
+            len(self.redirect_chain) if self.redirect_chain else 0,
+            self.redirect_error,
+            self.crawl_time,
+            self.cache_state.name.lower(),
+            self.error,
+            format_timings(self.timings) if self.timings else None,
+            self.render_state.name.lower(),
+            _enhancements_text(self.enhancements),
+            None if self.mobile_issues is None else "; ".join(self.mobile_issues) or "ok",
+        ]
+
+    def content_hash(self):
+        """A short hash of everything the record says about indexing, to spot changes between runs"""
+        signals = [
+            int(self.verdict), self.http_status, int(self.robots_state), int(self.noindex_state),
+            int(self.canonical_state), self.canonical_url, self.title, self.hreflang, self.redirect_chain,
+            self.final_url, self.final_status, self.redirect_error,
+        ]
+        return hashlib.blake2b(json.dumps(signals).encode(), digest_size=8).hexdigest()
+
+    def to_state(self):
+        """A JSON-serializable list of the raw fields, for storage"""
+        return [
+            self.url, int(self.verdict), self.http_status, int(self.robots_state), int(self.noindex_state),
+            int(self.canonical_state), self.canonical_url, self.title,
+            [list(pair) for pair in self.hreflang] if self.hreflang else None,
+            [list(hop) for hop in self.redirect_chain] if self.redirect_chain else None,
+            self.final_url, self.final_status, self.redirect_error, self.crawl_time, self.error,
+            int(self.render_state), self.reports,
+        ]
+
+    def summary(self):
+        """The record's state codes without its strings, which many pages share (see from_summary)"""
+        return (int(self.verdict), self.http_status, int(self.robots_state), int(self.noindex_state),
+                int(self.canonical_state), int(self.render_state))
+
+    @classmethod
+    def from_summary(cls, url, summary):
+        """A record for ``url`` with the states of another URL's summary() and none of its strings"""
+        verdict, http_status, robots_state, noindex_state, canonical_state, render_state = summary
+        return cls(
+            url, Verdict(verdict), http_status, RobotsState(robots_state), NoindexState(noindex_state),
+            CanonicalState(canonical_state), cache_state=CacheState.DUPLICATE, render_state=RenderState(render_state)
+        )
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild a record stored with to_state()"""
+        (url, verdict, http_status, robots_state, noindex_state, canonical_state, canonical_url, title,
+         hreflang, redirect_chain, final_url, final_status, redirect_error, crawl_time, error, render_state,
+         reports) = state
+        return cls(
+            url, Verdict(verdict), http_status, RobotsState(robots_state), NoindexState(noindex_state),
+            CanonicalState(canonical_state), canonical_url, title, hreflang, redirect_chain, final_url,
+            final_status, redirect_error, crawl_time, error=error, render_state=RenderState(render_state),
+            reports=reports
+        )
+
+
+def _enhancements_text(summary):
+    """The enhancements export cell: what was detected, then the issues"""
+    if summary is None:
+        return None
+    detected, issues = summary
+    return "; ".join(detected + issues) or "none"
+
+
+def failed_record(url, error_msg):
+    """Build a record for an inspection that failed"""
+    return InspectionRecord(url, Verdict.FAILED, error=error_msg)
+
+
+def duplicate_record(url):
+    """Build a record for a URL of a page inspected earlier in the run whose result is gone"""
+    return InspectionRecord(url, Verdict.FAILED, cache_state=CacheState.DUPLICATE,
+                            error="Duplicate of a URL inspected earlier whose result was no longer kept")
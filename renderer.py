@@ -0,0 +1,150 @@
+"""Optional JavaScript rendering in pooled headless browser contexts (needs playwright)"""
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from fetcher import DEFAULT_USER_AGENT
+
+# Resources a page's indexing signals never depend on
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font", "stylesheet"}
+
+
+class RenderError(Exception):
+    """Raised when a page cannot be rendered"""
+
+
+class RenderTimeout(RenderError):
+    """Raised when a page does not load within the render time limit"""
+
+
+def require_playwright():
+    """Import and return playwright.async_api, with install instructions if it is missing"""
+    try:
+        import playwright.async_api
+    except ImportError:
+        raise ImportError("JavaScript rendering needs playwright (pip install playwright && playwright install chromium)")
+    return playwright.async_api
+
+
+def _site(host):
+    return host[4:] if host.startswith("www.") else host
+
+
+def same_site(host, site):
+    """Whether a request host belongs to the site being rendered (itself or a subdomain)"""
+    return host == site or host.endswith("." + site)
+
+
+class Renderer:
+    """Render pages in a pool of ``contexts`` reusable headless Chromium contexts
+
+    One browser is started on first use; each render takes a context from
+    the pool, opens a page in it and gives the context back afterwards,
+    so at most ``contexts`` pages render at once. Images, media, fonts and
+    stylesheets are never downloaded, nor (with ``block_third_party``)
+    anything from other sites. A render gets ``timeout`` seconds: the
+    DOM is read once the network is idle or the time is up, whichever
+    comes first, and a page that has not even loaded by then raises
+    RenderTimeout.
+    """
+
+    def __init__(self, contexts=4, timeout=10.0, user_agent=DEFAULT_USER_AGENT, block_third_party=True):
+        self.api = require_playwright()
+        self.contexts = contexts
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.block_third_party = block_third_party
+        self.playwright = None
+        self.browser = None
+        self.free = None
+        self.starting = None
+        self.renders = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.blocked_requests = 0
+        self.render_seconds = 0.0
+
+    async def _start(self):
+        self.playwright = await self.api.async_playwright().start()
+        self.browser = await self.playwright.chromium.launch(headless=True)
+        free = asyncio.Queue()
+        for _ in range(self.contexts):
+            context = await self.browser.new_context(user_agent=self.user_agent, service_workers="block")
+            free.put_nowait(context)
+        self.free = free
+
+    async def _route(self, site, route):
+        request = route.request
+        if request.resource_type in BLOCKED_RESOURCE_TYPES or (
+                self.block_third_party and not same_site(urlsplit(request.url).hostname or "", site)):
+            self.blocked_requests += 1
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def render(self, url):
+        """Load a URL with JavaScript and return the HTML of the rendered DOM"""
+        if self.free is None:
+            # Concurrent first renders share one browser start
+            if self.starting is None:
+                self.starting = asyncio.ensure_future(self._start())
+            try:
+                await asyncio.shield(self.starting)
+            except self.api.Error as e:
+                self.failures += 1
+                raise RenderError(f"Cannot start the headless browser: {e}")
+
+        context = await self.free.get()
+        start = time.perf_counter()
+        try:
+            return await asyncio.wait_for(self._render_page(context, url), self.timeout + 5)
+        except (self.api.TimeoutError, asyncio.TimeoutError):
+            self.timeouts += 1
+            raise RenderTimeout(f"Rendering {url} took longer than {self.timeout:g}s")
+        except self.api.Error as e:
+            self.failures += 1
+            raise RenderError(f"Cannot render {url}: {e}")
+        finally:
+            self.renders += 1
+            self.render_seconds += time.perf_counter() - start
+            self.free.put_nowait(context)
+
+    async def _render_page(self, context, url):
+        deadline = time.monotonic() + self.timeout
+        page = await context.new_page()
+        try:
+            site = _site(urlsplit(url).hostname or "")
+            await page.route("**/*", lambda route: self._route(site, route))
+            await page.goto(url, wait_until="domcontentloaded", timeout=self.timeout * 1000)
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                try:
+                    await page.wait_for_load_state("networkidle", timeout=remaining * 1000)
+                except self.api.TimeoutError:
+                    # Take the DOM as it is by the deadline
+                    pass
+            return await page.content()
+        finally:
+            await page.close()
+            await context.clear_cookies()
+
+    def stats(self):
+        return {
+            "renders": self.renders,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "blocked_requests": self.blocked_requests,
+            "mean": self.render_seconds / self.renders if self.renders else 0.0,
+        }
+
+    async def close(self):
+        if self.starting is not None and not self.starting.done():
+            self.starting.cancel()
+        if self.browser is not None:
+            await self.browser.close()
+        if self.playwright is not None:
+            await self.playwright.stop()
+        self.browser = None
+        self.playwright = None
+        self.free = None
+        self.starting = None
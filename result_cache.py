@@ -0,0 +1,166 @@
+"""Persistent SQLite store of inspection results for conditional re-inspection"""
+import json
+import os
+import sqlite3
+import time
+
+from records import InspectionRecord, ERROR_VERDICTS
+
+# Bumped whenever the stored result format changes; older caches are discarded
+SCHEMA_VERSION = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    url TEXT PRIMARY KEY,
+    result TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    checked_at REAL NOT NULL,
+    content_hash TEXT,
+    changed_at REAL,
+    stable INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS results_checked_at ON results (checked_at);
+"""
+
+
+class CachedResult:
+    """A stored InspectionRecord plus the validators needed to revalidate it"""
+
+    __slots__ = ("result", "etag", "last_modified", "checked_at", "fresh")
+
+    def __init__(self, result, etag, last_modified, checked_at, fresh):
+        self.result = result
+        self.etag = etag
+        self.last_modified = last_modified
+        self.checked_at = checked_at
+        self.fresh = fresh
+
+    def conditional_headers(self):
+        """Headers for a conditional GET, empty if the page gave no validators"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ScheduleState:
+    """What an incremental run needs to know about a URL's earlier checks"""
+
+    __slots__ = ("checked_at", "changed_at", "stable", "failures")
+
+    def __init__(self, checked_at, changed_at, stable, failures):
+        self.checked_at = checked_at
+        self.changed_at = changed_at
+        self.stable = stable
+        self.failures = failures
+
+
+class ResultCache:
+    """Inspection results keyed by normalized URL
+
+    Results younger than ``max_age`` seconds are served as they are; older
+    ones are revalidated with their ETag/Last-Modified. Error verdicts are
+    never served from the cache, as the site may have recovered since. Writes are batched
+    into one transaction per ``commit_interval`` seconds, and beyond
+    ``max_entries`` the least recently checked URLs are dropped.
+
+    Every URL also keeps a content hash of its result, so the cache knows
+    when the result last changed, how many checks in a row found it
+    unchanged (``stable``) and how many in a row ended in an error
+    verdict (``failures``); incremental runs schedule by these.
+    """
+
+    def __init__(self, path, max_age=24 * 3600, max_entries=1000000, commit_interval=1.0):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        (version,) = self.db.execute("PRAGMA user_version").fetchone()
+        if version != SCHEMA_VERSION:
+            self.db.execute("DROP TABLE IF EXISTS results")
+            self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.db.executescript(SCHEMA)
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.commit_interval = commit_interval
+        self.pending_writes = 0
+        self.last_commit = time.monotonic()
+
+    def get(self, url):
+        """Return the CachedResult for a URL, or None"""
+        row = self.db.execute(
+            "SELECT result, etag, last_modified, checked_at, failures FROM results WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        result, etag, last_modified, checked_at, failures = row
+        # failures counts the error verdicts in a row, so it is 0 unless the last check ended in one
+        fresh = not failures and time.time() - checked_at < self.max_age
+        return CachedResult(InspectionRecord.from_state(json.loads(result)), etag, last_modified, checked_at, fresh)
+
+    def put(self, url, result, etag=None, last_modified=None):
+        """Store (or replace) the InspectionRecord for a URL"""
+        now = time.time()
+        failed = int(result.verdict in ERROR_VERDICTS)
+        # Expressions on the right see the row as it was before the update
+        self.db.execute(
+            "INSERT INTO results (url, result, etag, last_modified, checked_at, content_hash, changed_at, failures) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (url) DO UPDATE SET result = excluded.result, etag = excluded.etag, "
+            "last_modified = excluded.last_modified, checked_at = excluded.checked_at, "
+            "content_hash = excluded.content_hash, "
+            "changed_at = CASE WHEN content_hash = excluded.content_hash THEN changed_at ELSE excluded.changed_at END, "
+            "stable = CASE WHEN content_hash = excluded.content_hash THEN stable + 1 ELSE 0 END, "
+            "failures = CASE WHEN excluded.failures THEN failures + 1 ELSE 0 END",
+            (url, json.dumps(result.to_state(), ensure_ascii=False), etag, last_modified, now,
+             result.content_hash(), now, failed)
+        )
+        self._wrote()
+
+    def touch(self, url):
+        """Mark a result as just revalidated (the page answered 304)"""
+        self.db.execute("UPDATE results SET checked_at = ?, stable = stable + 1 WHERE url = ?", (time.time(), url))
+        self._wrote()
+
+    def schedule_states(self, urls):
+        """Return {url: ScheduleState} for the given URLs that have been checked before"""
+        states = {}
+        urls = list(urls)
+        # Stay well below SQLite's limit on query parameters
+        for start in range(0, len(urls), 500):
+            batch = urls[start:start + 500]
+            rows = self.db.execute(
+                "SELECT url, checked_at, changed_at, stable, failures FROM results "
+                f"WHERE url IN ({', '.join('?' * len(batch))})", batch
+            )
+            for url, checked_at, changed_at, stable, failures in rows:
+                states[url] = ScheduleState(checked_at, changed_at, stable, failures)
+        return states
+
+    def _wrote(self):
+        self.pending_writes += 1
+        if time.monotonic() - self.last_commit >= self.commit_interval:
+            self.flush()
+
+    def flush(self):
+        """Commit pending writes and evict entries beyond max_entries"""
+        if self.pending_writes:
+            (count,) = self.db.execute("SELECT COUNT(*) FROM results").fetchone()
+            if count > self.max_entries:
+                self.db.execute(
+                    "DELETE FROM results WHERE url IN "
+                    "(SELECT url FROM results ORDER BY checked_at LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            self.db.commit()
+        self.pending_writes = 0
+        self.last_commit = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self.db.close()
@@ -0,0 +1,254 @@
+"""Virtualized results table for bulk inspections in the Tk GUI"""
+import time
+import tkinter as tk
+from bisect import bisect_right
+from collections import deque
+from tkinter import ttk
+
+# (record attribute, heading, width)
+COLUMNS = [
+    ("url", "URL", 380),
+    ("indexing_status", "Status", 300),
+    ("http_status", "HTTP", 60),
+    ("robots", "Robots.txt", 160),
+    ("noindex", "Noindex", 120),
+    ("canonical", "Canonical", 200),
+]
+
+ALL_STATUSES = "All statuses"
+
+# How often queued results are flushed into the table, and how long a flush may take
+FLUSH_INTERVAL_MS = 100
+FLUSH_BUDGET = 0.03
+
+
+def _sort_key(column):
+    if column == "http_status":
+        return lambda record: record.http_status or 0
+    return lambda record: str(getattr(record, column) or "").lower()
+
+
+class ResultsTable(ttk.Frame):
+    """A sortable, filterable table that only creates widgets for visible rows
+
+    InspectionRecords may be added from any thread with add(); they are queued and
+    merged into the table every FLUSH_INTERVAL_MS by the Tk thread, with
+    each flush capped at FLUSH_BUDGET seconds so the UI stays responsive
+    while hundreds of results arrive per second. However many results
+    there are, the Treeview only ever holds one item per visible line.
+    """
+
+    def __init__(self, parent, on_open=None):
+        super().__init__(parent)
+        self.on_open = on_open
+        self.rows = []
+        self.view = []
+        self.view_keys = []
+        self.incoming = deque()
+        self.offset = 0
+        self.visible = 0
+        self.sort_column = None
+        self.sort_descending = False
+        self.status_filter = ALL_STATUSES
+        self.text_filter = ""
+
+        # Filter bar
+        filter_frame = ttk.Frame(self)
+        filter_frame.pack(fill=tk.X, pady=(0, 5))
+
+        ttk.Label(filter_frame, text="Status:").pack(side=tk.LEFT)
+        self.status_var = tk.StringVar(value=ALL_STATUSES)
+        self.status_box = ttk.Combobox(filter_frame, textvariable=self.status_var, state="readonly", width=50)
+        self.status_box["values"] = [ALL_STATUSES]
+        self.status_box.pack(side=tk.LEFT, padx=(5, 15))
+        self.status_box.bind("<<ComboboxSelected>>", lambda e: self.set_filter())
+
+        ttk.Label(filter_frame, text="URL contains:").pack(side=tk.LEFT)
+        self.text_var = tk.StringVar()
+        text_entry = ttk.Entry(filter_frame, textvariable=self.text_var, width=30)
+        text_entry.pack(side=tk.LEFT, padx=(5, 15))
+        text_entry.bind("<Return>", lambda e: self.set_filter())
+
+        self.count_var = tk.StringVar(value="No results yet")
+        ttk.Label(filter_frame, textvariable=self.count_var).pack(side=tk.RIGHT)
+
+        # Table with a scrollbar driven by our own offset, not by the Treeview
+        table_frame = ttk.Frame(self)
+        table_frame.pack(fill=tk.BOTH, expand=True)
+
+        self.tree = ttk.Treeview(
+            table_frame,
+            columns=[key for key, _, _ in COLUMNS],
+            show="headings",
+            selectmode="browse"
+        )
+        for key, heading, width in COLUMNS:
+            self.tree.heading(key, text=heading, command=lambda k=key: self.set_sort(k))
+            self.tree.column(key, width=width, stretch=(key == "url"))
+        self.scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=self.on_scrollbar)
+
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.tree.bind("<Configure>", self.on_resize)
+        self.tree.bind("<MouseWheel>", self.on_mousewheel)
+        self.tree.bind("<Button-4>", lambda e: self.scroll_by(-3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll_by(3))
+        self.tree.bind("<Double-1>", self.on_double_click)
+
+        self.after(FLUSH_INTERVAL_MS, self.flush)
+
+    # Feeding results
+
+    def add(self, result):
+        """Queue a result for the table (safe to call from any thread)"""
+        self.incoming.append(result)
+
+    def clear(self):
+        self.incoming.clear()
+        self.rows = []
+        self.view = []
+        self.view_keys = []
+        self.offset = 0
+        self.status_box["values"] = [ALL_STATUSES]
+        self.refresh()
+
+    def flush(self):
+        """Merge queued results into the table, within the time budget"""
+        deadline = time.perf_counter() + FLUSH_BUDGET
+        added = 0
+        new_statuses = False
+        statuses = set(self.status_box["values"])
+        key = _sort_key(self.sort_column) if self.sort_column else None
+
+        while self.incoming and time.perf_counter() < deadline:
+            for _ in range(min(len(self.incoming), 500)):
+                result = self.incoming.popleft()
+                index = len(self.rows)
+                self.rows.append(result)
+                status = self.status_of(result)
+                if status not in statuses:
+                    statuses.add(status)
+                    new_statuses = True
+                if not self.matches(result):
+                    continue
+                if key is None:
+                    self.view.append(index)
+                else:
+                    sort_value = key(result)
+                    position = bisect_right(self.view_keys, sort_value)
+                    self.view_keys.insert(position, sort_value)
+                    self.view.insert(position, index)
+                added += 1
+
+        if new_statuses:
+            self.status_box["values"] = [ALL_STATUSES] + sorted(statuses - {ALL_STATUSES})
+        if added or new_statuses:
+            self.refresh()
+        self.after(FLUSH_INTERVAL_MS, self.flush)
+
+    # Filtering and sorting
+
+    @staticmethod
+    def status_of(record):
+        return record.indexing_status
+
+    def matches(self, record):
+        if self.status_filter != ALL_STATUSES and record.indexing_status != self.status_filter:
+            return False
+        return not self.text_filter or self.text_filter in record.url.lower()
+
+    def set_filter(self):
+        self.status_filter = self.status_var.get()
+        self.text_filter = self.text_var.get().strip().lower()
+        self.rebuild_view()
+
+    def set_sort(self, column):
+        if self.sort_column == column:
+            self.sort_descending = not self.sort_descending
+        else:
+            self.sort_column = column
+            self.sort_descending = False
+        for key, heading, _ in COLUMNS:
+            arrow = (" ▼" if self.sort_descending else " ▲") if key == column else ""
+            self.tree.heading(key, text=heading + arrow)
+        self.rebuild_view()
+
+    def rebuild_view(self):
+        rows = self.rows
+        self.view = [index for index, result in enumerate(rows) if self.matches(result)]
+        if self.sort_column:
+            key = _sort_key(self.sort_column)
+            self.view.sort(key=lambda index: key(rows[index]))
+            self.view_keys = [key(rows[index]) for index in self.view]
+        else:
+            self.view_keys = []
+        self.offset = 0
+        self.refresh()
+
+    # Virtual scrolling
+
+    def row_index(self, line):
+        """Map a visible line to an index into self.rows"""
+        position = self.offset + line
+        if self.sort_descending:
+            position = len(self.view) - 1 - position
+        return self.view[position]
+
+    def refresh(self):
+        """Redraw the visible lines and the scrollbar"""
+        total = len(self.view)
+        self.offset = max(0, min(self.offset, total - self.visible))
+        items = self.tree.get_children()
+        for line, item in enumerate(items):
+            if self.offset + line < total:
+                record = self.rows[self.row_index(line)]
+                values = [getattr(record, key) for key, _, _ in COLUMNS]
+                values = ["" if value is None else value for value in values]
+                self.tree.item(item, values=values)
+            else:
+                self.tree.item(item, values=[""] * len(COLUMNS))
+
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + self.visible) / total))
+            self.count_var.set(f"Showing {total} of {len(self.rows)} URLs")
+        else:
+            self.scrollbar.set(0.0, 1.0)
+            self.count_var.set(f"Showing 0 of {len(self.rows)} URLs" if self.rows else "No results yet")
+
+    def on_resize(self, event):
+        row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        visible = max(1, (event.height - row_height) // row_height)
+        if visible == self.visible:
+            return
+        self.visible = visible
+        items = self.tree.get_children()
+        for item in items[visible:]:
+            self.tree.delete(item)
+        for _ in range(len(items), visible):
+            self.tree.insert("", tk.END, values=[""] * len(COLUMNS))
+        self.refresh()
+
+    def scroll_by(self, lines):
+        self.offset += lines
+        self.refresh()
+
+    def on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.offset = int(float(amount) * len(self.view))
+            self.refresh()
+        elif unit == "pages":
+            self.scroll_by(int(amount) * self.visible)
+        else:
+            self.scroll_by(int(amount))
+
+    def on_mousewheel(self, event):
+        self.scroll_by(-3 if event.delta > 0 else 3)
+
+    def on_double_click(self, event):
+        item = self.tree.identify_row(event.y)
+        if not item or self.on_open is None:
+            return
+        line = self.tree.index(item)
+        if self.offset + line < len(self.view):
+            self.on_open(self.rows[self.row_index(line)])
@@ -0,0 +1,240 @@
+"""robots.txt fetching, parsing and per-host caching"""
+import asyncio
+import re
+import time
+from collections import OrderedDict
+from urllib.parse import urljoin, urlsplit
+
+from fetcher import FetchError
+from urlnorm import encode_path
+
+# Google stops reading robots.txt files after 500 KiB
+MAX_ROBOTS_SIZE = 500 * 1024
+MAX_ROBOTS_REDIRECTS = 5
+
+# How the fetch of a host's robots.txt turned out
+ROBOTS_OK = "ok"
+ROBOTS_MISSING = "missing"
+ROBOTS_UNREACHABLE = "unreachable"
+
+
+class _Node:
+    __slots__ = ("children", "allow")
+
+    def __init__(self):
+        self.children = {}
+        self.allow = None
+
+
+class RobotsRules:
+    """Allow/disallow rules for one user agent, indexed for fast lookups
+
+    Plain path prefixes are stored in a character trie, so a lookup walks
+    the URL path once; the most specific (longest) matching rule wins and
+    allow wins ties, as Google documents. The rare patterns using ``*`` or
+    a trailing ``$`` are matched separately with regular expressions.
+    Patterns are percent-encoded like normalized URLs (see encode_path),
+    so "/café", "/caf%c3%a9" and "/caf%C3%A9" are the same rule.
+    """
+
+    def __init__(self, rules=(), crawl_delay=None, sitemaps=()):
+        self.root = _Node()
+        self.wildcards = []
+        self.crawl_delay = crawl_delay
+        self.sitemaps = list(sitemaps)
+        for allow, pattern in rules:
+            self.add(allow, pattern)
+
+    def add(self, allow, pattern):
+        if not pattern:
+            # An empty Disallow/Allow value matches nothing
+            return
+        pattern = encode_path(pattern)
+        if "*" in pattern or pattern.endswith("$"):
+            anchored = pattern.endswith("$")
+            body = pattern[:-1] if anchored else pattern
+            regex = ".*".join(re.escape(part) for part in body.split("*"))
+            self.wildcards.append((len(pattern), allow, re.compile(regex + ("\\Z" if anchored else ""))))
+            return
+
+        node = self.root
+        for char in pattern:
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = _Node()
+            node = child
+        node.allow = allow or bool(node.allow)
+
+    def allowed(self, path):
+        """Return whether a path (with its query string) may be crawled"""
+        best_length, best_allow = -1, True
+        node = self.root
+        for length, char in enumerate(path, 1):
+            node = node.children.get(char)
+            if node is None:
+                break
+            if node.allow is not None:
+                best_length, best_allow = length, node.allow
+
+        for length, allow, regex in self.wildcards:
+            if length > best_length or (length == best_length and allow and not best_allow):
+                if regex.match(path):
+                    best_length, best_allow = length, allow
+        return best_allow
+
+
+def parse_robots(text, agent):
+    """Parse robots.txt text into the RobotsRules that apply to a user agent
+
+    The group with the longest user-agent name matching ``agent`` applies
+    (groups with the same name are merged), falling back to the ``*`` group.
+    """
+    agent = agent.lower()
+    groups = {}
+    sitemaps = []
+    current_agents = []
+    in_rules = False
+
+    for line in text.splitlines():
+        line = line.split("#", 1)[0].strip()
+        if ":" not in line:
+            continue
+        field, value = line.split(":", 1)
+        field = field.strip().lower()
+        value = value.strip()
+
+        if field == "user-agent":
+            if in_rules:
+                current_agents = []
+                in_rules = False
+            name = value.lower()
+            current_agents.append(name)
+            groups.setdefault(name, {"rules": [], "crawl_delay": None})
+        elif field in ("allow", "disallow"):
+            in_rules = True
+            for name in current_agents:
+                groups[name]["rules"].append((field == "allow", value))
+        elif field == "crawl-delay":
+            in_rules = True
+            try:
+                delay = float(value)
+            except ValueError:
+                continue
+            for name in current_agents:
+                groups[name]["crawl_delay"] = delay
+        elif field == "sitemap":
+            sitemaps.append(value)
+
+    matching = [name for name in groups if name != "*" and agent.startswith(name)]
+    if matching:
+        group = groups[max(matching, key=len)]
+    else:
+        group = groups.get("*", {"rules": [], "crawl_delay": None})
+    return RobotsRules(group["rules"], group["crawl_delay"], sitemaps)
+
+
+class RobotsEntry:
+    """A host's parsed robots.txt and when it has to be fetched again"""
+
+    __slots__ = ("state", "rules", "expires")
+
+    def __init__(self, state, rules, expires):
+        self.state = state
+        self.rules = rules
+        self.expires = expires
+
+    def allowed(self, url):
+        if self.state == ROBOTS_UNREACHABLE:
+            return False
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if path == "/robots.txt":
+            return True
+        if parts.query:
+            path += "?" + parts.query
+        # Redirect targets are not normalized like the inspected URLs
+        return self.rules.allowed(encode_path(path))
+
+
+class RobotsCache:
+    """Fetch each host's robots.txt once and answer allow/disallow checks
+
+    Entries are kept per origin (scheme, host and port) for ``ttl`` seconds,
+    or ``error_ttl`` after a server error, and the least recently used hosts
+    are evicted beyond ``max_hosts``. Concurrent checks for a host whose
+    robots.txt is still being fetched wait for that single fetch.
+
+    Following Google: a 4xx response means everything may be crawled, while
+    5xx, 429 and network errors mean nothing may be crawled.
+    """
+
+    def __init__(self, fetcher, agent="Googlebot", ttl=24 * 3600, error_ttl=600, max_hosts=10000):
+        self.fetcher = fetcher
+        self.agent = agent
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.max_hosts = max_hosts
+        self.entries = OrderedDict()
+        self.in_flight = {}
+
+    @staticmethod
+    def origin(url):
+        parts = urlsplit(url)
+        return f"{parts.scheme.lower()}://{parts.netloc.lower()}"
+
+    async def lookup(self, url):
+        """Return the RobotsEntry for a URL's host, fetching it if needed"""
+        origin = self.origin(url)
+        entry = self.entries.get(origin)
+        if entry is not None:
+            if entry.expires > time.monotonic():
+                self.entries.move_to_end(origin)
+                return entry
+            del self.entries[origin]
+
+        task = self.in_flight.get(origin)
+        if task is None:
+            task = self.in_flight[origin] = asyncio.ensure_future(self._fetch(origin))
+            task.add_done_callback(lambda _: self.in_flight.pop(origin, None))
+        entry = await asyncio.shield(task)
+
+        self.entries[origin] = entry
+        self.entries.move_to_end(origin)
+        while len(self.entries) > self.max_hosts:
+            self.entries.popitem(last=False)
+        return entry
+
+    async def check(self, url):
+        """Return (allowed, entry) for a URL"""
+        entry = await self.lookup(url)
+        return entry.allowed(url), entry
+
+    async def _fetch(self, origin):
+        url = origin + "/robots.txt"
+        try:
+            for _ in range(MAX_ROBOTS_REDIRECTS + 1):
+                async with self.fetcher.request("GET", url) as response:
+                    if 300 <= response.status < 400 and "location" in response.headers:
+                        url = urljoin(url, response.headers["location"])
+                        continue
+                    if 200 <= response.status < 300:
+                        body = bytearray()
+                        async for chunk in response.iter_chunks():
+                            body += chunk
+                            if len(body) >= MAX_ROBOTS_SIZE:
+                                break
+                        text = bytes(body[:MAX_ROBOTS_SIZE]).decode("utf-8", "replace")
+                        return self._entry(ROBOTS_OK, parse_robots(text, self.agent), self.ttl)
+                    if response.status == 429 or response.status >= 500:
+                        break
+                    return self._entry(ROBOTS_MISSING, RobotsRules(), self.ttl)
+            else:
+                # Too many redirects count as a missing file
+                return self._entry(ROBOTS_MISSING, RobotsRules(), self.ttl)
+        except FetchError:
+            pass
+        return self._entry(ROBOTS_UNREACHABLE, RobotsRules(), self.error_ttl)
+
+    @staticmethod
+    def _entry(state, rules, ttl):
+        return RobotsEntry(state, rules, time.monotonic() + ttl)
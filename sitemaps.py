@@ -0,0 +1,147 @@
+"""Streaming sitemap and sitemap index ingestion"""
+import asyncio
+import zlib
+from xml.etree.ElementTree import XMLPullParser
+
+from fetcher import FetchError
+
+GZIP_MAGIC = b"\x1f\x8b"
+# Largest slice of XML inflated from a gzipped sitemap at once
+MAX_INFLATE = 256 * 1024
+
+# Marks the end of the entry queue
+_DONE = object()
+
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _child_text(element, name):
+    for child in element:
+        if _local_name(child.tag) == name:
+            return (child.text or "").strip() or None
+    return None
+
+
+class SitemapReader:
+    """Read page URLs from sitemaps and sitemap indexes as they download
+
+    Each sitemap is parsed incrementally while it arrives (gunzipping
+    ``.gz`` files on the fly) and parsed elements are discarded at once,
+    so memory stays flat however large a file is. Child sitemaps of an
+    index are fetched ``concurrency`` at a time, and entries are handed
+    out through a bounded queue, so the first URLs are available long
+    before the whole tree has been downloaded.
+
+    Sitemaps that cannot be fetched or parsed are skipped and recorded
+    in ``errors`` as (url, message) pairs.
+    """
+
+    def __init__(self, fetcher, concurrency=8, max_depth=3, queue_size=1000):
+        self.fetcher = fetcher
+        self.concurrency = concurrency
+        self.max_depth = max_depth
+        self.queue_size = queue_size
+        self.errors = []
+        self.sitemaps_read = 0
+
+    async def entries(self, sitemap_urls):
+        """Yield (loc, lastmod, priority) for every page listed in the sitemaps (None where not given)"""
+        todo = asyncio.Queue()
+        found = asyncio.Queue(maxsize=self.queue_size)
+        seen = set()
+        pending = 0
+
+        def schedule(url, depth):
+            nonlocal pending
+            if url not in seen:
+                seen.add(url)
+                pending += 1
+                todo.put_nowait((url, depth))
+
+        async def worker():
+            nonlocal pending
+            while True:
+                url, depth = await todo.get()
+                try:
+                    await self._read(url, depth, schedule, found)
+                except Exception as e:
+                    self.errors.append((url, str(e)))
+                pending -= 1
+                if pending == 0:
+                    await found.put(_DONE)
+
+        for url in sitemap_urls:
+            schedule(url, 0)
+        if not pending:
+            return
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(self.concurrency)]
+        try:
+            while True:
+                entry = await found.get()
+                if entry is _DONE:
+                    break
+                yield entry
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def urls(self, sitemap_urls):
+        """Yield the page URLs listed in the sitemaps"""
+        async for loc, _, _ in self.entries(sitemap_urls):
+            yield loc
+
+    async def _read(self, url, depth, schedule, found):
+        """Stream one sitemap, queueing its page entries and child sitemaps"""
+        async with self.fetcher.request("GET", url) as response:
+            if not 200 <= response.status < 300:
+                raise FetchError(f"HTTP {response.status}")
+            self.sitemaps_read += 1
+
+            parser = XMLPullParser(events=("start", "end"))
+            root = None
+            gunzip = None
+            first = True
+            async for chunk in response.iter_chunks():
+                # .gz sitemaps are usually served without Content-Encoding
+                if first:
+                    first = False
+                    if chunk.startswith(GZIP_MAGIC):
+                        gunzip = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                if gunzip is None:
+                    parser.feed(chunk)
+                    root = await self._handle_events(parser, root, depth, schedule, found)
+                    continue
+                # Inflate in bounded slices; sitemaps compress very well
+                while chunk:
+                    parser.feed(gunzip.decompress(chunk, MAX_INFLATE))
+                    chunk = gunzip.unconsumed_tail
+                    root = await self._handle_events(parser, root, depth, schedule, found)
+            if gunzip is not None:
+                parser.feed(gunzip.flush())
+            parser.close()
+            await self._handle_events(parser, root, depth, schedule, found)
+
+    async def _handle_events(self, parser, root, depth, schedule, found):
+        for event, element in parser.read_events():
+            if event == "start":
+                if root is None:
+                    root = element
+                continue
+            name = _local_name(element.tag)
+            if name == "url":
+                loc = _child_text(element, "loc")
+                if loc:
+                    await found.put((loc, _child_text(element, "lastmod"), _child_text(element, "priority")))
+            elif name == "sitemap":
+                loc = _child_text(element, "loc")
+                if loc and depth < self.max_depth:
+                    schedule(loc, depth + 1)
+            else:
+                continue
+            # Drop finished entries so the tree never grows
+            root.clear()
+        return root
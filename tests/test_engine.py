@@ -0,0 +1,67 @@
+"""Failure handling of the engine's bulk inspection stream"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from engine import InspectionEngine  # noqa: E402
+from records import InspectionRecord, Verdict  # noqa: E402
+
+URLS = ["https://a.example/1", "https://a.example/bad", "https://b.example/2"]
+
+
+class FakeEngine(InspectionEngine):
+    """An engine whose inspections never touch the network; URLs with "bad" in them raise"""
+
+    async def _inspect(self, url):
+        await asyncio.sleep(0)
+        if "bad" in url:
+            raise RuntimeError("boom")
+        return InspectionRecord(url, Verdict.INDEXABLE)
+
+
+def collect(engine, urls):
+    async def run():
+        return [record async for record in engine.inspect_stream(urls)]
+
+    # A stream that never ends fails the test instead of hanging it
+    return asyncio.run(asyncio.wait_for(run(), 10))
+
+
+def test_failing_inspection_gets_a_failed_row():
+    engine = FakeEngine(concurrency=2)
+    records = {record.url: record for record in collect(engine, URLS)}
+    assert sorted(records) == sorted(URLS)
+    assert records["https://a.example/bad"].verdict == Verdict.FAILED
+    assert records["https://a.example/bad"].error == "RuntimeError: boom"
+    assert records["https://a.example/1"].verdict == Verdict.INDEXABLE
+
+
+def test_failing_inspection_with_timings_gets_a_failed_row():
+    engine = FakeEngine(concurrency=2, timings=True)
+    records = {record.url: record for record in collect(engine, URLS)}
+    assert records["https://a.example/bad"].verdict == Verdict.FAILED
+    assert engine.timing_stats.summary()
+
+
+def test_stream_ends_when_a_worker_dies():
+    class BrokenEngine(FakeEngine):
+        async def _inspect_safely(self, url):
+            if "bad" in url:
+                raise RuntimeError("worker bug")
+            return await super()._inspect_safely(url)
+
+    engine = BrokenEngine(concurrency=2, dedup=None)
+    seen = []
+
+    async def run():
+        async for record in engine.inspect_stream(URLS):
+            seen.append(record.url)
+
+    with pytest.raises(RuntimeError, match="worker bug"):
+        asyncio.run(asyncio.wait_for(run(), 10))
+    assert sorted(seen) == ["https://a.example/1", "https://b.example/2"]
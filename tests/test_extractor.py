@@ -0,0 +1,133 @@
+"""Indexing signals read from response headers and the HTML head"""
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from extractor import HeadExtractor, PageSignals, read_head, read_header_signals  # noqa: E402
+from fetcher import AsyncFetcher  # noqa: E402
+
+GOOGLEBOT = "googlebot"
+
+
+def header_noindex(value):
+    signals = PageSignals()
+    read_header_signals(signals, {"x-robots-tag": value}, "https://example.com/", GOOGLEBOT)
+    return signals.noindex
+
+
+@pytest.mark.parametrize("value, noindex", [
+    ("noindex", True),
+    ("none", True),
+    ("nofollow", False),
+    ("googlebot: noindex", True),
+    ("otherbot: noindex", False),
+    # Everything after a crawler name is scoped to it, up to the next one
+    ("otherbot: nofollow, noindex", False),
+    ("otherbot: nofollow, googlebot: noindex", True),
+    ("googlebot: nofollow, otherbot: noindex", False),
+    # Directives with a value are not crawler names
+    ("unavailable_after: 25 Jun 2010 15:00:00 PST, noindex", True),
+    ("max-snippet: 20, noindex", True),
+])
+def test_x_robots_tag_scoping(value, noindex):
+    assert header_noindex(value) is noindex
+
+
+def read_response_head(raw):
+    """Headers as the fetcher reads them off a connection"""
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(raw)
+        reader.feed_eof()
+        return await AsyncFetcher()._read_head(SimpleNamespace(reader=reader))
+
+    return asyncio.run(read())
+
+
+def test_repeated_x_robots_tag_headers_are_scoped_separately():
+    _, _, headers = read_response_head(
+        b"HTTP/1.1 200 OK\r\nX-Robots-Tag: otherbot: nofollow\r\nX-Robots-Tag: noindex\r\n"
+        b"Vary: Accept\r\nVary: Cookie\r\n\r\n"
+    )
+    assert headers["vary"] == "Accept, Cookie"
+    signals = PageSignals()
+    read_header_signals(signals, headers, "https://example.com/", GOOGLEBOT)
+    assert signals.noindex
+
+
+def extract(html, chunk_size=None, analyzers=()):
+    """Signals of a document fed in chunks of ``chunk_size`` bytes (all at once when None)"""
+    signals = PageSignals()
+    parser = HeadExtractor(signals, "https://example.com/page", GOOGLEBOT, analyzers=analyzers)
+    data = html.encode("utf-8")
+    size = chunk_size or len(data)
+    fed = 0
+    for start in range(0, len(data), size):
+        fed = start + size
+        if parser.feed_bytes(data[start:fed]):
+            break
+    parser.finish()
+    return signals, min(fed, len(data))
+
+
+def test_head_signals():
+    signals, _ = extract(
+        '<html><head><title> A  page </title><meta name="robots" content="noindex, follow">'
+        '<link rel="canonical" href="/canonical"><link rel="alternate" hreflang="de" href="/de"></head>'
+        "<body><p>text</p></body></html>"
+    )
+    assert signals.title == "A page"
+    assert signals.noindex_source == "meta robots tag"
+    assert signals.canonical == "https://example.com/canonical"
+    assert signals.hreflang == [("de", "https://example.com/de")]
+
+
+def test_parsing_stops_after_the_head():
+    html = "<html><head><title>T</title></head><body><p>" + "x" * 100000 + "</p></body></html>"
+    signals, fed = extract(html, chunk_size=1000)
+    assert signals.title == "T"
+    assert fed < 5000
+
+
+def test_body_content_does_not_count_as_head():
+    signals, _ = extract('<head><title>T</title></head><body><meta name="robots" content="noindex"></body>')
+    assert not signals.noindex
+
+
+def test_noscript_content_in_the_head_does_not_end_it():
+    signals, _ = extract(
+        '<head><noscript><img src="/pixel.gif"></noscript><meta name="robots" content="noindex">'
+        "<title>T</title></head><body></body>"
+    )
+    assert signals.noindex
+    assert signals.title == "T"
+
+
+@pytest.mark.parametrize("chunk_size", [None, 1, 2, 3, 5, 7])
+@pytest.mark.parametrize("analyzers", [(), ("viewport",)])
+def test_app_container_found_whatever_the_chunks(chunk_size, analyzers):
+    signals, _ = extract('<head><title>T</title></head><body><div id="root">', chunk_size, analyzers)
+    assert signals.js_hint == "the body starts with a JavaScript app container"
+
+
+def test_app_container_must_start_the_body():
+    signals, _ = extract('<head><title>T</title></head><body><p>hi</p><div id="root">', 1)
+    assert signals.js_hint is None
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 5, 1000])
+def test_read_head_collects_the_first_body_tag(chunk_size):
+    html = b'<html><head><title>T</title></head>\n<body class="x"><script>x</script><div id="app"></div>'
+
+    async def chunks():
+        for start in range(0, len(html), chunk_size):
+            yield html[start:start + chunk_size]
+
+    head = asyncio.run(read_head(chunks()))
+    assert b'<div id="app">' in head
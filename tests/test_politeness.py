@@ -0,0 +1,127 @@
+"""Host keys and the round-robin host queue of bulk inspections"""
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from politeness import HostQueue, PolitenessScheduler, host_key  # noqa: E402
+
+
+@pytest.mark.parametrize("url, key", [
+    ("https://Example.com/a", "example.com"),
+    ("https://example.com:443/a", "example.com"),
+    ("http://example.com:80/a", "example.com"),
+    ("http://example.com:8080/a", "example.com:8080"),
+    ("https://example.com:80/a", "example.com:80"),
+    ("example.com/a", "example.com"),
+    ("http://[::1]:8080/", "[::1]:8080"),
+    ("http:///no-host", ""),
+])
+def test_host_key(url, key):
+    assert host_key(url) == key
+
+
+def run(test):
+    # A queue that never hands out a URL fails the test instead of hanging it
+    asyncio.run(asyncio.wait_for(test(), 10))
+
+
+async def put_all(queue, urls):
+    for url in urls:
+        await queue.put(url)
+
+
+async def not_ready(queue):
+    """True if get() has nothing to hand out for a moment"""
+    try:
+        url = await asyncio.wait_for(queue.get(), 0.05)
+    except asyncio.TimeoutError:
+        return True
+    raise AssertionError(f"got {url}")
+
+
+def test_urls_are_handed_out_round_robin_across_hosts():
+    async def test():
+        queue = HostQueue(PolitenessScheduler())
+        await put_all(queue, ["http://a/1", "http://a/2", "http://a/3", "http://b/1", "http://c/1", "http://c/2"])
+        order = [await queue.get() for _ in range(6)]
+        assert order == ["http://a/1", "http://b/1", "http://c/1", "http://a/2", "http://c/2", "http://a/3"]
+
+    run(test)
+
+
+def test_sites_on_other_ports_are_hosts_of_their_own():
+    async def test():
+        queue = HostQueue(PolitenessScheduler(), per_host=1)
+        await put_all(queue, ["http://a:8001/1", "http://a:8001/2", "http://a:8002/1"])
+        assert [await queue.get(), await queue.get()] == ["http://a:8001/1", "http://a:8002/1"]
+
+    run(test)
+
+
+def test_busy_host_is_skipped_until_an_inspection_is_done():
+    async def test():
+        queue = HostQueue(PolitenessScheduler(), per_host=1)
+        await put_all(queue, ["http://a/1", "http://a/2", "http://b/1"])
+        assert await queue.get() == "http://a/1"
+        assert await queue.get() == "http://b/1"
+        assert await not_ready(queue)
+        assert queue.busy == {"a"}
+
+        queue.done("http://a/1")
+        assert not queue.busy
+        assert await queue.get() == "http://a/2"
+
+    run(test)
+
+
+def test_paced_host_waits_for_its_next_request_slot():
+    async def test():
+        scheduler = PolitenessScheduler(rate=10)
+        queue = HostQueue(scheduler)
+        await put_all(queue, ["http://a/1", "http://a/2", "http://b/1"])
+        assert await queue.get() == "http://a/1"
+        # The fetcher takes the host's request slot before sending
+        await scheduler.acquire("a")
+        start = time.monotonic()
+        assert await queue.get() == "http://b/1"
+
+        getter = asyncio.ensure_future(queue.get())
+        await asyncio.sleep(0.01)
+        assert not getter.done()
+        assert [host for _, host in queue.waiting] == ["a"]
+        assert await getter == "http://a/2"
+        assert time.monotonic() - start >= 0.08
+
+    run(test)
+
+
+def test_close_ends_waiting_getters_once_drained():
+    async def test():
+        queue = HostQueue(PolitenessScheduler())
+        getters = [asyncio.ensure_future(queue.get()) for _ in range(3)]
+        await asyncio.sleep(0)
+        await queue.put("http://a/1")
+        queue.close()
+        assert sorted(await asyncio.gather(*getters), key=str) == [None, None, "http://a/1"]
+        assert await queue.get() is None
+
+    run(test)
+
+
+def test_put_waits_while_the_queue_is_full():
+    async def test():
+        queue = HostQueue(PolitenessScheduler(), maxsize=2)
+        putter = asyncio.ensure_future(put_all(queue, ["http://a/1", "http://b/1", "http://c/1"]))
+        await asyncio.sleep(0.01)
+        assert not putter.done()
+        assert await queue.get() == "http://a/1"
+        await putter
+        assert queue.size == 2
+
+    run(test)
@@ -0,0 +1,116 @@
+"""robots.txt parsing and the rule index that answers allow/disallow checks"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from robots import ROBOTS_OK, ROBOTS_UNREACHABLE, RobotsEntry, RobotsRules, parse_robots  # noqa: E402
+
+
+def rules(*lines):
+    return parse_robots("User-agent: *\n" + "\n".join(lines), "Googlebot")
+
+
+@pytest.mark.parametrize("lines, path, allowed", [
+    # Prefixes, stored in the trie
+    (["Disallow: /private"], "/private", False),
+    (["Disallow: /private"], "/private-area/page", False),
+    (["Disallow: /private/"], "/private", True),
+    (["Disallow: /"], "/anything", False),
+    (["Disallow:"], "/anything", True),
+    (["Disallow: /search"], "/search?q=shoes", False),
+    (["Disallow: /*?"], "/page", True),
+    # The longest matching rule wins, allow wins ties
+    (["Disallow: /shop/", "Allow: /shop/public/"], "/shop/public/item", True),
+    (["Disallow: /shop/", "Allow: /shop/public/"], "/shop/cart", False),
+    (["Allow: /shop/", "Disallow: /shop/cart"], "/shop/cart/1", False),
+    (["Disallow: /page", "Allow: /page"], "/page", True),
+    (["Allow: /page", "Disallow: /page"], "/page", True),
+    # Wildcards
+    (["Disallow: /*.pdf"], "/files/report.pdf", False),
+    (["Disallow: /*.pdf"], "/files/report.pdf?download=1", False),
+    (["Disallow: /*.pdf$"], "/files/report.pdf?download=1", True),
+    (["Disallow: /*.pdf$"], "/files/report.pdf", False),
+    (["Disallow: /*/print/"], "/a/b/print/page", False),
+    (["Disallow: /*?session="], "/page?session=1", False),
+    (["Disallow: /*?session="], "/page?lang=de", True),
+    (["Disallow: /fish*"], "/fish", False),
+    (["Disallow: /*"], "/", False),
+    (["Disallow: /$"], "/", False),
+    (["Disallow: /$"], "/page", True),
+    # Precedence between trie and wildcard rules goes by pattern length
+    (["Disallow: /shop/", "Allow: /shop/*.html"], "/shop/item.html", True),
+    (["Allow: /shop/", "Disallow: /shop/*.pdf"], "/shop/manual.pdf", False),
+    (["Disallow: /shop/item", "Allow: /*.html"], "/shop/item.html", False),
+    (["Disallow: /*.php", "Allow: /*.php"], "/index.php", True),
+    (["Disallow: /*.php$", "Allow: /index"], "/index.php", False),
+    (["Disallow: /*.php$", "Allow: /index.p"], "/index.php", True),
+    # Percent-encoding, compared as normalized URLs spell it
+    (["Disallow: /café"], "/caf%C3%A9/menu", False),
+    (["Disallow: /caf%c3%a9"], "/caf%C3%A9", False),
+    (["Disallow: /%7Euser/"], "/~user/page", False),
+    (["Disallow: /a%2Fb"], "/a%2Fb", False),
+    (["Disallow: /a%2Fb"], "/a/b", True),
+    (["Disallow: /*/caf%C3%A9$"], "/menu/caf%C3%A9", False),
+])
+def test_allowed(lines, path, allowed):
+    assert rules(*lines).allowed(path) is allowed
+
+
+def test_trie_and_wildcards_are_indexed_separately():
+    index = RobotsRules([(False, "/a"), (True, "/a/b"), (False, "/*.pdf"), (False, "/end$")])
+    assert len(index.wildcards) == 2
+    assert index.root.children["/"].children["a"].allow is False
+
+
+def test_entry_checks_paths_with_query_and_encoding():
+    entry = RobotsEntry(ROBOTS_OK, rules("Disallow: /search?", "Disallow: /ü"), 0)
+    assert not entry.allowed("https://example.com/search?q=1")
+    assert entry.allowed("https://example.com/search")
+    assert not entry.allowed("https://example.com/ü/page")
+    assert entry.allowed("https://example.com/")
+
+
+def test_robots_txt_itself_is_always_allowed():
+    assert RobotsEntry(ROBOTS_OK, rules("Disallow: /"), 0).allowed("https://example.com/robots.txt")
+
+
+def test_unreachable_robots_txt_allows_nothing():
+    assert not RobotsEntry(ROBOTS_UNREACHABLE, RobotsRules(), 0).allowed("https://example.com/")
+
+
+def test_most_specific_user_agent_group_applies():
+    text = """
+# Comments and unknown fields are ignored
+User-agent: *
+Disallow: /
+
+User-agent: Googlebot
+User-agent: Bingbot
+Disallow: /private/  # inline comment
+Crawl-delay: 2
+
+User-agent: Googlebot-Image
+Disallow: /images/
+
+Sitemap: https://example.com/sitemap.xml
+"""
+    googlebot = parse_robots(text, "Googlebot")
+    assert googlebot.allowed("/page") and not googlebot.allowed("/private/x")
+    assert googlebot.crawl_delay == 2.0
+    assert googlebot.sitemaps == ["https://example.com/sitemap.xml"]
+
+    image = parse_robots(text, "Googlebot-Image")
+    assert image.allowed("/private/x") and not image.allowed("/images/1.png")
+    assert image.crawl_delay is None
+
+    assert not parse_robots(text, "OtherBot").allowed("/page")
+
+
+def test_groups_with_the_same_agent_are_merged():
+    text = "User-agent: googlebot\nDisallow: /a\n\nUser-agent: Googlebot\nDisallow: /b\n"
+    merged = parse_robots(text, "Googlebot")
+    assert not merged.allowed("/a") and not merged.allowed("/b")
@@ -0,0 +1,107 @@
+"""URL normalization and duplicate handling of bulk runs"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from records import CacheState, InspectionRecord, RobotsState, Verdict  # noqa: E402
+from urlnorm import DigestSet, Deduplicator, normalize_url, url_digest  # noqa: E402
+
+
+@pytest.mark.parametrize("url, normalized", [
+    ("example.com", "https://example.com/"),
+    ("HTTP://Example.COM:80/a/./b/../c#frag", "http://example.com/a/c"),
+    ("https://example.com:443/%7euser/%2f?q=%e2%82%ac", "https://example.com/~user/%2F?q=%E2%82%AC"),
+    ("https://example.com:8443/", "https://example.com:8443/"),
+    ("https://bücher.example/", "https://xn--bcher-kva.example/"),
+])
+def test_normalize_url(url, normalized):
+    assert normalize_url(url) == normalized
+
+
+def test_loose_normalization_drops_tracking_order_and_trailing_slash():
+    assert (normalize_url("https://example.com/shoes/?utm_source=x&b=2&a=1&gclid=y", loose=True)
+            == "https://example.com/shoes?a=1&b=2")
+    # Only loose keys merge these
+    assert normalize_url("https://example.com/shoes/") != normalize_url("https://example.com/shoes")
+
+
+def test_normalize_url_without_domain():
+    with pytest.raises(ValueError):
+        normalize_url("https://")
+
+
+def test_digest_set_values_survive_growing():
+    seen = DigestSet(capacity=4)
+    digests = [url_digest(f"https://example.com/{n}") for n in range(5000)]
+    for n, digest in enumerate(digests):
+        assert seen.add(digest)
+        seen.set_value(digest, n % 7 + 1)
+    assert not seen.add(digests[0])
+    assert len(seen) == 5000
+    assert all(seen.value(digest) == n % 7 + 1 for n, digest in enumerate(digests))
+    assert seen.value(url_digest("https://example.com/other")) == 0
+
+
+def run(dedup, urls):
+    """Feed URLs through a Deduplicator as the engine does, finishing each inspection at once"""
+    rows = []
+    for url in urls:
+        inspect, record = dedup.add(url)
+        if record is not None:
+            rows.append(record)
+        if inspect is not None:
+            rows += dedup.finish(inspect, InspectionRecord(inspect, Verdict.INDEXABLE, http_status=200,
+                                                           robots_state=RobotsState.ALLOWED, title="Title"))
+    return rows
+
+
+def test_aliases_in_flight_get_the_result():
+    dedup = Deduplicator()
+    assert dedup.add("https://example.com/a") == ("https://example.com/a", None)
+    assert dedup.add("HTTPS://EXAMPLE.com/a#top") == (None, None)
+    record = InspectionRecord("https://example.com/a", Verdict.NOINDEX, title="A")
+    rows = dedup.finish("https://example.com/a", record)
+    assert [row.url for row in rows] == ["https://example.com/a", "https://example.com/a"]
+    assert rows[1].title == "A"
+    assert dedup.stats()["fanned_out"] == 1
+
+
+def test_loose_aliases_fan_out_under_their_own_url():
+    dedup = Deduplicator(loose=True)
+    rows = run(dedup, ["https://example.com/a?utm_source=x", "https://example.com/a/"])
+    assert [row.url for row in rows] == ["https://example.com/a?utm_source=x", "https://example.com/a/"]
+    assert rows[1].title == "Title"
+    assert dedup.stats()["inspected"] == 1
+
+
+def test_aliases_after_the_window_get_a_summary():
+    dedup = Deduplicator(window=1)
+    rows = run(dedup, ["https://example.com/a", "https://example.com/b", "https://example.com/a"])
+    late = rows[-1]
+    assert late.url == "https://example.com/a"
+    assert (late.verdict, late.http_status, late.robots_state) == (Verdict.INDEXABLE, 200, RobotsState.ALLOWED)
+    assert late.cache_state == CacheState.DUPLICATE
+    assert late.title is None
+    assert dedup.stats() == {"urls": 3, "inspected": 2, "fanned_out": 0, "summarized": 1, "unanswered": 0,
+                             "duplicates": 1}
+
+
+def test_aliases_in_the_window_get_the_full_result():
+    dedup = Deduplicator(window=2)
+    rows = run(dedup, ["https://example.com/a", "https://example.com/b", "https://example.com/a"])
+    assert rows[-1].title == "Title"
+    assert rows[-1].cache_state == CacheState.LIVE
+
+
+def test_bloom_filter_aliases_after_the_window_are_reported_not_fetched():
+    dedup = Deduplicator(bloom_capacity=1000, window=0)
+    rows = run(dedup, ["https://example.com/a", "https://example.com/a"])
+    assert len(rows) == 2
+    assert rows[1].verdict == Verdict.FAILED
+    assert rows[1].cache_state == CacheState.DUPLICATE
+    assert dedup.stats()["inspected"] == 1
+    assert dedup.stats()["unanswered"] == 1
@@ -0,0 +1,66 @@
+"""Crash handling of the SQLite work queue"""
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from records import Verdict  # noqa: E402
+from work_queue import WorkQueue  # noqa: E402
+
+# A worker that leases the URL and dies while inspecting it
+CRASHING_WORKER = """
+import os, sys
+sys.path.insert(0, {root!r})
+from work_queue import WorkQueue
+queue = WorkQueue({path!r}, lease_seconds=60, checkpoint_interval=0.05)
+print(len(queue.lease(1)), flush=True)
+os._exit(1)
+"""
+
+
+def crash_worker(path):
+    """Run a worker process that dies holding its lease; return how many URLs it leased"""
+    child = subprocess.run([sys.executable, "-c", CRASHING_WORKER.format(root=ROOT, path=path)],
+                           capture_output=True, text=True)
+    assert child.returncode == 1, child.stderr
+    return int(child.stdout)
+
+
+def test_url_that_kills_every_worker_is_given_up(tmp_path):
+    path = str(tmp_path / "queue.db")
+    # Stays open the whole time, so dead workers must be noticed without reopening the queue
+    queue = WorkQueue(path, lease_seconds=60, checkpoint_interval=0.05, max_attempts=3)
+    try:
+        assert queue.claim_loading(["poison"])
+        queue.load(["https://example.com/poison"])
+        for _ in range(queue.max_attempts):
+            time.sleep(0.1)
+            assert crash_worker(path) == 1
+
+        time.sleep(0.1)
+        assert queue.lease(1) == []
+        assert queue.counts["given_up"] == 1
+        assert queue.finished()
+        (record,) = queue.results()
+        assert record.verdict == Verdict.FAILED
+        assert record.error.startswith("Gave up after 3 attempts")
+    finally:
+        queue.close()
+
+
+def test_dead_worker_is_reclaimed_during_the_run(tmp_path):
+    path = str(tmp_path / "queue.db")
+    queue = WorkQueue(path, lease_seconds=60, checkpoint_interval=0.05)
+    try:
+        assert queue.claim_loading(["urls"])
+        queue.load(["https://example.com/a"])
+        assert crash_worker(path) == 1
+
+        time.sleep(0.1)
+        assert [url for _, url, _ in queue.lease(1)] == ["https://example.com/a"]
+        assert queue.counts["reclaimed"] == 1
+    finally:
+        queue.close()
@@ -0,0 +1,230 @@
+"""Per-phase timing of inspections, aggregated into latency histograms
+
+While an inspection runs with timing enabled, ``current_trace`` holds its
+Trace and the fetcher, engine and extractor add the time they spend in
+each phase to it. With timing disabled the trace is None and every
+instrumented spot costs one context variable lookup.
+"""
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+# wait: politeness pacing and connection slots; ttfb: request sent until the
+# response head arrived; body: reading the body; render: the headless browser
+# (only for pages that need it); total: the whole inspection
+PHASES = ("wait", "dns", "connect", "tls", "ttfb", "body", "robots", "parse", "render", "total")
+
+# Histogram bucket upper bounds in seconds (the last bucket is unbounded)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# The Trace of the inspection running in the current task, or None
+current_trace = ContextVar("current_trace", default=None)
+
+
+class Trace:
+    """Seconds spent per phase by one inspection (phases add up over its requests)"""
+
+    __slots__ = ("phases",)
+
+    def __init__(self):
+        self.phases = {}
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def since(self, phase, start):
+        """Add the time since ``start`` (a perf_counter() value) to a phase"""
+        self.add(phase, time.perf_counter() - start)
+
+
+def format_timings(timings):
+    """Timings as compact "phase=ms" text, in PHASES order"""
+    return " ".join(f"{phase}={timings[phase] * 1000:.1f}" for phase in PHASES if phase in timings)
+
+
+class Histogram:
+    """Counts of observed durations per bucket"""
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, fraction):
+        """Estimate a quantile by interpolating inside its bucket"""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = BUCKETS[index - 1] if index else 0.0
+                if index == len(BUCKETS):
+                    return lower
+                return lower + (BUCKETS[index] - lower) * (rank - seen) / count
+            seen += count
+        return BUCKETS[-1]
+
+
+class TimingStats:
+    """Histograms of every phase over all timed inspections, and counts per verdict"""
+
+    def __init__(self):
+        self.histograms = {phase: Histogram() for phase in PHASES}
+        self.verdicts = {}
+        self.started = time.time()
+
+    def observe(self, phases, verdict):
+        for phase, seconds in phases.items():
+            self.histograms[phase].observe(seconds)
+        self.verdicts[verdict] = self.verdicts.get(verdict, 0) + 1
+
+    def summary(self):
+        """Per-phase count, mean and p50/p95/p99 in seconds, for phases seen so far"""
+        rows = []
+        for phase in PHASES:
+            histogram = self.histograms[phase]
+            if histogram.count:
+                rows.append({
+                    "phase": phase,
+                    "count": histogram.count,
+                    "mean": histogram.sum / histogram.count,
+                    "p50": histogram.quantile(0.50),
+                    "p95": histogram.quantile(0.95),
+                    "p99": histogram.quantile(0.99),
+                })
+        return rows
+
+    def format_summary(self):
+        inspected = sum(self.verdicts.values())
+        parts = [f"{row['phase']} p50 {row['p50'] * 1000:.0f} / p95 {row['p95'] * 1000:.0f} ms"
+                 for row in self.summary()]
+        return f"{inspected} inspected; " + ", ".join(parts)
+
+    def to_prometheus(self):
+        """The histograms in the Prometheus text exposition format"""
+        lines = [
+            "# HELP gsc_inspection_phase_seconds Time spent per inspection phase",
+            "# TYPE gsc_inspection_phase_seconds histogram",
+        ]
+        for phase in PHASES:
+            histogram = self.histograms[phase]
+            counts = list(histogram.counts)
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f'gsc_inspection_phase_seconds_bucket{{phase="{phase}",le="{bound}"}} {cumulative}')
+            lines.append(f'gsc_inspection_phase_seconds_sum{{phase="{phase}"}} {histogram.sum:.6f}')
+            lines.append(f'gsc_inspection_phase_seconds_count{{phase="{phase}"}} {cumulative}')
+        lines += [
+            "# HELP gsc_inspections_total Inspections finished, by verdict",
+            "# TYPE gsc_inspections_total counter",
+        ]
+        for verdict, count in sorted(self.verdicts.items()):
+            lines.append(f'gsc_inspections_total{{verdict="{verdict}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+class Throughput:
+    """Inspections finished per second, split by kind (e.g. static and rendered)
+
+    Rates are over the wall time during which any inspection was running,
+    so the rates of all kinds add up to the overall rate of a bulk run.
+    """
+
+    def __init__(self):
+        self.active = 0
+        self.busy = 0.0
+        self.busy_since = None
+        self.kinds = {}
+
+    def begin(self):
+        """Note an inspection starting; pass the returned value to end()"""
+        now = time.perf_counter()
+        if not self.active:
+            self.busy_since = now
+        self.active += 1
+        return now
+
+    def end(self, kind, start):
+        now = time.perf_counter()
+        self.active -= 1
+        if not self.active:
+            self.busy += now - self.busy_since
+        count, seconds = self.kinds.get(kind, (0, 0.0))
+        self.kinds[kind] = (count + 1, seconds + now - start)
+
+    def stats(self):
+        """Per-kind count, URLs per second and mean seconds per URL"""
+        busy = self.busy + (time.perf_counter() - self.busy_since if self.active else 0.0)
+        return [
+            {
+                "kind": kind,
+                "urls": count,
+                "per_second": count / busy if busy else 0.0,
+                "mean": seconds / count,
+            }
+            for kind, (count, seconds) in sorted(self.kinds.items())
+        ]
+
+
+class MetricsServer:
+    """Serve TimingStats at /metrics for Prometheus to scrape, from a daemon thread"""
+
+    def __init__(self, stats, port, host="127.0.0.1"):
+        # Imported here: http.server is slow to import and most runs never serve metrics
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = stats.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StatsDumper:
+    """Print a one-line TimingStats summary every ``interval`` seconds"""
+
+    def __init__(self, stats, interval, stream=sys.stderr):
+        self.stats = stats
+        self.interval = interval
+        self.stream = stream
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            print(self.stats.format_summary(), file=self.stream, flush=True)
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
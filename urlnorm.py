@@ -0,0 +1,326 @@
+"""URL normalization and the seen-set that keeps bulk runs from inspecting a page twice"""
+import math
+import re
+from array import array
+from collections import OrderedDict
+from hashlib import blake2b
+from urllib.parse import quote, unquote_plus, urlsplit
+
+from records import InspectionRecord, duplicate_record
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+# Query parameters that only track where a visitor came from
+TRACKING_PARAMS = {
+    "gclid", "gclsrc", "dclid", "gbraid", "wbraid", "fbclid", "msclkid", "yclid", "twclid", "igshid",
+    "mc_cid", "mc_eid", "_ga", "_gl", "_hsenc", "_hsmi", "mkt_tok", "ref_src",
+}
+TRACKING_PREFIXES = ("utm_",)
+
+UNRESERVED = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~")
+
+# Characters left alone when percent-encoding paths and queries
+PATH_SAFE = "/%!$&'()*+,;=:@-._~"
+QUERY_SAFE = PATH_SAFE + "?"
+
+_SCHEME_RE = re.compile(r"https?://", re.IGNORECASE)
+_ESCAPE_RE = re.compile(r"%([0-9A-Fa-f]{2})")
+
+
+def _fix_escape(match):
+    char = chr(int(match.group(1), 16))
+    return char if char in UNRESERVED else "%" + match.group(1).upper()
+
+
+def _encode(text, safe):
+    """Percent-encode what needs it, upper-case escapes and decode needlessly escaped characters"""
+    return _ESCAPE_RE.sub(_fix_escape, quote(text, safe=safe))
+
+
+def encode_path(path):
+    """Percent-encode a path, with its query string, the way normalize_url() does"""
+    return _encode(path, QUERY_SAFE)
+
+
+def remove_dot_segments(path):
+    """Resolve "." and ".." path segments (RFC 3986, section 5.2.4)"""
+    if "." not in path:
+        return path
+    segments = []
+    for segment in path.split("/")[1:]:
+        if segment == "..":
+            if segments:
+                segments.pop()
+        elif segment != ".":
+            segments.append(segment)
+    if path.endswith(("/.", "/..")):
+        segments.append("")
+    return "/" + "/".join(segments)
+
+
+def is_tracking_param(pair):
+    name = unquote_plus(pair.split("=", 1)[0]).lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def normalize_url(url, loose=False):
+    """Return the normalized form of a URL, adding https:// when the scheme is missing
+
+    Only spellings of the same address are merged: scheme and host case,
+    default ports, the fragment, percent-encoding and dot segments. With
+    ``loose`` the result is only meant as a deduplication key, and also
+    drops tracking parameters, sorts the query and drops a trailing slash,
+    so it may name a different page than the URL itself.
+    Raises ValueError when the URL has no domain or an invalid port.
+    """
+    url = url.strip()
+    if not _SCHEME_RE.match(url):
+        url = "https://" + url
+
+    parts = urlsplit(url)
+    host = parts.hostname
+    if not host:
+        raise ValueError("Invalid URL format - missing domain")
+    scheme = parts.scheme.lower()
+    host = host.rstrip(".")
+    if not host.isascii():
+        try:
+            host = host.encode("idna").decode("ascii")
+        except UnicodeError:
+            pass
+    if ":" in host:
+        host = f"[{host}]"
+    port = parts.port
+    if port is not None and port != DEFAULT_PORTS[scheme]:
+        host = f"{host}:{port}"
+    userinfo, at, _ = parts.netloc.rpartition("@")
+
+    path = remove_dot_segments(_encode(parts.path, PATH_SAFE)) or "/"
+    query = _encode(parts.query, QUERY_SAFE)
+    if loose:
+        query = "&".join(sorted(pair for pair in query.split("&") if pair and not is_tracking_param(pair)))
+        if path != "/":
+            path = path.rstrip("/") or "/"
+    return f"{scheme}://{userinfo}{at}{host}{path}" + (f"?{query}" if query else "")
+
+
+def url_digest(url):
+    """A 128-bit hash of a URL as an int"""
+    return int.from_bytes(blake2b(url.encode("utf-8", "surrogatepass"), digest_size=16).digest(), "little")
+
+
+class DigestSet:
+    """A set of 64-bit URL digests in flat arrays, 24 to 48 bytes per URL
+
+    Far smaller than a set of URL strings; two different URLs share a
+    digest with a chance of about one in 10^19 per pair. Every digest can
+    carry a small int (see set_value), 0 until set.
+    """
+
+    def __init__(self, capacity=1024):
+        size = 1 << max(10, (2 * capacity - 1).bit_length())
+        self.table = array("Q", bytes(8 * size))
+        self.values = array("I", bytes(4 * size))
+        self.count = 0
+
+    def add(self, digest):
+        """Add a url_digest(); return True if it was not in the set yet"""
+        # 0 marks empty slots
+        digest = (digest & 0xFFFFFFFFFFFFFFFF) or 1
+        if (self.count + 1) * 2 > len(self.table):
+            self._grow()
+        table = self.table
+        mask = len(table) - 1
+        slot = digest & mask
+        while True:
+            value = table[slot]
+            if value == digest:
+                return False
+            if not value:
+                table[slot] = digest
+                self.count += 1
+                return True
+            slot = (slot + 1) & mask
+
+    def _slot(self, digest):
+        """The slot of a digest in the set, or None"""
+        digest = (digest & 0xFFFFFFFFFFFFFFFF) or 1
+        table = self.table
+        mask = len(table) - 1
+        slot = digest & mask
+        while table[slot]:
+            if table[slot] == digest:
+                return slot
+            slot = (slot + 1) & mask
+        return None
+
+    def set_value(self, digest, value):
+        """Attach a value to a digest in the set"""
+        slot = self._slot(digest)
+        if slot is not None:
+            self.values[slot] = value
+
+    def value(self, digest):
+        """The value attached to a digest, 0 if none (or not in the set)"""
+        slot = self._slot(digest)
+        return 0 if slot is None else self.values[slot]
+
+    def _grow(self):
+        old, old_values = self.table, self.values
+        self.table = array("Q", bytes(16 * len(old)))
+        self.values = array("I", bytes(8 * len(old)))
+        mask = len(self.table) - 1
+        for digest, value in zip(old, old_values):
+            if digest:
+                slot = digest & mask
+                while self.table[slot]:
+                    slot = (slot + 1) & mask
+                self.table[slot] = digest
+                self.values[slot] = value
+
+    def __len__(self):
+        return self.count
+
+
+class BloomFilter:
+    """A fixed-size probabilistic seen-set for inputs too large to track exactly
+
+    Sized for ``capacity`` URLs, about 3.6 bytes each at the default
+    ``error_rate``, which is the chance that a new URL is taken for one
+    seen before. Past ``capacity`` that chance grows quickly.
+    """
+
+    def __init__(self, capacity, error_rate=1e-6):
+        if capacity <= 0 or not 0 < error_rate < 1:
+            raise ValueError("A Bloom filter needs a positive capacity and an error rate between 0 and 1")
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def add(self, digest):
+        """Add a url_digest(); return True if it was (certainly) not in the filter yet"""
+        # Double hashing: the k positions are h1 + i * h2
+        h1 = digest & 0xFFFFFFFFFFFFFFFF
+        h2 = (digest >> 64) | 1
+        bits = self.bits
+        new = False
+        for i in range(self.hashes):
+            position = (h1 + i * h2) % self.size
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                new = True
+        self.count += new
+        return new
+
+    def __len__(self):
+        return self.count
+
+
+class Deduplicator:
+    """Make sure a bulk run inspects every page once, reporting its result for each alias
+
+    Every URL read is normalized (see normalize_url; ``loose`` merges
+    more aliases). The first URL of a page is inspected; aliases read
+    while it is in flight get its result when it finishes, and those read
+    later get it from the last ``window`` results kept in memory (all of
+    them when None). A result leaving the window leaves its summary()
+    (verdict, status and the other state codes, without titles or URLs)
+    in the seen-set, and later aliases get a record of that, marked as a
+    duplicate. A ``bloom_capacity`` sized Bloom filter cannot keep
+    summaries: aliases read after their result left the window, and the
+    URLs it wrongly takes for seen before, get a record saying they were
+    not inspected. Either way no URL is fetched twice, and every URL read
+    gets a record.
+    """
+
+    def __init__(self, loose=False, bloom_capacity=None, window=100000):
+        self.loose = loose
+        self.window = window
+        self.seen = DigestSet() if bloom_capacity is None else BloomFilter(bloom_capacity)
+        self.keeps_summaries = bloom_capacity is None
+        # The distinct summaries, which the seen-set refers to by position (0 means none)
+        self.summaries = [None]
+        self.summary_ids = {}
+        # key -> aliases waiting for the result of the URL inspected for it
+        self.pending = {}
+        self.recent = OrderedDict()
+        self.counts = {"urls": 0, "inspected": 0, "fanned_out": 0, "summarized": 0, "unanswered": 0}
+
+    def key(self, url):
+        return normalize_url(url, self.loose) if self.loose else url
+
+    def add(self, url):
+        """Note a URL read from the input and return (url to inspect, record to report now)
+
+        Both are None when the URL waits for a result in flight. URLs
+        that cannot be normalized are inspected as they are, so they are
+        reported as failed.
+        """
+        self.counts["urls"] += 1
+        try:
+            url = normalize_url(url)
+            key = self.key(url)
+        except ValueError:
+            self.counts["inspected"] += 1
+            return url, None
+
+        aliases = self.pending.get(key, False)
+        if aliases is not False:
+            if aliases is None:
+                self.pending[key] = [url]
+            else:
+                aliases.append(url)
+            return None, None
+        record = self.recent.get(key)
+        if record is not None:
+            self.recent.move_to_end(key)
+            self.counts["fanned_out"] += 1
+            return None, record if record.url == url else record.replace(url=url)
+        digest = url_digest(key)
+        if not self.seen.add(digest):
+            # Seen before, but its result has left the window
+            summary = self.seen.value(digest) if self.keeps_summaries else 0
+            if summary:
+                self.counts["summarized"] += 1
+                return None, InspectionRecord.from_summary(url, self.summaries[summary])
+            self.counts["unanswered"] += 1
+            return None, duplicate_record(url)
+
+        self.pending[key] = None
+        self.counts["inspected"] += 1
+        return url, None
+
+    def finish(self, url, record):
+        """Return the record of an inspected URL followed by a copy for every alias waiting for it"""
+        try:
+            key = self.key(url)
+        except ValueError:
+            return [record]
+        aliases = self.pending.pop(key, None)
+        if self.window != 0:
+            self.recent[key] = record
+            if self.window is not None and len(self.recent) > self.window:
+                self._keep_summary(*self.recent.popitem(last=False))
+        else:
+            self._keep_summary(key, record)
+        if not aliases:
+            return [record]
+        self.counts["fanned_out"] += len(aliases)
+        return [record] + [record if alias == record.url else record.replace(url=alias) for alias in aliases]
+
+    def _keep_summary(self, key, record):
+        """Note the summary of a result leaving the window in the seen-set"""
+        if not self.keeps_summaries:
+            return
+        summary = record.summary()
+        summary_id = self.summary_ids.get(summary)
+        if summary_id is None:
+            summary_id = self.summary_ids[summary] = len(self.summaries)
+            self.summaries.append(summary)
+        self.seen.set_value(url_digest(key), summary_id)
+
+    def stats(self):
+        counts = self.counts
+        return dict(counts, duplicates=counts["fanned_out"] + counts["summarized"] + counts["unanswered"])
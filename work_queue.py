@@ -0,0 +1,426 @@
+"""Durable SQLite work queue, so bulk runs survive crashes and several processes can share one"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from records import InspectionRecord, failed_record
+from urlnorm import normalize_url
+
+# Item states
+PENDING = 0
+LEASED = 1
+DONE = 2
+
+# Bumped whenever the queue format changes; a queue of another version is refused, not discarded
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL,
+    key TEXT,
+    state INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS items_state ON items (state, id);
+CREATE INDEX IF NOT EXISTS items_key ON items (key) WHERE key IS NOT NULL;
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists, but belongs to someone else
+        return True
+    return True
+
+
+class WorkQueue:
+    """The URLs of a bulk run in a SQLite file, each pending, leased by a worker or done
+
+    Workers lease a few URLs at a time for ``lease_seconds``. Finished
+    results are buffered and written in one transaction per
+    ``checkpoint_interval`` seconds, by a background thread that also
+    renews the worker's leases; a crash therefore loses at most that
+    much work. Leases of a worker that died are reclaimed: within a
+    checkpoint interval if it ran on this machine, otherwise when they
+    expire. A URL whose worker
+    stopped ``max_attempts`` times is given up on and reported as failed.
+
+    Several processes (each with its own WorkQueue) can work on one
+    file at the same time. Results are kept in the queue until export,
+    so the output is always complete and in input order, however often
+    the run was interrupted.
+    """
+
+    def __init__(self, path, lease_seconds=60.0, checkpoint_interval=5.0, max_attempts=3):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # Transactions are explicit, and other processes may hold the write lock for a moment
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        (version,) = self.db.execute("PRAGMA user_version").fetchone()
+        (tables,) = self.db.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'").fetchone()
+        if version != SCHEMA_VERSION:
+            if tables:
+                self.db.close()
+                raise ValueError(f"{path} is not a work queue of this version")
+            self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.db.executescript(SCHEMA)
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.checkpoint_interval = checkpoint_interval
+        self.max_attempts = max_attempts
+        self.host = socket.gethostname()
+        self.worker = f"{self.host}:{os.getpid()}"
+        # The connection is shared by the engine's reader thread, the caller and the checkpoint thread
+        self.lock = threading.RLock()
+        self.finished_items = []
+        self.counts = {"inspected": 0, "shared": 0, "reclaimed": 0, "given_up": 0}
+        self.next_reclaim = 0
+        self.stopping = threading.Event()
+        self.heartbeat = threading.Thread(target=self._beat, daemon=True)
+        self.heartbeat.start()
+
+    def _transaction(self, work, *args):
+        """Run work(*args) in one write transaction, holding the lock"""
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(*args)
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+            self.db.execute("COMMIT")
+            return result
+
+    def get_meta(self, name):
+        with self.lock:
+            row = self.db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def _set_meta(self, name, value):
+        self.db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, json.dumps(value)))
+
+    @property
+    def loaded(self):
+        """Whether the whole input is in the queue"""
+        return bool(self.get_meta("loaded"))
+
+    def claim_loading(self, source):
+        """Become the process that reads the input into the queue
+
+        Returns False if the input is already queued, or another live
+        process is loading it. ``source`` describes the input; a queue
+        filled from a different one raises ValueError.
+        """
+        def claim():
+            queued_source = self.get_meta("source")
+            if queued_source is not None and queued_source != source:
+                raise ValueError(f"{self.path} holds the URLs of another input ({', '.join(queued_source)})")
+            if self.get_meta("loaded"):
+                return False
+            loader = self.get_meta("loader")
+            if loader is not None and loader != self.worker and self._alive(loader):
+                return False
+            self._set_meta("source", source)
+            self._set_meta("loader", self.worker)
+            return True
+
+        return self._transaction(claim)
+
+    def load(self, urls, dedup="exact", batch_size=1000):
+        """Append the URLs of an iterable to the queue, one transaction per batch; return how many
+
+        Loading resumes: as many URLs as are queued already are skipped,
+        so the input must be read in the same order every time. URLs are
+        normalized, and ``dedup`` ("exact", "loose" or None) decides
+        which ones share a result (see Deduplicator).
+        """
+        with self.lock:
+            (skip,) = self.db.execute("SELECT COUNT(*) FROM items").fetchone()
+        added = 0
+        batch = []
+        for url in urls:
+            if skip:
+                skip -= 1
+                continue
+            try:
+                url = normalize_url(url)
+                key = None if dedup is None else normalize_url(url, loose=True) if dedup == "loose" else url
+            except ValueError:
+                # Queued as it is, so the run reports it as failed
+                url, key = url.strip(), None
+            batch.append((url, key))
+            if len(batch) >= batch_size:
+                self._transaction(self.db.executemany, "INSERT INTO items (url, key) VALUES (?, ?)", batch)
+                added += len(batch)
+                batch = []
+        self._transaction(self._finish_loading, batch)
+        return added + len(batch)
+
+    def _finish_loading(self, batch):
+        self.db.executemany("INSERT INTO items (url, key) VALUES (?, ?)", batch)
+        self._set_meta("loaded", True)
+        self._set_meta("loader", None)
+
+    def _alive(self, worker):
+        """Whether a worker may still be running (workers on other machines are taken to be)"""
+        host, _, pid = worker.rpartition(":")
+        return host != self.host or not pid.isdigit() or _pid_alive(int(pid))
+
+    def _expire_dead_workers(self, now):
+        """End the leases of dead processes on this machine, so they are reclaimed like expired ones"""
+        if now < self.next_reclaim:
+            return
+        self.next_reclaim = now + self.checkpoint_interval
+        workers = [row[0] for row in self.db.execute("SELECT DISTINCT worker FROM items WHERE state = ?", (LEASED,))]
+        self.db.executemany("UPDATE items SET lease_until = 0 WHERE state = ? AND worker = ?",
+                            [(LEASED, worker) for worker in workers
+                             if worker != self.worker and not self._alive(worker)])
+
+    def lease(self, count):
+        """Lease up to ``count`` URLs, expired leases first; return [(id, url, key)]
+
+        Finished results are stored first (see checkpoint), and pending URLs
+        of a page that is done already get its result instead.
+        """
+        return self._transaction(self._lease, count)
+
+    def _lease(self, count):
+        self._checkpoint()
+        now = time.time()
+        self._expire_dead_workers(now)
+        items = []
+        for id_, url, key, attempts in self.db.execute(
+                "SELECT id, url, key, attempts FROM items WHERE state = ? AND lease_until < ? LIMIT ?",
+                (LEASED, now, count)).fetchall():
+            if attempts >= self.max_attempts:
+                record = failed_record(url, f"Gave up after {attempts} attempts: the process inspecting it "
+                                            "stopped every time")
+                self.db.execute("UPDATE items SET state = ?, worker = NULL, lease_until = NULL, result = ? "
+                                "WHERE id = ?", (DONE, json.dumps(record.to_state()), id_))
+                self.counts["given_up"] += 1
+            else:
+                self.counts["reclaimed"] += 1
+                items.append((id_, url, key))
+        self._take(items, now)
+        while len(items) < count:
+            rows = self.db.execute("SELECT id, url, key FROM items WHERE state = ? ORDER BY id LIMIT ?",
+                                   (PENDING, count - len(items))).fetchall()
+            if not rows:
+                break
+            taken = []
+            for id_, url, key in rows:
+                done = None if key is None else self.db.execute(
+                    "SELECT url, result FROM items WHERE key = ? AND state = ? LIMIT 1", (key, DONE)).fetchone()
+                if done is None:
+                    taken.append((id_, url, key))
+                    continue
+                done_url, result = done
+                if done_url != url:
+                    result = json.dumps(InspectionRecord.from_state(json.loads(result)).replace(url=url).to_state(),
+                                        ensure_ascii=False)
+                self.db.execute("UPDATE items SET state = ?, result = ? WHERE id = ?", (DONE, result, id_))
+                self.counts["shared"] += 1
+            self._take(taken, now)
+            items += taken
+        return items
+
+    def _take(self, items, now):
+        self.db.executemany(
+            "UPDATE items SET state = ?, worker = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+            [(LEASED, self.worker, now + self.lease_seconds, id_) for id_, _, _ in items]
+        )
+
+    def complete(self, item, record, shared=False):
+        """Note the record of a leased item, ``shared`` when it was inspected for another; it is stored at the
+        next checkpoint"""
+        with self.lock:
+            self.finished_items.append((item, record, shared))
+
+    def checkpoint(self):
+        """Store finished results and renew this worker's leases"""
+        self._transaction(self._checkpoint)
+
+    def _checkpoint(self):
+        finished, self.finished_items = self.finished_items, []
+        for (id_, url, key), record, shared in finished:
+            state = record.to_state()
+            self.db.execute("UPDATE items SET state = ?, worker = NULL, lease_until = NULL, result = ? WHERE id = ?",
+                            (DONE, json.dumps(state, ensure_ascii=False), id_))
+            self.counts["shared" if shared else "inspected"] += 1
+            if key is None:
+                continue
+            # Pending aliases of the page take its result instead of being inspected again
+            aliases = self.db.execute("SELECT id, url FROM items WHERE key = ? AND state = ?",
+                                      (key, PENDING)).fetchall()
+            self.db.executemany("UPDATE items SET state = ?, result = ? WHERE id = ?", [
+                (DONE, json.dumps(record.replace(url=alias).to_state() if alias != record.url else state,
+                                  ensure_ascii=False), alias_id)
+                for alias_id, alias in aliases
+            ])
+            self.counts["shared"] += len(aliases)
+        self.db.execute("UPDATE items SET lease_until = ? WHERE state = ? AND worker = ?",
+                        (time.time() + self.lease_seconds, LEASED, self.worker))
+
+    def _beat(self):
+        while not self.stopping.wait(self.checkpoint_interval):
+            self.checkpoint()
+
+    def stats(self):
+        """Number of pending, leased and done URLs"""
+        with self.lock:
+            rows = dict(self.db.execute("SELECT state, COUNT(*) FROM items GROUP BY state").fetchall())
+        return {"pending": rows.get(PENDING, 0), "leased": rows.get(LEASED, 0), "done": rows.get(DONE, 0)}
+
+    def finished(self):
+        """Whether every URL of the whole input is done"""
+        stats = self.stats()
+        return self.loaded and not stats["pending"] and not stats["leased"]
+
+    def results(self, batch_size=1000):
+        """Yield the InspectionRecords of all done URLs in input order"""
+        last = 0
+        while True:
+            with self.lock:
+                rows = self.db.execute("SELECT id, result FROM items WHERE state = ? AND id > ? ORDER BY id LIMIT ?",
+                                       (DONE, last, batch_size)).fetchall()
+            if not rows:
+                return
+            for last, result in rows:
+                yield InspectionRecord.from_state(json.loads(result))
+
+    def close(self):
+        """Store finished results and hand URLs still leased back to the queue"""
+        self.stopping.set()
+        self.heartbeat.join()
+
+        def release():
+            self._checkpoint()
+            self.db.execute("UPDATE items SET state = ?, worker = NULL, lease_until = NULL, attempts = attempts - 1 "
+                            "WHERE state = ? AND worker = ?", (PENDING, LEASED, self.worker))
+            if self.get_meta("loader") == self.worker:
+                self._set_meta("loader", None)
+
+        self._transaction(release)
+        self.db.close()
+
+
+class Loader:
+    """Read the input into a queue in a background thread, so workers start on the first URLs at once"""
+
+    def __init__(self, queue, urls, dedup="exact"):
+        self.queue = queue
+        self.urls = urls
+        self.dedup = dedup
+        self.added = 0
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            self.added = self.queue.load(self.urls, self.dedup)
+        except Exception as e:
+            self.error = e
+
+    @property
+    def running(self):
+        return self.thread.is_alive()
+
+
+def drain(queue, engine, loader=None, batch_size=100):
+    """Inspect URLs leased from the queue with the engine until the queue is finished
+
+    The engine must not deduplicate itself (the queue does). Waits while
+    other workers hold leases, in case they die and their URLs come back,
+    and while the input is being loaded, by ``loader`` or another
+    process. Returns the number of URLs this call inspected; it returns
+    early if ``loader`` failed.
+    """
+    # Each stream ends when the queue has nothing to lease: the engine reads its input in batches, so a stream
+    # waiting for more URLs could hold back leased ones another worker is waiting for
+    poll = min(1.0, queue.lease_seconds / 4)
+    # Items waiting for the URL inspected for them, by page (key), and the pages of the URLs in flight
+    waiting = {}
+    pages = {}
+    inspected = 0
+
+    def leased_urls():
+        while True:
+            items = queue.lease(batch_size)
+            for item in items:
+                id_, url, key = item
+                page = key if key is not None else id_
+                if page in waiting:
+                    # An alias of a page in flight
+                    waiting[page].append(item)
+                    continue
+                waiting[page] = [item]
+                pages.setdefault(url, []).append(page)
+                yield url
+            if not items:
+                return
+
+    while True:
+        for record in engine.inspect_many(leased_urls()):
+            in_flight = pages.get(record.url)
+            if not in_flight:
+                continue
+            page = in_flight.pop(0)
+            if not in_flight:
+                del pages[record.url]
+            first, *aliases = waiting.pop(page)
+            queue.complete(first, record)
+            for item in aliases:
+                queue.complete(item, record if item[1] == record.url else record.replace(url=item[1]), shared=True)
+            inspected += 1
+        queue.checkpoint()
+        if queue.finished() or (loader is not None and loader.error is not None):
+            return inspected
+        time.sleep(poll)
+
+
+def run_worker(path, engine_options, lease_seconds=60.0, checkpoint_interval=5.0):
+    """Work on a queue in a process of its own (see start_workers)"""
+    from engine import InspectionEngine
+
+    queue = WorkQueue(path, lease_seconds, checkpoint_interval)
+    engine = InspectionEngine(**engine_options)
+    try:
+        drain(queue, engine)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.close()
+        queue.close()
+
+
+def start_workers(count, path, engine_options, lease_seconds=60.0, checkpoint_interval=5.0):
+    """Start ``count`` worker processes on a queue and return them"""
+    import multiprocessing
+
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_worker, args=(path, engine_options, lease_seconds, checkpoint_interval),
+                        daemon=True)
+        for _ in range(count)
+    ]
+    for process in processes:
+        process.start()
+    return processes